@@ -8,15 +8,23 @@ from typing import Dict, List, Tuple
 import geopandas as gpd
 from shapely.geometry import Point
 import random
+import argparse
+import hashlib
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from utils.markdown_writer import write_markdown_table
+from utils.markdown_shards import write_markdown_shards
+from utils.output_manager import OutputManager, atomic_write, dataframe_hash
+from utils.history_store import DEFAULT_HISTORY_DB, HistoryStore
+from utils.parquet_archive import DEFAULT_ARCHIVE_DIR, write_run
+from utils.event_log import DEFAULT_EVENT_LOG, EventLog
+from utils.pipeline_metrics import DEFAULT_METRICS_DIR, dataset_of, metrics
+from utils.station_cards import station_card_documents
+from utils.stage_profiler import DEFAULT_PROFILE_DIR, StageProfiler
+from utils.log_config import (DEFAULT_BACKUP_COUNT, DEFAULT_LOG_FILE, DEFAULT_MAX_BYTES, RATE_LIMITED,
+                              configure_logging, parse_module_level)
 
-# Configure logging
-logging.basicConfig(
-    filename='data_processing.log',
-    level=logging.DEBUG,
-    format='%(asctime)s %(levelname)s:%(message)s'
-)
+logger = logging.getLogger('pipeline')
 
 def make_api_request(url: str, max_retries: int = 5, initial_delay: int = 5) -> Dict:
     """
@@ -44,45 +52,106 @@ def make_api_request(url: str, max_retries: int = 5, initial_delay: int = 5) ->
 
     for attempt in range(1, max_retries + 1):
         try:
-            response = session.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            logging.info(f"Successful API request to {url}")
-            return response.json()
+            metrics.count('requests')
+            with metrics.stage('fetch'):
+                response = session.get(url, headers=headers, timeout=10)
+                response.raise_for_status()
+                content = response.content
+            retries = getattr(response.raw, 'retries', None)
+            metrics.count('retries', len(retries.history) if retries is not None else 0)
+            metrics.count('payload_bytes', len(content))
+            logger.info("Successful API request to %s", url)
+            with metrics.stage('decode'):
+                return response.json()
         except requests.RequestException as e:
-            logging.error(f"Attempt {attempt}: Error making API request to {url}: {e}")
+            logger.error("Attempt %s: Error making API request to %s: %s", attempt, url, e)
             if attempt < max_retries:
+                metrics.count('retries')
                 sleep_time = initial_delay * (2 ** (attempt - 1)) + random.uniform(0, 1)
-                logging.info(f"Retrying in {sleep_time:.2f} seconds...")
+                logger.info("Retrying in %.2f seconds...", sleep_time)
                 time.sleep(sleep_time)
             else:
-                logging.critical(f"Failed to get data from {url} after {max_retries} attempts")
+                logger.critical("Failed to get data from %s after %s attempts", url, max_retries)
                 raise Exception(f"Failed to get data from {url} after {max_retries} attempts")
 
-def save_to_excel_and_markdown(data: pd.DataFrame, base_filename: str) -> None:
+def save_to_excel_and_markdown(
+    data: pd.DataFrame,
+    base_filename: str,
+    output: OutputManager = None,
+    drop_empty_columns: bool = False
+) -> None:
     """
     Saves DataFrame to Excel and Markdown files.
 
+    The Markdown table is streamed without alignment padding to keep the
+    files small for vector-store ingestion. The Excel file keeps every column.
+    Files are written atomically; with an output manager the writes run in the
+    background and are skipped when the content is unchanged since the last run.
+
     :param data: DataFrame to save
     :param base_filename: Base filename without extension
+    :param output: Output manager to schedule the writes on; None writes synchronously
+    :param drop_empty_columns: Omit all-NaN columns from the Markdown table
     """
     try:
-        os.makedirs('output', exist_ok=True)
-        excel_path = f'./output/{base_filename}.xlsx'
-        markdown_path = f'./output/{base_filename}.md'
-        
-        # Save to Excel
-        data.to_excel(excel_path, index=False)
-        logging.info(f"Data saved to {excel_path}")
-        
-        # Save to Markdown
-        with open(markdown_path, 'w', encoding='utf-8') as f:
-            f.write(f"# {base_filename.replace('_', ' ').title()}\n\n")
-            f.write(f"Generated on: {datetime.datetime.now()}\n\n")
-            f.write(f"Total records: {len(data)}\n\n")
-            f.write(data.to_markdown(index=False))
-        logging.info(f"Data saved to {markdown_path}")
+        # Snapshot the frame: callers may keep modifying it while writes are pending
+        with metrics.stage('snapshot', dataset_of(base_filename)):
+            snapshot = data.copy()
+            content_hash = dataframe_hash(snapshot) if output is not None else None
+        generated_at = datetime.datetime.now()
+
+        def write_excel(path: str) -> None:
+            snapshot.to_excel(path, index=False)
+
+        def write_markdown(path: str) -> None:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"# {base_filename.replace('_', ' ').title()}\n\n")
+                f.write(f"Generated on: {generated_at}\n\n")
+                f.write(f"Total records: {len(snapshot)}\n\n")
+                write_markdown_table(snapshot, f, drop_empty_columns=drop_empty_columns)
+
+        if output is None:
+            for path, write_fn in [(f'./output/{base_filename}.xlsx', write_excel),
+                                   (f'./output/{base_filename}.md', write_markdown)]:
+                with metrics.stage('write', dataset_of(base_filename)):
+                    atomic_write(path, write_fn)
+                logger.info("Data saved to %s", path)
+        else:
+            output.submit(f'{base_filename}.xlsx', write_excel, content_hash)
+            # Toggling the column pruning changes the Markdown file but not the data
+            markdown_hash = f'{content_hash}:drop_empty_columns' if drop_empty_columns else content_hash
+            output.submit(f'{base_filename}.md', write_markdown, markdown_hash)
     except Exception as e:
-        logging.error(f"Error saving data for {base_filename}: {e}")
+        logger.error("Error saving data for %s: %s", base_filename, e)
+
+def save_station_cards(data: pd.DataFrame, dataset_name: str, output: OutputManager) -> None:
+    """
+    Saves a combined dataset as retrieval-sized documents of compact station cards.
+
+    Card documents left over from a previous run with more parts are removed.
+
+    :param data: Combined DataFrame, usually with location information added
+    :param dataset_name: Combined dataset name, e.g. 'combined_rainfall'
+    :param output: Output manager to schedule the writes on
+    """
+    try:
+        documents = station_card_documents(data, dataset_name)
+        for filename, text in documents:
+            def write_card_document(path: str, text: str = text) -> None:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+            output.submit(filename, write_card_document, hashlib.sha256(text.encode('utf-8')).hexdigest())
+
+        # Remove through the output manager so the manifest forgets them too
+        cards_dir = os.path.join(output.output_dir, 'cards')
+        current = {filename for filename, _ in documents}
+        if os.path.isdir(cards_dir):
+            for entry in os.listdir(cards_dir):
+                filename = f'cards/{entry}'
+                if entry.startswith(f'{dataset_name}_cards_') and filename not in current:
+                    output.remove(filename)
+    except Exception as e:
+        logger.error("Error saving station cards for %s: %s", dataset_name, e)
 
 def process_water_level() -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
@@ -98,46 +167,50 @@ def process_water_level() -> Tuple[pd.DataFrame, pd.DataFrame]:
     data_list = []
     today = datetime.datetime.now()
     
-    for item in data:
-        station = item.get('station', {})
-        if all(k in station for k in ["tele_station_lat", "tele_station_long"]) and "th" in station.get("tele_station_name", {}):
-            station_list.append({
+    with metrics.stage('parse'):
+        for item in data:
+            station = item.get('station', {})
+            if all(k in station for k in ["tele_station_lat", "tele_station_long"]) and "th" in station.get("tele_station_name", {}):
+                station_list.append({
+                    "id": station.get('id'),
+                    "name": station['tele_station_name'].get('th'),
+                    "lat": station.get('tele_station_lat'),
+                    "lng": station.get('tele_station_long'),
+                    "station_oldcode": station.get('tele_station_oldcode'),
+                    "left_bank": station.get('left_bank'),
+                    "right_bank": station.get('right_bank'),
+                    "min_bank": station.get('min_bank'),
+                    "ground_level": station.get('ground_level'),
+                    "offset_": station.get('offset'),
+                    "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
+                    "agency_name": item.get('agency', {}).get('agency_name', {}).get('th'),
+                    "is_key_station": station.get('is_key_station'),
+                    "warning_level_m": station.get('warning_level_m'),
+                    "critical_level_m": station.get('critical_level_m'),
+                    "critical_level_msl": station.get('critical_level_msl'),
+                    "collected_at": today
+                })
+        
+            data_list.append({
                 "id": station.get('id'),
-                "name": station['tele_station_name'].get('th'),
-                "lat": station.get('tele_station_lat'),
-                "lng": station.get('tele_station_long'),
-                "station_oldcode": station.get('tele_station_oldcode'),
-                "left_bank": station.get('left_bank'),
-                "right_bank": station.get('right_bank'),
-                "min_bank": station.get('min_bank'),
-                "ground_level": station.get('ground_level'),
-                "offset_": station.get('offset'),
-                "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
-                "agency_name": item.get('agency', {}).get('agency_name', {}).get('th'),
-                "is_key_station": station.get('is_key_station'),
-                "warning_level_m": station.get('warning_level_m'),
-                "critical_level_m": station.get('critical_level_m'),
-                "critical_level_msl": station.get('critical_level_msl'),
+                "datetime": item.get('waterlevel_datetime'),
+                "waterlevel_m": item.get('waterlevel_m'),
+                "waterlevel_msl": item.get('waterlevel_msl'),
+                "waterlevel_msl_previous": item.get('waterlevel_msl_previous'),
+                "flow_rate": item.get('flow_rate'),
+                "discharge": item.get('discharge'),
+                "storage_percent": item.get('storage_percent'),
+                "situation_level": item.get('situation_level'),
                 "collected_at": today
             })
-        
-        data_list.append({
-            "id": station.get('id'),
-            "datetime": item.get('waterlevel_datetime'),
-            "waterlevel_m": item.get('waterlevel_m'),
-            "waterlevel_msl": item.get('waterlevel_msl'),
-            "waterlevel_msl_previous": item.get('waterlevel_msl_previous'),
-            "flow_rate": item.get('flow_rate'),
-            "discharge": item.get('discharge'),
-            "storage_percent": item.get('storage_percent'),
-            "situation_level": item.get('situation_level'),
-            "collected_at": today
-        })
     
-    water_level_station = pd.DataFrame(station_list)
-    water_level_data = pd.DataFrame(data_list)
+    with metrics.stage('dtype'):
+        water_level_station = pd.DataFrame(station_list)
+        water_level_data = pd.DataFrame(data_list)
+    metrics.count('station_rows', len(water_level_station))
+    metrics.count('data_rows', len(water_level_data))
     
-    logging.info(f"Processed water level data: {water_level_station.shape[0]} stations, {water_level_data.shape[0]} data records.")
+    logger.info("Processed water level data: %s stations, %s data records.", water_level_station.shape[0], water_level_data.shape[0])
     
     return water_level_station, water_level_data
 
@@ -155,44 +228,48 @@ def process_water_gate() -> Tuple[pd.DataFrame, pd.DataFrame]:
     data_list = []
     today = datetime.datetime.now()
     
-    for item in data:
-        station = item.get('station', {})
-        if all(k in station for k in ["tele_station_lat", "tele_station_long"]):
-            station_list.append({
-                "id": station.get('id'),
-                "name": station['tele_station_name'].get('th'),
-                "lat": station.get('tele_station_lat'),
-                "lng": station.get('tele_station_long'),
-                "station_oldcode": station.get('tele_station_oldcode'),
-                "left_bank": station.get('left_bank'),
-                "right_bank": station.get('right_bank'),
-                "is_key_station": station.get('is_key_station'),
-                "warning_level_m": station.get('warning_level_m'),
-                "critical_level_m": station.get('critical_level_m'),
-                "critical_level_msl": station.get('critical_level_msl'),
-                "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
-                "agency_name": item.get('agency', {}).get('agency_name', {}).get('th'),
-                "collected_at": today
-            })
+    with metrics.stage('parse'):
+        for item in data:
+            station = item.get('station', {})
+            if all(k in station for k in ["tele_station_lat", "tele_station_long"]):
+                station_list.append({
+                    "id": station.get('id'),
+                    "name": station['tele_station_name'].get('th'),
+                    "lat": station.get('tele_station_lat'),
+                    "lng": station.get('tele_station_long'),
+                    "station_oldcode": station.get('tele_station_oldcode'),
+                    "left_bank": station.get('left_bank'),
+                    "right_bank": station.get('right_bank'),
+                    "is_key_station": station.get('is_key_station'),
+                    "warning_level_m": station.get('warning_level_m'),
+                    "critical_level_m": station.get('critical_level_m'),
+                    "critical_level_msl": station.get('critical_level_msl'),
+                    "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
+                    "agency_name": item.get('agency', {}).get('agency_name', {}).get('th'),
+                    "collected_at": today
+                })
             
-            data_list.append({
-                "id": station.get('id'),
-                "watergate_in": item.get('watergate_in'),
-                "watergate_out": item.get('watergate_out'),
-                "watergate_datetime_in": item.get('watergate_datetime_in'),
-                "watergate_datetime_out": item.get('watergate_datetime_out'),
-                "pump_on": item.get('pump_on'),
-                "pump": item.get('pump'),
-                "floodgate_open": item.get('floodgate_open'),
-                "floodgate": item.get('floodgate'),
-                "floodgate_height": item.get('floodgate_height'),
-                "collected_at": today
-            })
+                data_list.append({
+                    "id": station.get('id'),
+                    "watergate_in": item.get('watergate_in'),
+                    "watergate_out": item.get('watergate_out'),
+                    "watergate_datetime_in": item.get('watergate_datetime_in'),
+                    "watergate_datetime_out": item.get('watergate_datetime_out'),
+                    "pump_on": item.get('pump_on'),
+                    "pump": item.get('pump'),
+                    "floodgate_open": item.get('floodgate_open'),
+                    "floodgate": item.get('floodgate'),
+                    "floodgate_height": item.get('floodgate_height'),
+                    "collected_at": today
+                })
     
-    water_gate_station = pd.DataFrame(station_list)
-    water_gate_data = pd.DataFrame(data_list)
+    with metrics.stage('dtype'):
+        water_gate_station = pd.DataFrame(station_list)
+        water_gate_data = pd.DataFrame(data_list)
+    metrics.count('station_rows', len(water_gate_station))
+    metrics.count('data_rows', len(water_gate_data))
     
-    logging.info(f"Processed water gate data: {water_gate_station.shape[0]} stations, {water_gate_data.shape[0]} data records.")
+    logger.info("Processed water gate data: %s stations, %s data records.", water_gate_station.shape[0], water_gate_data.shape[0])
     
     return water_gate_station, water_gate_data
 
@@ -220,85 +297,89 @@ def process_rainfall() -> Tuple[pd.DataFrame, pd.DataFrame]:
         try:
             data = make_api_request(url).get('data', [])
         except Exception as e:
-            logging.error(f"Skipping {rain_type} due to API error: {e}")
+            logger.error("Skipping %s due to API error: %s", rain_type, e)
             continue
         
-        for item in data:
-            station_id = item.get('station', {}).get('id') or item.get('tele_station_id')
+        with metrics.stage('parse'):
+            for item in data:
+                station_id = item.get('station', {}).get('id') or item.get('tele_station_id')
             
-            if not station_id:
-                logging.warning(f"Skipping item with missing station ID in {rain_type}")
-                continue
+                if not station_id:
+                    logger.warning("Skipping item with missing station ID in %s", rain_type, extra=RATE_LIMITED)
+                    continue
             
-            if station_id not in station_dict:
-                station_dict[station_id] = {
-                    "id": station_id,
-                    "name": item.get('station', {}).get('tele_station_name', {}).get('th') or item.get('tele_station_name', {}).get('th'),
-                    "lat": item.get('station', {}).get('tele_station_lat') or item.get('tele_station_lat'),
-                    "lng": item.get('station', {}).get('tele_station_long') or item.get('tele_station_long'),
-                    "station_oldcode": item.get('station', {}).get('tele_station_oldcode'),
-                    "basin_code": item.get('basin', {}).get('basin_code') or item.get('station', {}).get('basin_id'),
-                    "sub_basin_code": item.get('station', {}).get('sub_basin_id') or item.get('sub_basin_id'),
-                    "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
-                    "agency_name": item.get('agency', {}).get('agency_name', {}).get('th') or item.get('agency_name', {}).get('th'),
-                    "collected_at": today
-                }
+                if station_id not in station_dict:
+                    station_dict[station_id] = {
+                        "id": station_id,
+                        "name": item.get('station', {}).get('tele_station_name', {}).get('th') or item.get('tele_station_name', {}).get('th'),
+                        "lat": item.get('station', {}).get('tele_station_lat') or item.get('tele_station_lat'),
+                        "lng": item.get('station', {}).get('tele_station_long') or item.get('tele_station_long'),
+                        "station_oldcode": item.get('station', {}).get('tele_station_oldcode'),
+                        "basin_code": item.get('basin', {}).get('basin_code') or item.get('station', {}).get('basin_id'),
+                        "sub_basin_code": item.get('station', {}).get('sub_basin_id') or item.get('sub_basin_id'),
+                        "basin_name": item.get('basin', {}).get('basin_name', {}).get('th'),
+                        "agency_name": item.get('agency', {}).get('agency_name', {}).get('th') or item.get('agency_name', {}).get('th'),
+                        "collected_at": today
+                    }
                 
-                # Format basin_code to be two digits
-                if station_dict[station_id].get("basin_code"):
-                    basin_code = str(station_dict[station_id]["basin_code"])
-                    station_dict[station_id]["basin_code"] = basin_code if len(basin_code) == 2 else f"0{basin_code}"
+                    # Format basin_code to be two digits
+                    if station_dict[station_id].get("basin_code"):
+                        basin_code = str(station_dict[station_id]["basin_code"])
+                        station_dict[station_id]["basin_code"] = basin_code if len(basin_code) == 2 else f"0{basin_code}"
             
-            if station_id not in data_dict:
-                data_dict[station_id] = {
-                    "id": station_id,
-                    "rain_24h_value": None,
-                    "rain_24h_datetime": None,
-                    "rain_daily_value": None,
-                    "rain_daily_datetime": None,
-                    "rain_yesterday_value": None,
-                    "rain_yesterday_datetime": None,
-                    "rain_3days_value": None,
-                    "rain_3days_startdate": None,
-                    "rain_3days_enddate": None,
-                    "rain_7days_value": None,
-                    "rain_7days_startdate": None,
-                    "rain_7days_enddate": None,
-                    "rain_monthly_value": None,
-                    "rain_monthly_datetime": None,
-                    "rain_yearly_value": None,
-                    "rain_yearly_datetime": None,
-                    "collected_at": today
-                }
+                if station_id not in data_dict:
+                    data_dict[station_id] = {
+                        "id": station_id,
+                        "rain_24h_value": None,
+                        "rain_24h_datetime": None,
+                        "rain_daily_value": None,
+                        "rain_daily_datetime": None,
+                        "rain_yesterday_value": None,
+                        "rain_yesterday_datetime": None,
+                        "rain_3days_value": None,
+                        "rain_3days_startdate": None,
+                        "rain_3days_enddate": None,
+                        "rain_7days_value": None,
+                        "rain_7days_startdate": None,
+                        "rain_7days_enddate": None,
+                        "rain_monthly_value": None,
+                        "rain_monthly_datetime": None,
+                        "rain_yearly_value": None,
+                        "rain_yearly_datetime": None,
+                        "collected_at": today
+                    }
             
-            if rain_type == 'rainfall_24h':
-                data_dict[station_id]["rain_24h_value"] = item.get('rain_24h')
-                data_dict[station_id]["rain_24h_datetime"] = item.get('rainfall_datetime')
-            elif rain_type == 'rainfall_daily':
-                data_dict[station_id]["rain_daily_value"] = item.get('rainfall_value')
-                data_dict[station_id]["rain_daily_datetime"] = item.get('rainfall_datetime')
-            elif rain_type == 'rainfall_yesterday':
-                data_dict[station_id]["rain_yesterday_value"] = item.get('rainfall_value')
-                data_dict[station_id]["rain_yesterday_datetime"] = item.get('rainfall_datetime')
-            elif rain_type == 'rainfall_3days':
-                data_dict[station_id]["rain_3days_value"] = item.get('rain_3d')
-                data_dict[station_id]["rain_3days_startdate"] = item.get('rainfall_start_date')
-                data_dict[station_id]["rain_3days_enddate"] = item.get('rainfall_end_date')
-            elif rain_type == 'rainfall_7days':
-                data_dict[station_id]["rain_7days_value"] = item.get('rain_7d')
-                data_dict[station_id]["rain_7days_startdate"] = item.get('rainfall_start_date')
-                data_dict[station_id]["rain_7days_enddate"] = item.get('rainfall_end_date')
-            elif rain_type == 'rainfall_monthly':
-                data_dict[station_id]["rain_monthly_value"] = item.get('rainfall_value')
-                data_dict[station_id]["rain_monthly_datetime"] = item.get('rainfall_datetime')
-            elif rain_type == 'rainfall_yearly':
-                data_dict[station_id]["rain_yearly_value"] = item.get('rainfall_value')
-                data_dict[station_id]["rain_yearly_datetime"] = item.get('rainfall_datetime')
+                if rain_type == 'rainfall_24h':
+                    data_dict[station_id]["rain_24h_value"] = item.get('rain_24h')
+                    data_dict[station_id]["rain_24h_datetime"] = item.get('rainfall_datetime')
+                elif rain_type == 'rainfall_daily':
+                    data_dict[station_id]["rain_daily_value"] = item.get('rainfall_value')
+                    data_dict[station_id]["rain_daily_datetime"] = item.get('rainfall_datetime')
+                elif rain_type == 'rainfall_yesterday':
+                    data_dict[station_id]["rain_yesterday_value"] = item.get('rainfall_value')
+                    data_dict[station_id]["rain_yesterday_datetime"] = item.get('rainfall_datetime')
+                elif rain_type == 'rainfall_3days':
+                    data_dict[station_id]["rain_3days_value"] = item.get('rain_3d')
+                    data_dict[station_id]["rain_3days_startdate"] = item.get('rainfall_start_date')
+                    data_dict[station_id]["rain_3days_enddate"] = item.get('rainfall_end_date')
+                elif rain_type == 'rainfall_7days':
+                    data_dict[station_id]["rain_7days_value"] = item.get('rain_7d')
+                    data_dict[station_id]["rain_7days_startdate"] = item.get('rainfall_start_date')
+                    data_dict[station_id]["rain_7days_enddate"] = item.get('rainfall_end_date')
+                elif rain_type == 'rainfall_monthly':
+                    data_dict[station_id]["rain_monthly_value"] = item.get('rainfall_value')
+                    data_dict[station_id]["rain_monthly_datetime"] = item.get('rainfall_datetime')
+                elif rain_type == 'rainfall_yearly':
+                    data_dict[station_id]["rain_yearly_value"] = item.get('rainfall_value')
+                    data_dict[station_id]["rain_yearly_datetime"] = item.get('rainfall_datetime')
     
-    rainfall_station = pd.DataFrame(list(station_dict.values()))
-    rainfall_data = pd.DataFrame(list(data_dict.values()))
+    with metrics.stage('dtype'):
+        rainfall_station = pd.DataFrame(list(station_dict.values()))
+        rainfall_data = pd.DataFrame(list(data_dict.values()))
+    metrics.count('station_rows', len(rainfall_station))
+    metrics.count('data_rows', len(rainfall_data))
     
-    logging.info(f"Processed rainfall data: {rainfall_station.shape[0]} stations, {rainfall_data.shape[0]} data records.")
+    logger.info("Processed rainfall data: %s stations, %s data records.", rainfall_station.shape[0], rainfall_data.shape[0])
     
     return rainfall_station, rainfall_data
 
@@ -316,66 +397,70 @@ def process_dam() -> Tuple[pd.DataFrame, pd.DataFrame]:
     data_list = []
     today = datetime.datetime.now()
     
-    for dam_type in ['dam_hourly', 'dam_daily', 'dam_medium']:
-        for item in dam_list.get(dam_type, []):
-            dam = item.get('dam', {})
-            dam_name = dam.get('dam_name', {}).get('th')
-            if not dam_name:
-                logging.warning(f"Dam entry missing 'dam_name' in {dam_type}")
-                continue
+    with metrics.stage('parse'):
+        for dam_type in ['dam_hourly', 'dam_daily', 'dam_medium']:
+            for item in dam_list.get(dam_type, []):
+                dam = item.get('dam', {})
+                dam_name = dam.get('dam_name', {}).get('th')
+                if not dam_name:
+                    logger.warning("Dam entry missing 'dam_name' in %s", dam_type, extra=RATE_LIMITED)
+                    continue
+            
+                if dam_name not in station_dict:
+                    station_dict[dam_name] = {
+                        "name": dam_name,
+                        "lat": dam.get('dam_lat'),
+                        "lng": dam.get('dam_long'),
+                        "oldcode": dam.get('dam_oldcode'),
+                        "min_storage": dam.get('min_storage'),
+                        "max_storage": dam.get('max_storage'),
+                        "normal_storage": dam.get('normal_storage'),
+                        "agency": item.get('agency', {}).get('agency_name', {}).get('th'),
+                        "basin": item.get('basin', {}).get('basin_name', {}).get('th'),
+                        "cctv": item.get('cctv', {}).get('url'),
+                        "station_type": 'อ่างขนาดใหญ่' if dam_type != 'dam_medium' else 'อ่างขนาดกลาง',
+                        "collected_at": today
+                    }
             
-            if dam_name not in station_dict:
-                station_dict[dam_name] = {
+                data_dict = {
                     "name": dam_name,
-                    "lat": dam.get('dam_lat'),
-                    "lng": dam.get('dam_long'),
-                    "oldcode": dam.get('dam_oldcode'),
-                    "min_storage": dam.get('min_storage'),
-                    "max_storage": dam.get('max_storage'),
-                    "normal_storage": dam.get('normal_storage'),
-                    "agency": item.get('agency', {}).get('agency_name', {}).get('th'),
-                    "basin": item.get('basin', {}).get('basin_name', {}).get('th'),
-                    "cctv": item.get('cctv', {}).get('url'),
-                    "station_type": 'อ่างขนาดใหญ่' if dam_type != 'dam_medium' else 'อ่างขนาดกลาง',
+                    "datetime": item.get('dam_date'),
+                    "storage": item.get('dam_storage'),
+                    "storage_percent": item.get('dam_storage_percent'),
+                    "inflow": item.get('dam_inflow'),
+                    "uses_water": item.get('dam_uses_water'),
+                    "type": dam_type,
                     "collected_at": today
                 }
             
-            data_dict = {
-                "name": dam_name,
-                "datetime": item.get('dam_date'),
-                "storage": item.get('dam_storage'),
-                "storage_percent": item.get('dam_storage_percent'),
-                "inflow": item.get('dam_inflow'),
-                "uses_water": item.get('dam_uses_water'),
-                "type": dam_type,
-                "collected_at": today
-            }
-            
-            if dam_type in ['dam_hourly', 'dam_daily']:
-                data_dict.update({
-                    "inflow_acc_percent": item.get('dam_inflow_acc_percent'),
-                    "uses_water_percent": item.get('dam_uses_water_percent'),
-                    "level": item.get('dam_level'),
-                    "released": item.get('dam_released'),
-                    "spilled": item.get('dam_spilled'),
-                    "losses": item.get('dam_losses'),
-                    "evap": item.get('dam_evap')
-                })
-                
-                if dam_type == 'dam_daily':
+                if dam_type in ['dam_hourly', 'dam_daily']:
                     data_dict.update({
-                        "inflow_avg": item.get('dam_inflow_avg'),
-                        "inflow_acc": item.get('dam_inflow_acc'),
-                        "uses_water_percent_calc": item.get('dam_uses_water_percent_calc'),
-                        "released_acc": item.get('dam_released_acc')
+                        "inflow_acc_percent": item.get('dam_inflow_acc_percent'),
+                        "uses_water_percent": item.get('dam_uses_water_percent'),
+                        "level": item.get('dam_level'),
+                        "released": item.get('dam_released'),
+                        "spilled": item.get('dam_spilled'),
+                        "losses": item.get('dam_losses'),
+                        "evap": item.get('dam_evap')
                     })
+                
+                    if dam_type == 'dam_daily':
+                        data_dict.update({
+                            "inflow_avg": item.get('dam_inflow_avg'),
+                            "inflow_acc": item.get('dam_inflow_acc'),
+                            "uses_water_percent_calc": item.get('dam_uses_water_percent_calc'),
+                            "released_acc": item.get('dam_released_acc')
+                        })
             
-            data_list.append(data_dict)
+                data_list.append(data_dict)
     
-    dam_station = pd.DataFrame(list(station_dict.values()))
-    dam_data = pd.DataFrame(data_list)
+    with metrics.stage('dtype'):
+        dam_station = pd.DataFrame(list(station_dict.values()))
+        dam_data = pd.DataFrame(data_list)
+    metrics.count('station_rows', len(dam_station))
+    metrics.count('data_rows', len(dam_data))
     
-    logging.info(f"Processed dam data: {dam_station.shape[0]} stations, {dam_data.shape[0]} data records.")
+    logger.info("Processed dam data: %s stations, %s data records.", dam_station.shape[0], dam_data.shape[0])
     
     return dam_station, dam_data
 
@@ -389,27 +474,53 @@ def validate_dataframe(df: pd.DataFrame, required_columns: List[str], dataset_na
     """
     missing = [col for col in required_columns if col not in df.columns]
     if missing:
-        logging.warning(f"{dataset_name} is missing columns: {missing}")
+        logger.warning("%s is missing columns: %s", dataset_name, missing)
     else:
-        logging.info(f"All required columns present in {dataset_name}")
+        logger.info("All required columns present in %s", dataset_name)
+
+def diagnostic_path(dataset_name: str, kind: str) -> str:
+    """
+    Builds the path of a per-dataset diagnostic file.
+
+    :param dataset_name: Name of the dataset
+    :param kind: Diagnostic kind, e.g. 'invalid_coordinates'
+    :return: Path of the diagnostic Excel file
+    """
+    return f"./output/{dataset_name.strip().replace(' ', '_').lower()}_{kind}.xlsx"
+
+def save_diagnostic(records: pd.DataFrame, dataset_name: str, kind: str) -> None:
+    """
+    Saves diagnostic records for a dataset, or removes a stale file if there are none.
+
+    :param records: Records to save for further investigation
+    :param dataset_name: Name of the dataset
+    :param kind: Diagnostic kind, e.g. 'invalid_coordinates'
+    """
+    path = diagnostic_path(dataset_name, kind)
+    if records.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    atomic_write(path, lambda tmp_path: records.to_excel(tmp_path, index=False))
+    logger.info("%s %s records saved to %s", dataset_name, kind.replace('_', ' '), path)
 
 def validate_coordinates(df: pd.DataFrame, dataset_name: str):
     """
     Validates the latitude and longitude values in a DataFrame.
 
     :param df: DataFrame containing 'lat' and 'lng' columns
-    :param dataset_name: Name of the dataset for logging
+    :param dataset_name: Name of the dataset for logging and diagnostic file names
     """
     # Check for missing values
     missing = df[['lat', 'lng']].isnull().any().any()
     if missing:
-        logging.warning(f"{dataset_name} contains missing latitude or longitude values.")
+        logger.warning("%s contains missing latitude or longitude values.", dataset_name)
         # Optionally, save these records for further investigation
         invalid_coords = df[df[['lat', 'lng']].isnull().any(axis=1)]
-        invalid_coords.to_excel('./output/invalid_coordinates.xlsx', index=False)
-        logging.info("Invalid coordinate records saved to invalid_coordinates.xlsx")
     else:
-        logging.info(f"All records in {dataset_name} have valid latitude and longitude.")
+        logger.info("All records in %s have valid latitude and longitude.", dataset_name)
+        invalid_coords = df.iloc[0:0]
+    save_diagnostic(invalid_coords, dataset_name, 'invalid_coordinates')
     
     # Check for out-of-bound values
     invalid_coords = df[
@@ -417,29 +528,29 @@ def validate_coordinates(df: pd.DataFrame, dataset_name: str):
         (df['lng'] < -180) | (df['lng'] > 180)
     ]
     if not invalid_coords.empty:
-        logging.warning(f"{dataset_name} contains out-of-bound latitude or longitude values.")
-        # Optionally, save these records for further investigation
-        invalid_coords.to_excel('./output/out_of_bound_coordinates.xlsx', index=False)
-        logging.info("Out-of-bound coordinate records saved to out_of_bound_coordinates.xlsx")
+        logger.warning("%s contains out-of-bound latitude or longitude values.", dataset_name)
     else:
-        logging.info(f"All records in {dataset_name} have latitude between -90 and 90 and longitude between -180 and 180.")
+        logger.info("All records in %s have latitude between -90 and 90 and longitude between -180 and 180.", dataset_name)
+    # Optionally, save these records for further investigation
+    save_diagnostic(invalid_coords, dataset_name, 'out_of_bound_coordinates')
 
-def add_administrative_info(df: pd.DataFrame, gdf: gpd.GeoDataFrame) -> pd.DataFrame:
+def add_administrative_info(df: pd.DataFrame, gdf: gpd.GeoDataFrame, dataset_name: str = 'Input DataFrame') -> pd.DataFrame:
     """
     Add province, amphur, and tambon information to the dataframe based on lat and lng.
 
     :param df: Input dataframe with 'lat' and 'lng' columns
     :param gdf: GeoDataFrame containing administrative boundaries
+    :param dataset_name: Name of the dataset for logging and diagnostic file names
     :return: DataFrame with added administrative information
     """
     try:
-        logging.info(f"Adding administrative information to DataFrame with shape {df.shape}")
+        logger.info("Adding administrative information to DataFrame with shape %s", df.shape)
         
         # Validate required columns
-        validate_dataframe(df, ['lat', 'lng'], 'Input DataFrame')
+        validate_dataframe(df, ['lat', 'lng'], dataset_name)
         
         # Validate coordinates
-        validate_coordinates(df, 'Input DataFrame')
+        validate_coordinates(df, dataset_name)
         
         # Create a GeoDataFrame from the input DataFrame
         geometry = [Point(xy) for xy in zip(df['lng'], df['lat'])]
@@ -447,11 +558,11 @@ def add_administrative_info(df: pd.DataFrame, gdf: gpd.GeoDataFrame) -> pd.DataF
         
         # Ensure shapefile is in the same CRS
         if gdf.crs != "EPSG:4326":
-            logging.info(f"Shapefile CRS ({gdf.crs}) is not EPSG:4326. Converting CRS.")
+            logger.info("Shapefile CRS (%s) is not EPSG:4326. Converting CRS.", gdf.crs)
             gdf = gdf.to_crs("EPSG:4326")
-            logging.info("Shapefile CRS converted to EPSG:4326")
+            logger.info("Shapefile CRS converted to EPSG:4326")
         else:
-            logging.info("Shapefile CRS is already EPSG:4326")
+            logger.info("Shapefile CRS is already EPSG:4326")
         
         # Perform spatial join with 'intersects' predicate
         joined = gpd.sjoin(gdf_points, gdf, how="left", predicate="intersects")
@@ -460,7 +571,7 @@ def add_administrative_info(df: pd.DataFrame, gdf: gpd.GeoDataFrame) -> pd.DataF
         required_shapefile_columns = ['NAME_1', 'NAME_2', 'NAME_3']
         for col in required_shapefile_columns:
             if col not in joined.columns:
-                logging.error(f"Shapefile is missing required column: {col}")
+                logger.error("Shapefile is missing required column: %s", col)
                 raise ValueError(f"Shapefile is missing required column: {col}")
         
         # Add new columns to the original DataFrame
@@ -472,85 +583,165 @@ def add_administrative_info(df: pd.DataFrame, gdf: gpd.GeoDataFrame) -> pd.DataF
         matched = df.dropna(subset=['province', 'amphur', 'tambon'])
         unmatched = df[df['province'].isna() | df['amphur'].isna() | df['tambon'].isna()]
         
-        logging.info(f"Administrative information added successfully: {len(matched)} matched, {len(unmatched)} unmatched.")
+        metrics.count('unmatched_rows', len(unmatched), dataset_of(dataset_name))
+        logger.info("Administrative information added successfully: %s matched, %s unmatched.", len(matched), len(unmatched))
         
         if not unmatched.empty:
-            logging.warning(f"{len(unmatched)} records did not receive administrative information.")
-            # Optionally, save unmatched records for further investigation
-            unmatched.to_excel('./output/unmatched_records.xlsx', index=False)
-            logging.info("Unmatched records saved to unmatched_records.xlsx")
+            logger.warning("%s records did not receive administrative information.", len(unmatched))
+        # Optionally, save unmatched records for further investigation
+        save_diagnostic(unmatched, dataset_name, 'unmatched_records')
         
         # Verify that the columns have been added
         if not all(col in df.columns for col in ['province', 'amphur', 'tambon']):
-            logging.error("One or more location columns were not added to the DataFrame.")
+            logger.error("One or more location columns were not added to the DataFrame.")
             raise ValueError("One or more location columns were not added to the DataFrame.")
         
         return df
     except Exception as e:
-        logging.error(f"Error adding administrative information: {e}")
+        logger.error("Error adding administrative information: %s", e)
         return df
 
-def main():
+def append_history(history: HistoryStore, archive_dir: str, run_id: str, dataset: str, data: pd.DataFrame) -> None:
+    """
+    Appends a run's observations to the history store and the Parquet archive.
+
+    Errors are logged instead of raised so that history problems never stop a run.
+
+    :param history: History store, or None if history is disabled
+    :param archive_dir: Parquet archive root, or None if archiving is disabled
+    :param run_id: Identifier of this run, used in archive file names
+    :param dataset: Dataset name, e.g. 'water_level'
+    :param data: Data DataFrame returned by the matching process_* function
+    """
+    if history is not None:
+        try:
+            history.append(dataset, data)
+        except Exception as e:
+            logger.error("Error storing %s history: %s", dataset, e)
+    if archive_dir:
+        try:
+            write_run(data, dataset, archive_dir, run_id)
+        except Exception as e:
+            logger.error("Error archiving %s: %s", dataset, e)
+
+def publish_events(events: EventLog, run_id: str, dataset: str, station: pd.DataFrame, data: pd.DataFrame) -> None:
+    """
+    Publishes a run's station metadata and observation changes to the event log.
+
+    Errors are logged instead of raised so that event log problems never stop a run.
+
+    :param events: Event log, or None if events are disabled
+    :param run_id: Identifier of this run, stamped on the events
+    :param dataset: Dataset name, e.g. 'water_level'
+    :param station: Station DataFrame returned by the matching process_* function
+    :param data: Data DataFrame returned by the matching process_* function
+    """
+    if events is None:
+        return
+    try:
+        events.publish_stations(dataset, station, run_id)
+        events.publish_observations(dataset, data, run_id)
+    except Exception as e:
+        logger.error("Error publishing %s events: %s", dataset, e)
+
+def main(shard_levels: List[str] = None, history_db: str = DEFAULT_HISTORY_DB, archive_dir: str = DEFAULT_ARCHIVE_DIR,
+         event_log: str = DEFAULT_EVENT_LOG, metrics_dir: str = DEFAULT_METRICS_DIR, profile_dir: str = None,
+         drop_empty_columns: bool = False):
     """
     Main function to orchestrate data processing and enrichment.
+
+    :param shard_levels: Also write *_with_location tables as per-province
+        and/or per-basin Markdown shards, e.g. ['province', 'basin']
+    :param history_db: Path of the SQLite observation history; None disables it
+    :param archive_dir: Root of the partitioned Parquet archive; None disables it
+    :param event_log: Path of the NDJSON change event log; None disables it
+    :param metrics_dir: Directory of the run's JSON metrics summary and Prometheus textfile
+    :param profile_dir: Profile every stage and write the reports to <profile_dir>/<run id>;
+        None disables profiling
+    :param drop_empty_columns: Omit all-NaN columns from the Markdown tables
     """
+    run_id = datetime.datetime.now().strftime('%Y%m%dT%H%M%S')
+    metrics.reset(run_id)
+    profiler = StageProfiler(os.path.join(profile_dir, run_id)) if profile_dir else None
+    metrics.profiler = profiler
+    success = False
+    output = OutputManager(metrics=metrics)
+    history = HistoryStore(history_db) if history_db else None
+    events = EventLog(event_log) if event_log else None
     try:
         # Process Water Level
-        water_level_station, water_level_data = process_water_level()
-        save_to_excel_and_markdown(water_level_station, 'water_level_station')
-        save_to_excel_and_markdown(water_level_data, 'water_level_data')
+        with metrics.dataset('water_level'):
+            water_level_station, water_level_data = process_water_level()
+        append_history(history, archive_dir, run_id, 'water_level', water_level_data)
+        publish_events(events, run_id, 'water_level', water_level_station, water_level_data)
+        save_to_excel_and_markdown(water_level_station, 'water_level_station', output, drop_empty_columns)
+        save_to_excel_and_markdown(water_level_data, 'water_level_data', output, drop_empty_columns)
         time.sleep(random.uniform(5, 10))  # Add delay between dataset processing
 
         # Process Water Gate
-        water_gate_station, water_gate_data = process_water_gate()
-        save_to_excel_and_markdown(water_gate_station, 'water_gate_station')
-        save_to_excel_and_markdown(water_gate_data, 'water_gate_data')
+        with metrics.dataset('water_gate'):
+            water_gate_station, water_gate_data = process_water_gate()
+        append_history(history, archive_dir, run_id, 'water_gate', water_gate_data)
+        publish_events(events, run_id, 'water_gate', water_gate_station, water_gate_data)
+        save_to_excel_and_markdown(water_gate_station, 'water_gate_station', output, drop_empty_columns)
+        save_to_excel_and_markdown(water_gate_data, 'water_gate_data', output, drop_empty_columns)
         time.sleep(random.uniform(5, 10))  # Add delay between dataset processing
 
         # Process Rainfall
-        rainfall_station, rainfall_data = process_rainfall()
-        save_to_excel_and_markdown(rainfall_station, 'rainfall_station')
-        save_to_excel_and_markdown(rainfall_data, 'rainfall_data')
+        with metrics.dataset('rainfall'):
+            rainfall_station, rainfall_data = process_rainfall()
+        append_history(history, archive_dir, run_id, 'rainfall', rainfall_data)
+        publish_events(events, run_id, 'rainfall', rainfall_station, rainfall_data)
+        save_to_excel_and_markdown(rainfall_station, 'rainfall_station', output, drop_empty_columns)
+        save_to_excel_and_markdown(rainfall_data, 'rainfall_data', output, drop_empty_columns)
         time.sleep(random.uniform(5, 10))  # Add delay between dataset processing
 
         # Process Dam
-        dam_station, dam_data = process_dam()
-        save_to_excel_and_markdown(dam_station, 'dam_station')
-        save_to_excel_and_markdown(dam_data, 'dam_data')
+        with metrics.dataset('dam'):
+            dam_station, dam_data = process_dam()
+        append_history(history, archive_dir, run_id, 'dam', dam_data)
+        publish_events(events, run_id, 'dam', dam_station, dam_data)
+        save_to_excel_and_markdown(dam_station, 'dam_station', output, drop_empty_columns)
+        save_to_excel_and_markdown(dam_data, 'dam_data', output, drop_empty_columns)
 
         # Perform joins to create final consolidated outputs
-        combined_water_level = pd.merge(water_level_station, water_level_data, on='id', how='inner')
-        combined_water_gate = pd.merge(water_gate_station, water_gate_data, on='id', how='inner')
-        combined_rainfall = pd.merge(rainfall_station, rainfall_data, on='id', how='inner')
-        combined_dam = pd.merge(dam_station, dam_data, on='name', how='inner')  # Ensure 'name' is unique
+        with metrics.stage('merge', 'water_level'):
+            combined_water_level = pd.merge(water_level_station, water_level_data, on='id', how='inner')
+        with metrics.stage('merge', 'water_gate'):
+            combined_water_gate = pd.merge(water_gate_station, water_gate_data, on='id', how='inner')
+        with metrics.stage('merge', 'rainfall'):
+            combined_rainfall = pd.merge(rainfall_station, rainfall_data, on='id', how='inner')
+        with metrics.stage('merge', 'dam'):
+            combined_dam = pd.merge(dam_station, dam_data, on='name', how='inner')  # Ensure 'name' is unique
 
         # Save combined data without location information
-        save_to_excel_and_markdown(combined_water_level, 'combined_water_level')
-        save_to_excel_and_markdown(combined_water_gate, 'combined_water_gate')
-        save_to_excel_and_markdown(combined_rainfall, 'combined_rainfall')
-        save_to_excel_and_markdown(combined_dam, 'combined_dam')
+        save_to_excel_and_markdown(combined_water_level, 'combined_water_level', output, drop_empty_columns)
+        save_to_excel_and_markdown(combined_water_gate, 'combined_water_gate', output, drop_empty_columns)
+        save_to_excel_and_markdown(combined_rainfall, 'combined_rainfall', output, drop_empty_columns)
+        save_to_excel_and_markdown(combined_dam, 'combined_dam', output, drop_empty_columns)
 
         # Load the GADM Shapefile
         shapefile_path = "./shapefile/gadm41_THA_3.shp"  # Updated to .shp
         if not os.path.exists(shapefile_path):
-            logging.warning(f"GADM Shapefile not found at {shapefile_path}")
-            logging.warning("Administrative information will not be added to the datasets.")
+            logger.warning("GADM Shapefile not found at %s", shapefile_path)
+            logger.warning("Administrative information will not be added to the datasets.")
             gdf = None
         else:
             try:
-                gdf = gpd.read_file(shapefile_path)
-                logging.info("GADM Shapefile loaded successfully")
-                logging.info(f"GADM data contains {len(gdf)} rows")
-                logging.info(f"GADM data columns: {gdf.columns.tolist()}")
+                with metrics.stage('enrich', 'other'):
+                    gdf = gpd.read_file(shapefile_path)
+                logger.info("GADM Shapefile loaded successfully")
+                logger.info("GADM data contains %s rows", len(gdf))
+                logger.debug("GADM data columns: %s", gdf.columns.tolist())
                 
                 # Verify required columns
                 required_columns = ['NAME_1', 'NAME_2', 'NAME_3']
                 for col in required_columns:
                     if col not in gdf.columns:
-                        logging.error(f"Shapefile is missing required column: {col}")
+                        logger.error("Shapefile is missing required column: %s", col)
                         raise ValueError(f"Shapefile is missing required column: {col}")
             except Exception as e:
-                logging.error(f"Error loading GADM Shapefile: {e}")
+                logger.error("Error loading GADM Shapefile: %s", e)
                 gdf = None
 
         # Process datasets with or without administrative information
@@ -562,29 +753,169 @@ def main():
         ]
 
         for name, df in datasets:
-            logging.info(f"\nProcessing {name}...")
-            logging.info(f"{name} shape: {df.shape}")
-            logging.info(f"{name} columns: {df.columns.tolist()}")
+            metrics.count('combined_rows', len(df), dataset_of(name))
+            logger.info("Processing %s...", name)
+            logger.info("%s shape: %s", name, df.shape)
+            logger.debug("%s columns: %s", name, df.columns.tolist())
             
             # Check for 'lat' and 'lng' columns
             if 'lat' not in df.columns or 'lng' not in df.columns:
-                logging.warning(f"{name} is missing 'lat' or 'lng' columns. Skipping administrative information addition.")
-                save_to_excel_and_markdown(df, f'{name}_without_location')
+                logger.warning("%s is missing 'lat' or 'lng' columns. Skipping administrative information addition.", name)
+                save_to_excel_and_markdown(df, f'{name}_without_location', output, drop_empty_columns)
+                save_station_cards(df, name, output)
                 continue
             
             if gdf is not None:
                 try:
-                    df_with_location = add_administrative_info(df, gdf)
-                    logging.info(f"Successfully added location information to {name}")
-                    save_to_excel_and_markdown(df_with_location, f'{name}_with_location')
+                    with metrics.stage('enrich', dataset_of(name)):
+                        df_with_location = add_administrative_info(df, gdf, name)
+                    logger.info("Successfully added location information to %s", name)
+                    save_to_excel_and_markdown(df_with_location, f'{name}_with_location', output, drop_empty_columns)
+                    save_station_cards(df_with_location, name, output)
+                    if shard_levels:
+                        write_markdown_shards(df_with_location, f'{name}_with_location', shard_levels, output)
                 except Exception as e:
-                    logging.error(f"Error processing {name}: {e}")
+                    logger.error("Error processing %s: %s", name, e)
             else:
-                logging.warning(f"Skipping administrative information for {name} due to missing GADM data")
-                save_to_excel_and_markdown(df, f'{name}_without_location')
+                logger.warning("Skipping administrative information for %s due to missing GADM data", name)
+                save_to_excel_and_markdown(df, f'{name}_without_location', output, drop_empty_columns)
+                save_station_cards(df, name, output)
+
+        # Publish the snapshot id last, once every output of this run is in place
+        output.write_snapshot()
+        success = True
     
     except Exception as e:
-        logging.critical(f"Critical error in main execution: {e}")
+        logger.critical("Critical error in main execution: %s", e)
+    finally:
+        output.close()
+        if history is not None:
+            history.close()
+        metrics.finish(success)
+        try:
+            paths = metrics.write(metrics_dir)
+            logger.info("Run metrics written to %s and %s", paths['summary'], paths['prometheus'])
+        except Exception as e:
+            logger.error("Error writing run metrics: %s", e)
+        if profiler is not None:
+            metrics.profiler = None
+            profiler.close()
+            try:
+                logger.info("Stage profiles written to %s", profiler.write())
+            except Exception as e:
+                logger.error("Error writing stage profiles: %s", e)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Extract Thai Water data and save it to the output directory.")
+    parser.add_argument(
+        "--shard-by",
+        nargs="+",
+        choices=["province", "basin"],
+        default=[],
+        help="Also write *_with_location tables as Markdown shards per province and/or basin"
+    )
+    parser.add_argument(
+        "--drop-empty-columns",
+        action="store_true",
+        help="Omit columns without any values from the Markdown tables; the Excel files keep every column"
+    )
+    parser.add_argument(
+        "--history-db",
+        default=DEFAULT_HISTORY_DB,
+        help="SQLite database that accumulates every run's observations"
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Do not append observations to the history database"
+    )
+    parser.add_argument(
+        "--archive-dir",
+        default=DEFAULT_ARCHIVE_DIR,
+        help="Root of the dataset=/date= partitioned Parquet archive"
+    )
+    parser.add_argument(
+        "--no-archive",
+        action="store_true",
+        help="Do not write observations to the Parquet archive"
+    )
+    parser.add_argument(
+        "--event-log",
+        default=DEFAULT_EVENT_LOG,
+        help="Append-only NDJSON log of new and changed observations and station metadata"
+    )
+    parser.add_argument(
+        "--no-events",
+        action="store_true",
+        help="Do not publish change events"
+    )
+    parser.add_argument(
+        "--metrics-dir",
+        default=DEFAULT_METRICS_DIR,
+        help="Directory of each run's JSON metrics summary and the Prometheus textfile"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile CPU time and memory of every stage and write per-stage reports and flame graph stacks"
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=DEFAULT_PROFILE_DIR,
+        help="Directory of the per-run profile reports written with --profile"
+    )
+    parser.add_argument(
+        "--log-file",
+        default=DEFAULT_LOG_FILE,
+        help="Log file, written by a background thread"
+    )
+    parser.add_argument(
+        "--log-level",
+        default="DEBUG",
+        type=str.upper,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
+        help="Level of all loggers without a --log-module-level"
+    )
+    parser.add_argument(
+        "--log-module-level",
+        nargs="+",
+        default=[],
+        type=parse_module_level,
+        metavar="MODULE=LEVEL",
+        help="Level of individual loggers, e.g. pipeline=INFO utils.output_manager=WARNING"
+    )
+    parser.add_argument(
+        "--log-max-bytes",
+        type=int,
+        default=DEFAULT_MAX_BYTES,
+        help="Rotate the log file once it reaches this size (0: never)"
+    )
+    parser.add_argument(
+        "--log-rotate-when",
+        default=None,
+        help="Rotate the log file by time instead of size, e.g. midnight or H"
+    )
+    parser.add_argument(
+        "--log-backups",
+        type=int,
+        default=DEFAULT_BACKUP_COUNT,
+        help="Number of rotated log files to keep"
+    )
+    args = parser.parse_args()
+    configure_logging(
+        log_file=args.log_file,
+        level=args.log_level,
+        module_levels=dict(args.log_module_level),
+        max_bytes=args.log_max_bytes,
+        backup_count=args.log_backups,
+        rotate_when=args.log_rotate_when
+    )
+    main(
+        shard_levels=args.shard_by,
+        history_db=None if args.no_history else args.history_db,
+        archive_dir=None if args.no_archive else args.archive_dir,
+        event_log=None if args.no_events else args.event_log,
+        metrics_dir=args.metrics_dir,
+        profile_dir=args.profile_dir if args.profile else None,
+        drop_empty_columns=args.drop_empty_columns
+    )
\ No newline at end of file
@@ -1,23 +1,90 @@
 import streamlit as st
 import openai
 import warnings
-import base64
-from openai import OpenAI
 from utils.custom_css_main_page import get_main_custom_css
 from utils.custom_css_banner import get_flood_alert_banner
-from utils.openai_utils import generate_response
-from utils.message_utils import message_func  # Import the utility functions
+from utils import openai_utils
+from utils.openai_utils import BUSY_RESPONSE, ERROR_RESPONSE, generate_response, generate_local_response, record_metrics, session_key, thread_seed
+from utils.answer_cache import AnswerCache, normalize_prompt
+from utils.data_tools import DataTools
+from utils.alert_engine import ALERT_LEVELS, AlertEngine
+from utils.snapshot_data import current_snapshot_id, snapshot_frames
+from utils.response_worker import ResponseWorker
+from utils.local_index import DEFAULT_INDEX_DIR, LocalIndex, index_version
+from utils.message_utils import CHAT_PAGE_SIZE, message_func, message_html, render_chat_history  # Import the utility functions
+from utils.rerun_timer import RerunTimer
 from PIL import Image
 
+# Rerun timing panel, enabled with DEBUG = true in secrets or ?debug=1 in the URL
+debug = st.secrets.get("DEBUG", False) or st.query_params.get("debug") == "1"
+timer = RerunTimer(enabled=debug)
+
 # Ignore all deprecation warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
-# Initialize OpenAI client
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+# OpenAI client shared by the process; every call waits for the shared rate limiter
+client = openai_utils.client
 
 # Set assistant id
 assistant_id = "asst_t2FaMF7fYAhSDGf7WHewA0JU"
 
+# Retrieval backend: "assistants" (OpenAI file_search) or "local" (local vector index)
+retrieval_backend = st.secrets.get("RETRIEVAL_BACKEND", "assistants")
+index_dir = st.secrets.get("INDEX_DIR", DEFAULT_INDEX_DIR)
+# The local backend needs a built index; until there is one, the assistant answers
+local_index_missing = retrieval_backend == "local" and index_version(index_dir) is None
+if local_index_missing:
+    retrieval_backend = "assistants"
+
+# Answers shared by all sessions, invalidated when the pipeline publishes a new snapshot
+@st.cache_resource
+def get_answer_cache():
+    return AnswerCache()
+
+answer_cache = get_answer_cache()
+answer_namespace = f"{retrieval_backend}:{assistant_id}"
+
+# Responses are generated on a bounded pool of background threads shared by
+# all sessions; identical prompts in flight at the same time share one job
+@st.cache_resource
+def get_response_worker():
+    return ResponseWorker(
+        max_workers=st.secrets.get("RESPONSE_WORKERS", 8),
+        max_queue=st.secrets.get("RESPONSE_QUEUE_SIZE", 64))
+
+response_worker = get_response_worker()
+
+# In-memory indexes answering the assistant's function calls, rebuilt when the
+# pipeline publishes a new snapshot
+@st.cache_resource(max_entries=1)
+def load_data_tools(snapshot_id):
+    return DataTools(snapshot_frames(snapshot_id))
+
+snapshot_id = current_snapshot_id()
+with timer.section("data tools"):
+    data_tools = load_data_tools(snapshot_id)
+
+# Alert level of every station, kept across snapshots by one engine per process
+@st.cache_resource
+def get_alert_engine():
+    return AlertEngine()
+
+# Each new snapshot re-evaluates only the stations whose readings changed
+@st.cache_resource(max_entries=1)
+def update_alerts(snapshot_id):
+    engine = get_alert_engine()
+    transitions = engine.update(snapshot_frames(snapshot_id), snapshot_id)
+    print(f"Snapshot {snapshot_id}: {len(transitions)} alert transitions, {engine.last_evaluated} stations evaluated")
+    return engine.counts()
+
+with timer.section("alerts"):
+    alert_counts = update_alerts(snapshot_id)
+
+# Load the local index once per build; the embeddings are memory-mapped
+@st.cache_resource(max_entries=1)
+def load_local_index(index_dir, version):
+    return LocalIndex(index_dir, client=client, build=version)
+
 # Set page config
 st.set_page_config(
     page_title="🌊 Flood Monitoring & Alerts",
@@ -25,20 +92,24 @@ st.set_page_config(
     layout="wide"
 )
 
-# Load and display social news banner
-def load_flood_alert_banner():
-    return get_flood_alert_banner()
-
-st.markdown(load_flood_alert_banner(), unsafe_allow_html=True)
+# Load and display social news banner, with the live alert counts
+@st.cache_data
+def load_flood_alert_banner(counts):
+    return get_flood_alert_banner(counts)
 
 # Load and display main custom CSS
+@st.cache_data
 def load_main_custom_css():
     return get_main_custom_css()
 
-st.markdown(load_main_custom_css(), unsafe_allow_html=True)
+with timer.section("banner and css"):
+    st.markdown(load_flood_alert_banner(alert_counts), unsafe_allow_html=True)
+    st.markdown(load_main_custom_css(), unsafe_allow_html=True)
 
 # Sidebar initialization success message
 st.sidebar.success("OpenAI client initialized successfully.")
+if local_index_missing:
+    st.sidebar.warning(f"No local index in {index_dir}; answering with the assistant. Build it with python -m utils.local_index.")
 
 
 warnings.filterwarnings("ignore")
@@ -54,18 +125,10 @@ model = st.radio(
 )
 st.session_state["model"] = model
 
-# Load icons for user and assistant
-def get_image_base64(image_path):
-    with open(image_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode()
-    return f"data:image/png;base64,{encoded_string}"
-
-# Load icons for user and assistant
-user_icon_path = "image/user_icon.png"
-assistant_icon_path = "image/assistant_icon.png"
-
-user_icon_base64 = get_image_base64(user_icon_path)
-assistant_icon_base64 = get_image_base64(assistant_icon_path)
+# Icons for user and assistant, served from ./static (see .streamlit/config.toml)
+# so the browser fetches and caches them once instead of receiving them inline
+user_icon = "app/static/user_icon.png"
+assistant_icon = "app/static/assistant_icon.png"
 
 # Initialize session state for messages
 if "messages" not in st.session_state:
@@ -73,18 +136,116 @@ if "messages" not in st.session_state:
         {"role": "assistant", "content": "Welcome! 🌊 I'm your Flood Monitoring Assistant. Let me help you stay informed about water levels and flood risks. 🌍⚠️"}
     ]
 
-# Display chat messages
-for message in st.session_state["messages"]:
-    is_user = message["role"] == "user"
-    message_func(message["content"], user_icon_base64, assistant_icon_base64, is_user=is_user, model=model)
-
-# Accept user input and generate a response
-prompt = st.chat_input("Your message")
-if prompt:
-    st.session_state["messages"].append({"role": "user", "content": prompt})
-    message_func(prompt, user_icon_base64, assistant_icon_base64, is_user=True, model=model)
-
-    response = generate_response(prompt, assistant_id)
+# Display the most recent chat messages, with older ones a page at a time
+if "visible_messages" not in st.session_state:
+    st.session_state["visible_messages"] = CHAT_PAGE_SIZE
+
+def show_earlier_messages():
+    st.session_state["visible_messages"] += CHAT_PAGE_SIZE
+
+with timer.section("chat history"):
+    hidden = len(st.session_state["messages"]) - st.session_state["visible_messages"]
+    if hidden > 0:
+        st.button(f"Load earlier messages ({hidden} hidden)", on_click=show_earlier_messages)
+    render_chat_history(st.session_state["messages"], user_icon, assistant_icon, st.session_state["visible_messages"])
+
+# Errors of the last background response, shown once after the rerun that displays it
+if "response_error" in st.session_state:
+    st.error(f"An error occurred: {st.session_state.pop('response_error')}")
+
+# Finish a completed job: surface errors, keep the thread, cache and show the answer
+def complete_response(pending):
+    job = pending["job"]
+    result = job.result()
+    # A session that joined another session's job only takes its answer; the
+    # thread of its next question starts with it (see thread_seed)
+    if job.owner == session_key():
+        if result.get("error"):
+            st.session_state["response_error"] = result["error"]
+        if result.get("thread"):
+            st.session_state["thread"] = result["thread"]
+        if result.get("metrics"):
+            record_metrics(result["metrics"])
+    response = result["response"]
+    if pending["cacheable"] and response not in (ERROR_RESPONSE, BUSY_RESPONSE):
+        answer_cache.put(pending["prompt"], response, answer_namespace)
     st.session_state["messages"].append({"role": "assistant", "content": response})
-    message_func(response, user_icon_base64, assistant_icon_base64, model=model)
 
+# Poll the pending job without holding the script thread; only this fragment reruns
+@st.fragment(run_every=0.5)
+def show_pending_response():
+    pending = st.session_state.get("pending_response")
+    if pending is None:
+        return
+    job = pending["job"]
+    if job.done():
+        del st.session_state["pending_response"]
+        complete_response(pending)
+        st.rerun()
+    text = job.text or "Generating answer..."
+    st.markdown(message_html(text, user_icon, assistant_icon), unsafe_allow_html=True)
+
+# Accept user input and submit it to the background worker
+prompt = st.chat_input("Your message", disabled="pending_response" in st.session_state)
+with timer.section("prompt"):
+    if prompt:
+        st.session_state["messages"].append({"role": "user", "content": prompt})
+        message_func(prompt, user_icon, assistant_icon, is_user=True, model=model)
+
+        # Read session values here: worker threads have no access to session state
+        thread = st.session_state.get("thread")
+        # Without a thread of its own, earlier answers (cached, or another session's)
+        # seed the new thread; skip the welcome message and the new prompt
+        history = thread_seed(st.session_state["messages"][1:-1]) if thread is None else None
+        # Only answers that cannot depend on earlier turns are shared through the cache:
+        # local retrieval, or the first question of a session
+        context_free = retrieval_backend == "local" or not any(
+            message["role"] == "user" for message in st.session_state["messages"][:-1])
+        response = answer_cache.get(prompt, answer_namespace) if context_free else None
+        if response is None:
+            session_id = session_key()
+            index = load_local_index(index_dir, index_version(index_dir)) if retrieval_backend == "local" else None
+
+            def generate(job):
+                if index is not None:
+                    return generate_local_response(prompt, index, session_id)
+                return generate_response(prompt, assistant_id, thread, session_id, on_text=job.on_text, tools=data_tools, history=history)
+
+            # Follow-ups are answered on the session's own thread, so only context-free
+            # turns may join another session's in-flight job
+            conversation = None if context_free else session_id
+            job = response_worker.submit((answer_namespace, conversation, normalize_prompt(prompt)), generate, owner=session_id)
+            if job is None:
+                response = BUSY_RESPONSE
+            else:
+                st.session_state["pending_response"] = {"job": job, "prompt": prompt, "cacheable": context_free}
+        if response is not None:
+            st.session_state["messages"].append({"role": "assistant", "content": response})
+            message_func(response, user_icon, assistant_icon, model=model)
+
+with timer.section("pending response"):
+    show_pending_response()
+
+with timer.section("sidebar panels"):
+    # Latest alert transitions, newest first
+    recent_alerts = list(get_alert_engine().recent)[::-1]
+    if recent_alerts:
+        with st.sidebar.expander("Alert changes"):
+            st.dataframe(
+                [{"change": t["kind"], "station": t["name"], "alert": ALERT_LEVELS[t["level"]], "value": t["value"]} for t in recent_alerts],
+                hide_index=True)
+
+    # Worker health, shared by all sessions
+    with st.sidebar.expander("Response queue"):
+        st.json(response_worker.stats())
+
+    # Run latency against thread length for this session; it should stay flat
+    # because runs are truncated and long threads are summarised
+    if st.session_state.get("response_metrics"):
+        with st.sidebar.expander("Response latency"):
+            st.scatter_chart(
+                [{"thread messages": m.get("thread_messages", 0), "seconds": m["total_time"]} for m in st.session_state["response_metrics"]],
+                x="thread messages",
+                y="seconds")
+
+timer.render()
@@ -0,0 +1,504 @@
+"""
+Benchmarks the stages of the extraction pipeline on recorded API responses.
+
+The process_* functions are fed recorded responses instead of the live API,
+scaled to 1x, 10x and 100x the recorded station counts. Results are written
+as JSON (laid out like pytest-benchmark's) so runs on different branches can
+be compared:
+
+    python benchmarks/pipeline_benchmark.py
+    python benchmarks/pipeline_benchmark.py --scales 1 10 --compare benchmarks/results/main-....json
+
+Fixtures are read from benchmarks/fixtures/<endpoint>.json.gz. Record them
+from the live API with --record; when they are missing, they are rebuilt from
+the pipeline outputs in ./output.
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import shutil
+import logging
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tempfile
+import zlib
+import importlib.util
+import pandas as pd
+from typing import Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.output_manager import OutputManager
+from utils.log_config import configure_logging
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+PIPELINE_PATH = os.path.join(ROOT, '00-thaiwater-extract-data-v2.py')
+SHAPEFILE_PATH = os.path.join(ROOT, 'shapefile', 'gadm41_THA_3.shp')
+
+DEFAULT_SCALES = [1, 10, 100]
+MAX_ROUNDS = 5
+MAX_TIME = 2.0  # seconds per benchmark after which no further rounds are started
+STATION_ID_STRIDE = 10_000_000  # added to station ids per synthetic copy
+
+
+def load_pipeline():
+    """Imports the pipeline script, whose file name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('thaiwater_pipeline', PIPELINE_PATH)
+    pipeline = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(pipeline)
+    return pipeline
+
+
+def fixture_name(url: str) -> str:
+    """Names a fixture after the last segment of its API URL, e.g. 'rain_24h'."""
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+
+# Fixtures
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _th(value) -> Dict:
+    return {'th': value}
+
+
+def fixtures_from_outputs(output_dir: str) -> Dict[str, Dict]:
+    """
+    Rebuilds API responses from the combined tables of a pipeline run.
+
+    :param output_dir: Output directory holding the combined_*.xlsx files
+    :return: Fixture name -> response, shaped like the API's
+    """
+    def read(name):
+        return pd.read_excel(os.path.join(output_dir, f'{name}.xlsx'))
+
+    def station(row, extra=()):
+        fields = {
+            'id': row['id'],
+            'tele_station_name': _th(row['name']),
+            'tele_station_lat': row['lat'],
+            'tele_station_long': row['lng'],
+            'tele_station_oldcode': row.get('station_oldcode'),
+        }
+        fields.update({key: row.get(column) for key, column in extra})
+        return fields
+
+    fixtures = {}
+    bank_fields = [('left_bank', 'left_bank'), ('right_bank', 'right_bank'), ('is_key_station', 'is_key_station'),
+                   ('warning_level_m', 'warning_level_m'), ('critical_level_m', 'critical_level_m'),
+                   ('critical_level_msl', 'critical_level_msl')]
+
+    fixtures['waterlevel_load'] = {'waterlevel_data': {'data': [{
+        'station': station(row, bank_fields + [('min_bank', 'min_bank'), ('ground_level', 'ground_level'), ('offset', 'offset_')]),
+        'basin': {'basin_name': _th(row['basin_name'])},
+        'agency': {'agency_name': _th(row['agency_name'])},
+        'waterlevel_datetime': row['datetime'],
+        **{column: row[column] for column in ['waterlevel_m', 'waterlevel_msl', 'waterlevel_msl_previous', 'flow_rate',
+                                              'discharge', 'storage_percent', 'situation_level']},
+    } for row in _records(read('combined_water_level'))]}}
+
+    fixtures['watergate_load'] = {'watergate_data': {'data': [{
+        'station': station(row, bank_fields),
+        'basin': {'basin_name': _th(row['basin_name'])},
+        'agency': {'agency_name': _th(row['agency_name'])},
+        **{column: row[column] for column in ['watergate_in', 'watergate_out', 'watergate_datetime_in', 'watergate_datetime_out',
+                                              'pump_on', 'pump', 'floodgate_open', 'floodgate', 'floodgate_height']},
+    } for row in _records(read('combined_water_gate'))]}}
+
+    # Rainfall endpoint -> (value column, {API field: combined column})
+    rain_endpoints = {
+        'rain_24h': ('rain_24h_value', {'rain_24h': 'rain_24h_value', 'rainfall_datetime': 'rain_24h_datetime'}),
+        'rain_today': ('rain_daily_value', {'rainfall_value': 'rain_daily_value', 'rainfall_datetime': 'rain_daily_datetime'}),
+        'rain_yesterday': ('rain_yesterday_value', {'rainfall_value': 'rain_yesterday_value', 'rainfall_datetime': 'rain_yesterday_datetime'}),
+        'rain3d': ('rain_3days_value', {'rain_3d': 'rain_3days_value', 'rainfall_start_date': 'rain_3days_startdate',
+                                        'rainfall_end_date': 'rain_3days_enddate'}),
+        'rain7d': ('rain_7days_value', {'rain_7d': 'rain_7days_value', 'rainfall_start_date': 'rain_7days_startdate',
+                                        'rainfall_end_date': 'rain_7days_enddate'}),
+        'rain_monthly': ('rain_monthly_value', {'rainfall_value': 'rain_monthly_value', 'rainfall_datetime': 'rain_monthly_datetime'}),
+        'rain_yearly': ('rain_yearly_value', {'rainfall_value': 'rain_yearly_value', 'rainfall_datetime': 'rain_yearly_datetime'}),
+    }
+    rainfall = _records(read('combined_rainfall'))
+    for name, (value_column, fields) in rain_endpoints.items():
+        fixtures[name] = {'data': [{
+            'station': station(row, [('basin_id', 'basin_code'), ('sub_basin_id', 'sub_basin_code')]),
+            'basin': {'basin_code': row['basin_code'], 'basin_name': _th(row['basin_name'])},
+            'agency': {'agency_name': _th(row['agency_name'])},
+            **{key: row[column] for key, column in fields.items()},
+        } for row in rainfall if row[value_column] is not None]}
+
+    dams = {}
+    for row in _records(read('combined_dam')):
+        dams.setdefault(row['type'], []).append({
+            'dam': {'dam_name': _th(row['name']), 'dam_lat': row['lat'], 'dam_long': row['lng'], 'dam_oldcode': row['oldcode'],
+                    'min_storage': row['min_storage'], 'max_storage': row['max_storage'], 'normal_storage': row['normal_storage']},
+            'agency': {'agency_name': _th(row['agency'])},
+            'basin': {'basin_name': _th(row['basin'])},
+            'cctv': {'url': row['cctv']},
+            'dam_date': row['datetime'],
+            **{f'dam_{column}': row.get(column) for column in [
+                'storage', 'storage_percent', 'inflow', 'uses_water', 'inflow_acc_percent', 'uses_water_percent', 'level',
+                'released', 'spilled', 'losses', 'evap', 'inflow_avg', 'inflow_acc', 'uses_water_percent_calc', 'released_acc']},
+        })
+    fixtures['dam'] = {'data': dams}
+    return fixtures
+
+
+def save_fixtures(fixtures: Dict[str, Dict], fixture_dir: str = FIXTURE_DIR) -> None:
+    os.makedirs(fixture_dir, exist_ok=True)
+    for name, response in fixtures.items():
+        with gzip.open(os.path.join(fixture_dir, f'{name}.json.gz'), 'wt', encoding='utf-8') as f:
+            json.dump(response, f, ensure_ascii=False, default=str)
+
+
+def load_fixtures(fixture_dir: str = FIXTURE_DIR) -> Dict[str, Dict]:
+    fixtures = {}
+    if os.path.isdir(fixture_dir):
+        for filename in sorted(os.listdir(fixture_dir)):
+            if filename.endswith('.json.gz'):
+                with gzip.open(os.path.join(fixture_dir, filename), 'rt', encoding='utf-8') as f:
+                    fixtures[filename[:-len('.json.gz')]] = json.load(f)
+    return fixtures
+
+
+def record_fixtures(pipeline, fixture_dir: str = FIXTURE_DIR) -> Dict[str, Dict]:
+    """
+    Records the live API responses the pipeline reads.
+    """
+    urls = []
+    original = pipeline.make_api_request
+
+    def recording_request(url, *args, **kwargs):
+        urls.append(url)
+        response = original(url, *args, **kwargs)
+        fixtures[fixture_name(url)] = response
+        return response
+
+    fixtures = {}
+    pipeline.make_api_request = recording_request
+    try:
+        for process in (pipeline.process_water_level, pipeline.process_water_gate, pipeline.process_rainfall, pipeline.process_dam):
+            process()
+    finally:
+        pipeline.make_api_request = original
+    save_fixtures(fixtures, fixture_dir)
+    logging.info("Recorded %s fixtures from %s requests to %s", len(fixtures), len(urls), fixture_dir)
+    return fixtures
+
+
+# Synthetic scaling
+
+def _jitter(key, copy: int, axis: str) -> float:
+    """Deterministic offset within +-0.2 degrees for a copy of a station."""
+    return (zlib.crc32(f'{key}:{copy}:{axis}'.encode('utf-8')) % 4001 - 2000) / 10000
+
+
+def _copy_item(item: Dict, copy: int) -> Dict:
+    item = dict(item)
+    if 'station' in item:
+        station = dict(item['station'])
+        key = station.get('id')
+        if isinstance(key, (int, float)):
+            station['id'] = int(key) + copy * STATION_ID_STRIDE
+        for field in ('tele_station_lat', 'tele_station_long'):
+            if isinstance(station.get(field), (int, float)):
+                station[field] += _jitter(key, copy, field)
+        item['station'] = station
+    if 'dam' in item:
+        dam = dict(item['dam'])
+        key = dam['dam_name']['th']
+        dam['dam_name'] = {'th': f'{key} #{copy}'}
+        for field in ('dam_lat', 'dam_long'):
+            if isinstance(dam.get(field), (int, float)):
+                dam[field] += _jitter(key, copy, field)
+        item['dam'] = dam
+    return item
+
+
+def scale_fixture(name: str, response: Dict, scale: int) -> Dict:
+    """
+    Multiplies the stations of a response, giving each copy its own ids and nearby coordinates.
+
+    Copies are derived from the station's id (or dam name), so the rainfall
+    endpoints agree on the ids and coordinates of a synthetic station.
+
+    :param name: Fixture name
+    :param response: Recorded response
+    :param scale: Number of copies of every station; 1 returns the response as is
+    :return: Response shaped like the recorded one
+    """
+    if scale == 1:
+        return response
+
+    def copies(items):
+        return items + [_copy_item(item, copy) for copy in range(1, scale) for item in items]
+
+    if name == 'waterlevel_load':
+        return {'waterlevel_data': {'data': copies(response['waterlevel_data']['data'])}}
+    if name == 'watergate_load':
+        return {'watergate_data': {'data': copies(response['watergate_data']['data'])}}
+    if name == 'dam':
+        return {'data': {dam_type: copies(items) for dam_type, items in response['data'].items()}}
+    return {'data': copies(response['data'])}
+
+
+class FixtureServer:
+    """
+    Stands in for make_api_request, serving scaled fixtures.
+
+    Responses are kept as JSON text and decoded on every request, so the
+    timings include decoding as the live pipeline does.
+    """
+
+    def __init__(self, fixtures: Dict[str, Dict], scale: int):
+        self.payloads = {name: json.dumps(scale_fixture(name, response, scale), ensure_ascii=False, default=str)
+                         for name, response in fixtures.items()}
+
+    def __call__(self, url: str, *args, **kwargs) -> Dict:
+        name = fixture_name(url)
+        if name not in self.payloads:
+            raise Exception(f"No fixture recorded for {url}")
+        return json.loads(self.payloads[name])
+
+
+def synthetic_boundaries(cell: float = 0.1):
+    """
+    Builds a grid of tambon-sized cells over Thailand, for when the GADM shapefile is absent.
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    cells, names = [], []
+    lat = 5.5
+    while lat < 20.5:
+        lng = 97.3
+        while lng < 105.7:
+            cells.append(box(lng, lat, lng + cell, lat + cell))
+            names.append((f'P{int(lat)}', f'A{int(lat * 2)}-{int(lng * 2)}', f'T{lat:.1f}-{lng:.1f}'))
+            lng += cell
+        lat += cell
+    return gpd.GeoDataFrame({
+        'NAME_1': [n[0] for n in names], 'NAME_2': [n[1] for n in names], 'NAME_3': [n[2] for n in names],
+    }, geometry=cells, crs='EPSG:4326')
+
+
+# Timing
+
+def bench(name: str, group: str, scale: int, fn: Callable, setup: Optional[Callable] = None,
+          max_rounds: int = MAX_ROUNDS, max_time: float = MAX_TIME) -> Dict:
+    """
+    Times fn over several rounds; setup runs before each round, untimed, and returns fn's arguments.
+
+    :return: Benchmark record with per-round statistics in seconds
+    """
+    times = []
+    rows = None
+    while len(times) < max_rounds and (not times or sum(times) < max_time):
+        args = setup() if setup else ()
+        started_at = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - started_at)
+        rows = _row_count(result) if rows is None else rows
+    record = {
+        'name': f'{name}[{scale}x]',
+        'group': group,
+        'scale': scale,
+        'rows': rows,
+        'stats': {
+            'min': min(times),
+            'max': max(times),
+            'mean': statistics.mean(times),
+            'median': statistics.median(times),
+            'stddev': statistics.stdev(times) if len(times) > 1 else 0.0,
+            'rounds': len(times),
+        },
+    }
+    print(f"{record['name']:<40} {record['stats']['median'] * 1000:>10.1f} ms  ({len(times)} rounds, {rows} rows)", flush=True)
+    return record
+
+
+def _row_count(result):
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, tuple):
+        return sum(len(part) for part in result if isinstance(part, pd.DataFrame))
+    return None
+
+
+def run_scale(pipeline, fixtures: Dict[str, Dict], scale: int, boundaries, work_dir: str, skip: List[str]) -> List[Dict]:
+    """
+    Runs every benchmark at one scale.
+    """
+    pipeline.make_api_request = FixtureServer(fixtures, scale)
+    results = []
+
+    def run(name, group, fn, setup=None):
+        if group not in skip:
+            results.append(bench(name, group, scale, fn, setup))
+
+    processed = {}
+    for dataset, process in [('water_level', pipeline.process_water_level), ('water_gate', pipeline.process_water_gate),
+                             ('rainfall', pipeline.process_rainfall), ('dam', pipeline.process_dam)]:
+        processed[dataset] = process()
+        run(f'process_{dataset}', 'process', process)
+
+    merges = {'water_level': 'id', 'water_gate': 'id', 'rainfall': 'id', 'dam': 'name'}
+    combined = {}
+    for dataset, key in merges.items():
+        station, data = processed[dataset]
+        combined[dataset] = pd.merge(station, data, on=key, how='inner')
+        run(f'merge_{dataset}', 'merge', lambda s=station, d=data, k=key: pd.merge(s, d, on=k, how='inner'))
+
+    for dataset, df in combined.items():
+        run(f'add_administrative_info_{dataset}', 'enrich',
+            lambda df, name=f'combined_{dataset}': pipeline.add_administrative_info(df, boundaries, name),
+            lambda df=df: (df.copy(),))
+
+    for dataset, df in combined.items():
+        def save(df=df, dataset=dataset):
+            output = OutputManager(output_dir=tempfile.mkdtemp(dir=work_dir))
+            pipeline.save_to_excel_and_markdown(df, f'combined_{dataset}', output)
+            output.close()
+            shutil.rmtree(output.output_dir)
+            return df
+        run(f'save_to_excel_and_markdown_{dataset}', 'write', save)
+    return results
+
+
+# Results
+
+def git_info() -> Dict:
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {
+        'id': git('rev-parse', 'HEAD'),
+        'branch': git('rev-parse', '--abbrev-ref', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+
+def machine_info() -> Dict:
+    return {
+        'python_version': platform.python_version(),
+        'pandas_version': pd.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def print_scaling(benchmarks: List[Dict]) -> None:
+    """Prints each benchmark's median per scale and its growth relative to the smallest scale."""
+    by_name = {}
+    for record in benchmarks:
+        by_name.setdefault(record['name'].rsplit('[', 1)[0], {})[record['scale']] = record['stats']['median']
+    scales = sorted({record['scale'] for record in benchmarks})
+    print('\nMedian ms per scale (growth vs smallest scale)')
+    print(f"{'benchmark':<40}" + ''.join(f'{f"{scale}x":>22}' for scale in scales))
+    for name, medians in by_name.items():
+        base = medians.get(scales[0])
+        cells = []
+        for scale in scales:
+            if scale not in medians:
+                cells.append(f"{'-':>22}")
+                continue
+            growth = f' ({medians[scale] / base:.1f}x)' if base and scale != scales[0] else ''
+            cells.append(f'{medians[scale] * 1000:>12.1f}{growth:>10}')
+        print(f'{name:<40}' + ''.join(cells))
+
+
+def compare(benchmarks: List[Dict], baseline_path: str) -> None:
+    """Prints the median of each benchmark against the same benchmark in a saved result."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {record['name']: record for record in json.load(f)['benchmarks']}
+    print(f'\nCompared with {baseline_path}')
+    for record in benchmarks:
+        before = baseline.get(record['name'])
+        if before is None:
+            continue
+        ratio = record['stats']['median'] / before['stats']['median'] if before['stats']['median'] else float('nan')
+        print(f"{record['name']:<40} {before['stats']['median'] * 1000:>10.1f} ms -> {record['stats']['median'] * 1000:>10.1f} ms  ({ratio:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the extraction pipeline's stages on recorded API responses.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Station count multipliers")
+    parser.add_argument("--skip", nargs="+", default=[], choices=["process", "merge", "enrich", "write"],
+                        help="Benchmark groups to leave out, e.g. write at 100x")
+    parser.add_argument("--record", action="store_true", help="Record fresh fixtures from the live API first")
+    parser.add_argument("--output-dir", default=os.path.join(ROOT, 'output'),
+                        help="Pipeline outputs to rebuild fixtures from when none are recorded")
+    parser.add_argument("--results", default=None, help="Result file (default: benchmarks/results/<branch>-<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    pipeline = load_pipeline()
+    # Benchmark the pipeline's code, not its DEBUG logging
+    configure_logging(level='WARNING')
+
+    if args.record:
+        fixtures = record_fixtures(pipeline)
+        print(f"Recorded {len(fixtures)} fixtures into {FIXTURE_DIR}")
+    else:
+        fixtures = load_fixtures()
+        if not fixtures:
+            fixtures = fixtures_from_outputs(args.output_dir)
+            save_fixtures(fixtures)
+            print(f"Rebuilt {len(fixtures)} fixtures from {args.output_dir} into {FIXTURE_DIR}")
+
+    if os.path.exists(SHAPEFILE_PATH):
+        boundaries = pipeline.gpd.read_file(SHAPEFILE_PATH)
+        boundaries_source = SHAPEFILE_PATH
+    else:
+        boundaries = synthetic_boundaries()
+        boundaries_source = f'synthetic grid of {len(boundaries)} cells'
+
+    # add_administrative_info writes diagnostics under ./output, so run in a scratch directory
+    work_dir = tempfile.mkdtemp(prefix='thaiwater-bench-')
+    os.makedirs(os.path.join(work_dir, 'output'))
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    benchmarks = []
+    try:
+        for scale in args.scales:
+            print(f'\n== {scale}x ==')
+            benchmarks += run_scale(pipeline, fixtures, scale, boundaries, work_dir, args.skip)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    commit = git_info()
+    results = {
+        'machine_info': machine_info(),
+        'commit_info': commit,
+        'datetime': datetime.datetime.now().isoformat(timespec='seconds'),
+        'fixtures': {name: len(json.dumps(response, default=str)) for name, response in fixtures.items()},
+        'boundaries': boundaries_source,
+        'benchmarks': benchmarks,
+    }
+    path = args.results or os.path.join(
+        RESULTS_DIR, f"{commit['branch'] or 'unknown'}-{(commit['id'] or 'unknown')[:8]}-{datetime.datetime.now():%Y%m%dT%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print_scaling(benchmarks)
+    if args.compare:
+        compare(benchmarks, args.compare)
+    print(f'\nResults written to {path}')
+
+
+if __name__ == "__main__":
+    main()
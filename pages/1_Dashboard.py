@@ -0,0 +1,99 @@
+import streamlit as st
+from utils.dashboard_tables import build_dashboard_tables
+from utils.output_manager import read_snapshot
+from utils.snapshot_data import current_snapshot_id, snapshot_frames
+
+# Seconds between fragment refreshes; only the fragments rerun, not the page
+refresh_seconds = st.secrets.get("DASHBOARD_REFRESH_SECONDS", 60)
+
+st.set_page_config(
+    page_title="📊 Station Dashboard",
+    page_icon="📊",
+    layout="wide"
+)
+
+# The tables of the last snapshot built, to flag rows that changed in the next one
+@st.cache_resource
+def table_history():
+    return {}
+
+# Tables are built once per snapshot and shared by every viewer
+@st.cache_resource(max_entries=1)
+def dashboard_tables(snapshot_id):
+    history = table_history()
+    tables = build_dashboard_tables(snapshot_frames(snapshot_id), history.get("tables"))
+    history["tables"] = tables
+    return tables
+
+st.title("📊 Station Dashboard")
+
+# Filters apply to every table; changing one reruns the page
+filter_columns = st.columns([3, 1])
+province = filter_columns[0].text_input("Province", placeholder="All provinces, or e.g. Chiang Mai")
+changed_only = filter_columns[1].toggle("Changed rows only", help="Rows that are new or changed since the previous snapshot")
+
+@st.fragment(run_every=refresh_seconds)
+def show_snapshot_info():
+    snapshot = read_snapshot()
+    if snapshot:
+        st.caption(f"Snapshot {snapshot['snapshot_id']}, completed at {snapshot['completed_at']}. Refreshes every {refresh_seconds}s.")
+    else:
+        st.caption("No completed pipeline run yet; showing the current output files.")
+
+@st.fragment(run_every=refresh_seconds)
+def show_table(name, title, column_config, province, changed_only):
+    table = dashboard_tables(current_snapshot_id()).get(name)
+    st.subheader(title)
+    if table is None:
+        st.info("No data in the latest snapshot.")
+        return
+    changed = int(table["changed"].sum())
+    if province and "province" in table.columns:
+        table = table[table["province"].str.contains(province.strip(), case=False, na=False)]
+    if changed_only:
+        table = table[table["changed"]]
+    st.caption(f"{len(table)} rows shown; {changed} changed since the previous snapshot.")
+    st.dataframe(table, column_config=column_config, hide_index=True, width="stretch")
+
+show_snapshot_info()
+
+show_table(
+    "water_level",
+    "Water level vs warning and critical levels",
+    {
+        "waterlevel_msl": st.column_config.NumberColumn("Level (m MSL)", format="%.2f"),
+        "waterlevel_m": st.column_config.NumberColumn("Level (m)", format="%.2f"),
+        "warning_level_m": st.column_config.NumberColumn("Warning (m)", format="%.2f"),
+        "critical_level_m": st.column_config.NumberColumn("Critical (m)", format="%.2f"),
+        "critical_level_msl": st.column_config.NumberColumn("Critical (m MSL)", format="%.2f"),
+        "margin_m": st.column_config.NumberColumn("Margin to critical (m)", format="%.2f"),
+        "change_m": st.column_config.NumberColumn("Change (m)", format="%+.2f"),
+    },
+    province,
+    changed_only,
+)
+
+rain_column, dam_column = st.columns(2)
+with rain_column:
+    show_table(
+        "rainfall",
+        "Top 24-hour rainfall",
+        {
+            "rain_24h_value": st.column_config.NumberColumn("Rain 24h (mm)", format="%.1f"),
+            "rain_3days_value": st.column_config.NumberColumn("Rain 3 days (mm)", format="%.1f"),
+            "rain_7days_value": st.column_config.NumberColumn("Rain 7 days (mm)", format="%.1f"),
+        },
+        province,
+        changed_only,
+    )
+with dam_column:
+    show_table(
+        "dam",
+        "Dam storage",
+        {
+            "storage_percent": st.column_config.ProgressColumn("Storage (%)", format="%.0f%%", min_value=0, max_value=100),
+            "storage": st.column_config.NumberColumn("Storage (mcm)", format="%.1f"),
+        },
+        province,
+        changed_only,
+    )
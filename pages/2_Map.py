@@ -0,0 +1,89 @@
+import pydeck as pdk
+import streamlit as st
+from utils.map_clusters import (MAP_LAYERS, MAX_ZOOM, MIN_ZOOM, POINT_ZOOM, SEVERITY_COLORS, SEVERITY_LABELS,
+                                build_cluster_levels, station_points, viewport_bounds, visible_clusters)
+from utils.snapshot_data import current_snapshot_id, snapshot_frames
+
+DEFAULT_VIEW = {"lat": 13.0, "lng": 101.0, "zoom": 6}
+MAP_HEIGHT = 650
+
+st.set_page_config(
+    page_title="🗺️ Station Map",
+    page_icon="🗺️",
+    layout="wide"
+)
+
+# Clusters of every zoom level, computed once per snapshot and shared by all viewers
+@st.cache_resource(max_entries=1, show_spinner="Clustering stations...")
+def cluster_levels(snapshot_id):
+    return build_cluster_levels(station_points(snapshot_frames(snapshot_id)))
+
+if "map_view" not in st.session_state:
+    st.session_state["map_view"] = dict(DEFAULT_VIEW)
+    st.session_state["map_zoom"] = DEFAULT_VIEW["zoom"]
+view = st.session_state["map_view"]
+
+# Clicking a cluster zooms in on it
+def zoom_to_selection():
+    objects = st.session_state["station_map"]["selection"]["objects"]
+    for selected in objects.values():
+        if selected:
+            cluster = selected[0]
+            view.update(lat=cluster["lat"], lng=cluster["lng"], zoom=min(view["zoom"] + 2, MAX_ZOOM))
+            st.session_state["map_zoom"] = view["zoom"]
+            break
+
+def reset_view():
+    view.update(DEFAULT_VIEW)
+    st.session_state["map_zoom"] = view["zoom"]
+
+st.title("🗺️ Station Map")
+
+controls = st.columns([3, 2, 1])
+datasets = controls[0].multiselect(
+    "Layers",
+    options=list(MAP_LAYERS),
+    default=list(MAP_LAYERS),
+    format_func=lambda dataset: MAP_LAYERS[dataset][0])
+view["zoom"] = controls[1].slider("Zoom", MIN_ZOOM, MAX_ZOOM, key="map_zoom")
+controls[2].button("Reset view", on_click=reset_view)
+
+levels = cluster_levels(current_snapshot_id())
+clusters = levels[view["zoom"]]
+clusters = clusters[clusters["dataset"].isin(datasets)]
+# Only the clusters around the current view are sent to the browser
+shown = visible_clusters(clusters, viewport_bounds(view["lat"], view["lng"], view["zoom"], height=MAP_HEIGHT))
+
+layers = []
+for dataset in datasets:
+    label, _, value_label = MAP_LAYERS[dataset]
+    data = shown[shown["dataset"] == dataset].assign(layer=label, value_label=value_label)
+    layers.append(pdk.Layer(
+        "ScatterplotLayer",
+        id=dataset,
+        data=data,
+        get_position="[lng, lat]",
+        get_fill_color="color",
+        get_radius="radius",
+        radius_units="pixels",
+        opacity=0.75,
+        stroked=True,
+        get_line_color=[255, 255, 255],
+        line_width_min_pixels=1,
+        pickable=True,
+    ))
+
+deck = pdk.Deck(
+    layers=layers,
+    initial_view_state=pdk.ViewState(latitude=view["lat"], longitude=view["lng"], zoom=view["zoom"]),
+    tooltip={"text": "{layer}: {name}\nStatus: {status}\nMax {value_label}: {max_value}"},
+    map_style=None,
+)
+st.pydeck_chart(deck, height=MAP_HEIGHT, on_select=zoom_to_selection, selection_mode="single-object", key="station_map")
+
+st.caption(
+    f"Zoom {view['zoom']}: sending {len(shown)} of {len(clusters)} clusters. "
+    f"Stations are grouped into grid cells below zoom {POINT_ZOOM}; click a cluster to zoom in on it.")
+st.markdown(" ".join(
+    f'<span style="color: rgb({r}, {g}, {b});">●</span> {label}' for label, (r, g, b) in zip(SEVERITY_LABELS, SEVERITY_COLORS)),
+    unsafe_allow_html=True)
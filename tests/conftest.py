@@ -0,0 +1,80 @@
+"""
+Local stand-in for the OpenAI Assistants API, shared by the chat tests.
+"""
+import itertools
+import importlib
+import types
+import pytest
+import streamlit
+
+
+class FakeStream:
+    """
+    Streamed run that answers with the thread's questions. A question
+    containing 'tool' first pauses the run for one function call.
+    """
+
+    def __init__(self, client, thread_id, run_id=None):
+        self.client = client
+        self.thread_id = thread_id
+        self.current_run = types.SimpleNamespace(id=run_id or f'run-{next(client.ids)}')
+        question = [m['content'] for m in client.threads[thread_id] if m['role'] == 'user'][-1]
+        self.requires_action = run_id is None and 'tool' in question
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_deltas(self):
+        if self.requires_action:
+            return
+        messages = self.client.threads[self.thread_id]
+        questions = [m['content'] for m in messages if m['role'] == 'user']
+        answer = f"answer to {questions[-1]!r} after {questions[:-1]!r}"
+        messages.append({'role': 'assistant', 'content': answer})
+        yield answer
+
+    def get_final_run(self):
+        if self.requires_action:
+            tool_call = types.SimpleNamespace(id='call-1', function=types.SimpleNamespace(name='dam_status', arguments='{}'))
+            return types.SimpleNamespace(id=self.current_run.id, status='requires_action', usage=None, required_action=types.SimpleNamespace(
+                submit_tool_outputs=types.SimpleNamespace(tool_calls=[tool_call])))
+        return types.SimpleNamespace(id=self.current_run.id, status='completed', usage=None)
+
+
+class FakeAssistants:
+    """In-memory stand-in for the threads, messages and streamed runs endpoints."""
+
+    def __init__(self):
+        self.threads = {}  # thread id -> list of {'role', 'content'}
+        self.ids = itertools.count(1)
+        self.beta = types.SimpleNamespace(threads=types.SimpleNamespace(
+            create=self.create_thread,
+            messages=types.SimpleNamespace(create=self.create_message),
+            runs=types.SimpleNamespace(stream=self.stream, submit_tool_outputs_stream=self.submit_tool_outputs_stream)))
+
+    def create_thread(self, messages=()):
+        thread_id = f'thread-{next(self.ids)}'
+        self.threads[thread_id] = [dict(m) for m in messages]
+        return types.SimpleNamespace(id=thread_id)
+
+    def create_message(self, thread_id, role, content):
+        self.threads[thread_id].append({'role': role, 'content': content})
+        return types.SimpleNamespace(id=f'msg-{next(self.ids)}', created_at=0)
+
+    def stream(self, thread_id, assistant_id, truncation_strategy=None):
+        return FakeStream(self, thread_id)
+
+    def submit_tool_outputs_stream(self, thread_id, run_id, tool_outputs):
+        return FakeStream(self, thread_id, run_id)
+
+
+@pytest.fixture
+def openai_utils(monkeypatch):
+    monkeypatch.setattr(streamlit, 'secrets', {'OPENAI_API_KEY': 'sk-test'})
+    module = importlib.import_module('utils.openai_utils')
+    monkeypatch.setattr(module, 'client', FakeAssistants())
+    return module
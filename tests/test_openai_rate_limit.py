@@ -0,0 +1,49 @@
+"""
+Tests that every OpenAI API call of a response takes a token from the shared
+rate limiter, on behalf of the session the response is for.
+"""
+import pytest
+from utils.rate_limiter import RateLimitedClient
+
+
+class CountingLimiter:
+    """Rate limiter that grants a fixed number of tokens and records who took them."""
+
+    def __init__(self, tokens=100):
+        self.tokens = tokens
+        self.sessions = []
+
+    def acquire(self, session_id, timeout=None):
+        if len(self.sessions) >= self.tokens:
+            return False
+        self.sessions.append(session_id)
+        return True
+
+    def queue_depth(self):
+        return 0
+
+
+@pytest.fixture
+def limited(openai_utils, monkeypatch):
+    limiter = CountingLimiter()
+    monkeypatch.setattr(openai_utils, 'rate_limiter', limiter)
+    monkeypatch.setattr(openai_utils, 'client', RateLimitedClient(openai_utils.client, openai_utils.acquire_rate_limit))
+    return limiter
+
+
+def test_every_call_of_a_response_takes_a_token(openai_utils, limited):
+    # New thread, user message, streamed run and the tool-output submission
+    result = openai_utils.generate_response('use a tool', 'asst', None, 'session-a')
+    assert result['response'] == "answer to 'use a tool' after []"
+    assert limited.sessions == ['session-a'] * 4
+
+    # A follow-up on the existing thread only adds its message and run
+    openai_utils.generate_response('Q2', 'asst', result['thread'], 'session-b')
+    assert limited.sessions[4:] == ['session-b'] * 2
+
+
+def test_response_is_busy_when_a_call_times_out(openai_utils, limited):
+    limited.tokens = 2
+    result = openai_utils.generate_response('Q1', 'asst', None, 'session')
+    assert result['response'] == openai_utils.BUSY_RESPONSE
+    assert 'error' not in result
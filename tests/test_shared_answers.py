@@ -0,0 +1,53 @@
+"""
+Tests that sessions answered from the shared answer cache, or by another
+session's job, keep the context of that answer in their follow-ups, against a
+local stand-in for the Assistants API.
+"""
+import threading
+from utils.response_worker import ResponseWorker
+
+WELCOME = {'role': 'assistant', 'content': 'Welcome!'}
+
+
+def test_follow_up_after_cached_answer_sees_it(openai_utils):
+    # The first question was answered from the cache: no thread exists yet
+    messages = [WELCOME, {'role': 'user', 'content': 'Q1'}, {'role': 'assistant', 'content': 'A1'}]
+
+    result = openai_utils.generate_response('Q2', 'asst', None, 'session', history=openai_utils.thread_seed(messages[1:]))
+
+    thread = openai_utils.client.threads[result['thread']['id']]
+    assert [m['content'] for m in thread[:3]] == ['Q1', 'A1', 'Q2']
+    assert result['response'] == "answer to 'Q2' after ['Q1']"
+    assert result['thread']['messages'] == 4
+
+
+def test_thread_seed_leaves_out_failed_answers(openai_utils):
+    messages = [
+        {'role': 'user', 'content': 'Q1'}, {'role': 'assistant', 'content': openai_utils.BUSY_RESPONSE},
+        {'role': 'user', 'content': 'Q2'}, {'role': 'assistant', 'content': 'A2'},
+    ]
+    assert openai_utils.thread_seed(messages) == messages[2:]
+
+
+def test_follow_up_after_joining_another_sessions_job_sees_its_answer(openai_utils):
+    worker = ResponseWorker(max_workers=1)
+    release = threading.Event()
+
+    def generate(job):
+        release.wait(5)
+        return openai_utils.generate_response('Q1', 'asst', None, 'owner', on_text=job.on_text)
+
+    job = worker.submit(('assistants', None, 'q1'), generate, owner='owner')
+    joined = worker.submit(('assistants', None, 'q1'), generate, owner='joiner')
+    assert joined is job and joined.owner != 'joiner'
+    release.set()
+    answer = joined.result()['response']
+
+    # The joiner keeps only the answer, not the owner's thread
+    messages = [WELCOME, {'role': 'user', 'content': 'Q1'}, {'role': 'assistant', 'content': answer}]
+    result = openai_utils.generate_response('Q2', 'asst', None, 'joiner', history=openai_utils.thread_seed(messages[1:]))
+
+    assert result['thread']['id'] != job.result()['thread']['id']
+    thread = openai_utils.client.threads[result['thread']['id']]
+    assert [m['content'] for m in thread[:3]] == ['Q1', answer, 'Q2']
+    assert result['response'] == "answer to 'Q2' after ['Q1']"
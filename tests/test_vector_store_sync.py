@@ -0,0 +1,146 @@
+"""
+Tests the incremental vector-store sync against a local stand-in for the
+OpenAI files and vector_stores API.
+"""
+import os
+import re
+import json
+import itertools
+import importlib.util
+import pytest
+
+SCRIPT_PATH = os.path.join(os.path.dirname(__file__), '..', 'utils', 'upload-articles-to-vector-store.py')
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+        self.headers = {}
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeOpenAI:
+    """In-memory stand-in for the files, vector store files and file batches endpoints."""
+
+    def __init__(self):
+        self.files = {}  # file id -> filename
+        self.attached = set()  # file ids attached to the vector store
+        self.batches = {}
+        self.fail_listing = False
+        self.batch_status = 'completed'
+        self._ids = itertools.count(1)
+
+    def request(self, method, url, timeout=None, headers=None, json=None, files=None, data=None):
+        path = url.split('api.openai.com/v1', 1)[1]
+        if method == 'GET' and path.startswith('/files'):
+            if self.fail_listing:
+                return FakeResponse(503, {'error': 'unavailable'})
+            return FakeResponse(200, {'data': [{'id': i, 'filename': n} for i, n in self.files.items()]})
+        if method == 'POST' and path == '/files':
+            file_id = f'file-{next(self._ids)}'
+            self.files[file_id] = files['file'][0]
+            return FakeResponse(200, {'id': file_id})
+        if method == 'DELETE' and (match := re.fullmatch(r'/files/(.+)', path)):
+            deleted = self.files.pop(match.group(1), None) is not None
+            return FakeResponse(200 if deleted else 404, {'deleted': deleted})
+        if method == 'DELETE' and (match := re.fullmatch(r'/vector_stores/[^/]+/files/(.+)', path)):
+            if match.group(1) not in self.attached:
+                return FakeResponse(404, {'error': 'not attached'})
+            self.attached.discard(match.group(1))
+            return FakeResponse(200, {'deleted': True})
+        if method == 'POST' and path.endswith('/file_batches'):
+            batch_id = f'batch-{next(self._ids)}'
+            ids = json['file_ids']
+            failed = 0 if self.batch_status == 'completed' else len(ids)
+            if not failed:
+                self.attached.update(ids)
+            self.batches[batch_id] = {'id': batch_id, 'status': self.batch_status,
+                                      'file_counts': {'completed': len(ids) - failed, 'failed': failed}}
+            return FakeResponse(200, {'id': batch_id})
+        if method == 'GET' and (match := re.fullmatch(r'/vector_stores/[^/]+/file_batches/(.+)', path)):
+            return FakeResponse(200, self.batches[match.group(1)])
+        raise AssertionError(f"Unexpected request {method} {url}")
+
+    def attached_names(self):
+        return sorted(self.files[file_id] for file_id in self.attached)
+
+
+@pytest.fixture
+def uploader(tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location('vector_store_uploader', SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    api = FakeOpenAI()
+    monkeypatch.setattr(module, 'session', api)
+    monkeypatch.setattr(module.time, 'sleep', lambda seconds: None)
+    (tmp_path / 'docs').mkdir()
+    monkeypatch.chdir(tmp_path)
+    module.api = api
+    return module
+
+
+def write_docs(tmp_path, docs):
+    for name, content in docs.items():
+        (tmp_path / 'docs' / name).write_text(content, encoding='utf-8')
+
+
+def manifest(tmp_path):
+    return json.loads((tmp_path / 'docs' / '.vector_store_manifest.json').read_text(encoding='utf-8'))
+
+
+def test_sync_uploads_only_new_and_changed_documents(uploader, tmp_path):
+    write_docs(tmp_path, {'a.md': 'a', 'b.md': 'b'})
+    uploader.sync()
+    assert uploader.api.attached_names() == ['a.md', 'b.md']
+    first = manifest(tmp_path)
+
+    uploader.sync()
+    assert manifest(tmp_path) == first
+    assert len(uploader.api.files) == 2
+
+    write_docs(tmp_path, {'b.md': 'b2', 'c.md': 'c'})
+    (tmp_path / 'docs' / 'a.md').unlink()
+    uploader.sync()
+    assert uploader.api.attached_names() == ['b.md', 'c.md']
+    assert sorted(uploader.api.files.values()) == ['b.md', 'c.md']
+    assert manifest(tmp_path)['b.md']['file_id'] != first['b.md']['file_id']
+    assert set(manifest(tmp_path)) == {'b.md', 'c.md'}
+
+
+def test_sync_aborts_when_remote_files_cannot_be_listed(uploader, tmp_path):
+    write_docs(tmp_path, {'a.md': 'a'})
+    uploader.sync()
+    before = manifest(tmp_path)
+
+    uploader.api.fail_listing = True
+    uploader.sync()
+    assert manifest(tmp_path) == before
+    assert len(uploader.api.files) == 1
+
+
+def test_failed_batch_keeps_old_versions_and_manifest(uploader, tmp_path):
+    write_docs(tmp_path, {'a.md': 'a'})
+    uploader.sync()
+    before = manifest(tmp_path)
+
+    write_docs(tmp_path, {'a.md': 'a2'})
+    uploader.api.batch_status = 'failed'
+    uploader.sync()
+    assert manifest(tmp_path) == before
+    assert list(uploader.api.files) == [before['a.md']['file_id']]
+    assert uploader.api.attached == {before['a.md']['file_id']}
+
+    # The next successful sync retries the change
+    uploader.api.batch_status = 'completed'
+    uploader.sync()
+    assert manifest(tmp_path)['a.md']['file_id'] != before['a.md']['file_id']
+    assert uploader.api.attached_names() == ['a.md']
+    assert len(uploader.api.files) == 1
@@ -0,0 +1,195 @@
+import threading
+import numpy as np
+import pandas as pd
+from collections import Counter, deque
+from typing import Dict, List
+from utils.data_tools import latest_dam_readings
+
+# Alert levels, from none to most severe
+NONE, WATCH, WARNING, CRITICAL = 0, 1, 2, 3
+ALERT_LEVELS = ['none', 'watch', 'warning', 'critical']
+
+# ThaiWater situation levels of water level stations: 4 is high water, 5 is overflowing the bank
+SITUATION_HIGH = 4
+SITUATION_OVERFLOW = 5
+
+# Columns each dataset's thresholds read; a station is only re-evaluated when
+# one of them changed. Dataset -> (key column, value column, input columns)
+ALERT_INPUTS = {
+    'combined_water_level': ('id', 'waterlevel_msl', [
+        'waterlevel_msl', 'waterlevel_m', 'warning_level_m', 'critical_level_m', 'critical_level_msl',
+        'situation_level']),
+    'combined_rainfall': ('id', 'rain_24h_value', ['rain_24h_value']),
+    'combined_dam': ('name', 'storage_percent', ['storage', 'max_storage', 'storage_percent']),
+}
+
+RECENT_TRANSITIONS = 200
+
+
+def _numeric(df: pd.DataFrame, column: str) -> pd.Series:
+    if column in df.columns:
+        return pd.to_numeric(df[column], errors='coerce')
+    return pd.Series(np.nan, index=df.index)
+
+
+def alert_levels(df: pd.DataFrame, dataset: str) -> pd.Series:
+    """
+    Evaluates the thresholds of every row at once.
+
+    Water level: critical at or above the critical level (m or m MSL) or
+    when the situation level reports overflow; warning at or above the
+    warning level; watch at situation level high. Dam: critical at or above
+    full storage (storage_percent or storage vs max_storage), warning from
+    80%. Rainfall over 24 hours: critical above 90 mm, warning above 35 mm,
+    watch above 10 mm.
+
+    :param df: Combined DataFrame
+    :param dataset: Combined dataset name, a key of ALERT_INPUTS
+    :return: Alert level per row, from NONE to CRITICAL
+    """
+    col = lambda name: _numeric(df, name)
+    if dataset == 'combined_water_level':
+        msl, level, situation = col('waterlevel_msl'), col('waterlevel_m'), col('situation_level')
+        conditions = [
+            (msl >= col('critical_level_msl')) | (level >= col('critical_level_m')) | (situation >= SITUATION_OVERFLOW),
+            level >= col('warning_level_m'),
+            situation >= SITUATION_HIGH,
+        ]
+    elif dataset == 'combined_dam':
+        percent = col('storage_percent')
+        conditions = [(percent >= 100) | (col('storage') >= col('max_storage')), percent >= 80]
+        conditions.append(pd.Series(False, index=df.index))
+    elif dataset == 'combined_rainfall':
+        rain = col('rain_24h_value')
+        conditions = [rain > 90, rain > 35, rain > 10]
+    else:
+        return pd.Series(NONE, index=df.index)
+    levels = np.select(conditions, [CRITICAL, WARNING, WATCH], default=NONE)
+    return pd.Series(levels, index=df.index)
+
+
+def _fingerprints(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+    """Hashes the threshold inputs of every row."""
+    present = [col for col in columns if col in df.columns]
+    if not present:
+        return pd.Series(0, index=df.index, dtype='uint64')
+    return pd.util.hash_pandas_object(df[present], index=False)
+
+
+class AlertEngine:
+    """
+    Keeps the alert level of every station across snapshots.
+
+    Each update hashes the threshold inputs of every station, then evaluates
+    thresholds only for stations whose inputs changed, appeared or
+    disappeared. Only level changes are reported, as transitions:
+    'raised' (from none), 'escalated', 'lowered' and 'cleared' (to none, or
+    the station dropped out of the data). Alert counts are maintained
+    incrementally from the transitions.
+    """
+
+    def __init__(self, recent: int = RECENT_TRANSITIONS):
+        self._lock = threading.Lock()
+        # Dataset -> DataFrame indexed by station key with fingerprint and level
+        self._state: Dict[str, pd.DataFrame] = {}
+        self._counts = Counter()
+        self.recent = deque(maxlen=recent)
+        self.snapshot_id = None
+        self.last_evaluated = 0
+
+    def update(self, frames: Dict[str, pd.DataFrame], snapshot_id: str = None) -> List[Dict]:
+        """
+        Applies a new snapshot and returns the alert transitions it caused.
+
+        :param frames: Combined dataset name -> DataFrame, as loaded by snapshot_frames
+        :param snapshot_id: Snapshot the frames belong to, stamped on transitions
+        :return: Transitions as dicts with dataset, key, name, kind, level, previous and value
+        """
+        with self._lock:
+            transitions = []
+            evaluated = 0
+            for dataset, (key, value_column, inputs) in ALERT_INPUTS.items():
+                df = frames.get(dataset)
+                if df is None:
+                    df = pd.DataFrame(columns=[key])
+                if dataset == 'combined_dam' and not df.empty:
+                    df = latest_dam_readings(df)
+                df = df.drop_duplicates(key).set_index(key, drop=False)
+                state = self._state.get(dataset, pd.DataFrame({'fingerprint': pd.Series(dtype='uint64'),
+                                                               'level': pd.Series(dtype=int)}))
+
+                fingerprint = _fingerprints(df, inputs)
+                changed = fingerprint.ne(state['fingerprint'].reindex(df.index)).values
+                removed = state.index.difference(df.index)
+                evaluated += int(changed.sum()) + len(removed)
+
+                current = df[changed]
+                previous = state['level'].reindex(current.index).fillna(NONE).astype(int)
+                levels = alert_levels(current, dataset)
+                moved = levels.ne(previous)
+                names = current['name'] if 'name' in current.columns else current[key]
+                values = _numeric(current, value_column)
+                for station in levels.index[moved.values]:
+                    transitions.append(self._transition(
+                        dataset, station, names[station], int(levels[station]), int(previous[station]),
+                        values[station], snapshot_id))
+                for station in removed:
+                    if state.at[station, 'level'] > NONE:
+                        transitions.append(self._transition(
+                            dataset, station, station, NONE, int(state.at[station, 'level']), np.nan, snapshot_id))
+
+                state = state.drop(removed)
+                updates = pd.DataFrame({'fingerprint': fingerprint[changed], 'level': levels})
+                state = pd.concat([state.drop(updates.index, errors='ignore'), updates])
+                self._state[dataset] = state
+
+            for transition in transitions:
+                if transition['level'] > NONE:
+                    self._counts[transition['dataset'], transition['level']] += 1
+                if transition['previous'] > NONE:
+                    self._counts[transition['dataset'], transition['previous']] -= 1
+            self.recent.extend(transitions)
+            self.snapshot_id = snapshot_id
+            self.last_evaluated = evaluated
+            return transitions
+
+    @staticmethod
+    def _transition(dataset, station, name, level, previous, value, snapshot_id) -> Dict:
+        if previous == NONE:
+            kind = 'raised'
+        elif level == NONE:
+            kind = 'cleared'
+        else:
+            kind = 'escalated' if level > previous else 'lowered'
+        return {
+            'dataset': dataset,
+            'key': str(station),
+            'name': str(name),
+            'kind': kind,
+            'level': level,
+            'previous': previous,
+            'value': None if pd.isna(value) else round(float(value), 2),
+            'snapshot_id': snapshot_id,
+        }
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns the number of stations currently at each alert level above none.
+        """
+        with self._lock:
+            totals = Counter()
+            for (_, level), count in self._counts.items():
+                totals[level] += count
+            return {ALERT_LEVELS[level]: totals[level] for level in (CRITICAL, WARNING, WATCH)}
+
+    def active(self, min_level: int = WATCH) -> pd.DataFrame:
+        """
+        Lists the stations currently at or above an alert level, most severe first.
+        """
+        with self._lock:
+            rows = [state[state['level'] >= min_level].assign(dataset=dataset)
+                    for dataset, state in self._state.items()]
+        active = pd.concat(rows) if rows else pd.DataFrame(columns=['level', 'dataset'])
+        active = active.rename_axis('key').reset_index()[['dataset', 'key', 'level']]
+        active['alert'] = active['level'].map(dict(enumerate(ALERT_LEVELS)))
+        return active.sort_values('level', ascending=False, kind='stable').reset_index(drop=True)
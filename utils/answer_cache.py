@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+from utils.output_manager import SNAPSHOT_FILENAME, read_snapshot
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 600  # seconds
+
+THAI_DIGITS = str.maketrans('๐๑๒๓๔๕๖๗๘๙', '0123456789')
+# Zero-width characters frequently pasted into Thai text
+ZERO_WIDTH = dict.fromkeys(map(ord, '\u200b\u200c\u200d\ufeff'))
+TRAILING_PUNCTUATION = re.compile(r'[\s?!.]+$')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalises a prompt so that trivially different phrasings share a cache entry.
+
+    Applies Unicode NFKC, removes zero-width characters, maps Thai digits to
+    Arabic digits, case-folds, collapses whitespace and drops trailing
+    punctuation.
+
+    :param prompt: Raw user prompt
+    :return: Normalised prompt
+    """
+    text = unicodedata.normalize('NFKC', prompt).translate(ZERO_WIDTH).translate(THAI_DIGITS)
+    text = ' '.join(text.casefold().split())
+    return TRAILING_PUNCTUATION.sub('', text)
+
+
+class AnswerCache:
+    """
+    Process-wide LRU cache of assistant answers with a time-to-live.
+
+    Entries are keyed on the normalised prompt and the data snapshot id
+    published by the extraction pipeline. When a new snapshot lands, every
+    entry of the previous snapshot is dropped.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL, output_dir: str = './output'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.output_dir = output_dir
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._snapshot_id = ''
+        self._snapshot_mtime = None
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot_id(self) -> str:
+        """
+        Returns the current data snapshot id, re-reading it only when the file changed.
+
+        Clears the cache when the snapshot id differs from the cached one.
+        """
+        try:
+            mtime = os.stat(os.path.join(self.output_dir, SNAPSHOT_FILENAME)).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._snapshot_mtime:
+                return self._snapshot_id
+        snapshot_id = read_snapshot(self.output_dir).get('snapshot_id', '')
+        with self._lock:
+            if snapshot_id != self._snapshot_id:
+                self._entries.clear()
+            self._snapshot_id = snapshot_id
+            self._snapshot_mtime = mtime
+        return snapshot_id
+
+    def _key(self, prompt: str, namespace: str) -> Tuple[str, str]:
+        return f'{self.snapshot_id()}:{namespace}', normalize_prompt(prompt)
+
+    def get(self, prompt: str, namespace: str = '') -> Optional[str]:
+        """
+        Returns the cached answer for a prompt, or None.
+
+        :param prompt: Raw user prompt
+        :param namespace: Separates answers of different assistants or backends
+        :return: Cached answer, or None on a miss or expired entry
+        """
+        key = self._key(prompt, namespace)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, prompt: str, answer: str, namespace: str = '') -> None:
+        """
+        Stores an answer, evicting the least recently used entry if full.
+
+        :param prompt: Raw user prompt
+        :param answer: Answer to cache
+        :param namespace: Separates answers of different assistants or backends
+        """
+        key = self._key(prompt, namespace)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), answer)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'snapshot_id': self._snapshot_id}
@@ -1,4 +1,21 @@
-def get_flood_alert_banner():
+def get_alert_pills(counts=None):
+    """
+    Builds the banner pills, with live alert counts when they are known.
+
+    :param counts: Alert level -> number of stations, e.g. from AlertEngine.counts()
+    """
+    if counts is None:
+        return """
+            <span class="benefit-pill">📡 Latest Data</span>
+            <span class="benefit-pill">⚠️ Proactive Risk Alerts</span>
+            <span class="benefit-pill">🌍 Location-Specific Insights</span>"""
+    return f"""
+            <span class="benefit-pill alert-critical">🚨 {counts.get('critical', 0)} critical</span>
+            <span class="benefit-pill alert-warning">⚠️ {counts.get('warning', 0)} warning</span>
+            <span class="benefit-pill">👀 {counts.get('watch', 0)} watch</span>"""
+
+
+def get_flood_alert_banner(counts=None):
     return """
     <style>
     .main-header {
@@ -37,14 +54,17 @@ def get_flood_alert_banner():
         font-size: 0.85rem;  /* Slightly smaller font size */
         backdrop-filter: blur(5px);
     }
+    .benefit-pill.alert-critical {
+        background-color: rgba(220, 38, 38, 0.85);
+    }
+    .benefit-pill.alert-warning {
+        background-color: rgba(245, 158, 11, 0.85);
+    }
     </style>
     <div class="main-header">
         <h1>🌊 Flood Monitoring & Alerts</h1>
         <p>Stay informed with real-time water level updates and proactive flood risk alerts.</p>
-        <div class="benefit-pills">
-            <span class="benefit-pill">📡 Latest Data</span>
-            <span class="benefit-pill">⚠️ Proactive Risk Alerts</span>
-            <span class="benefit-pill">🌍 Location-Specific Insights</span>
+        <div class="benefit-pills">""" + get_alert_pills(counts) + """
         </div>
     </div>
     """
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+from utils.data_tools import latest_dam_readings
+from utils.station_cards import station_status
+
+TOP_RAINFALL = 100
+STATUS_ORDER = {
+    'critical': 0, 'warning': 1, 'normal': 2,
+    'over capacity': 0, 'high': 1, 'low': 3,
+    'very heavy rain': 0, 'heavy rain': 1, 'moderate rain': 2, 'light rain': 3, 'no rain': 4,
+}
+
+
+def _numeric(df: pd.DataFrame, column: str) -> pd.Series:
+    if column in df.columns:
+        return pd.to_numeric(df[column], errors='coerce')
+    return pd.Series(np.nan, index=df.index)
+
+
+def _columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    """Selects the columns that exist, in the given order."""
+    return df[[col for col in columns if col in df.columns]].copy()
+
+
+def water_level_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Water level stations against their warning and critical levels, most urgent first.
+
+    'margin_m' is the distance left to the critical level (negative when above
+    it) and 'change_m' the change since the station's previous reading.
+    """
+    table = _columns(df, ['id', 'name', 'province', 'basin_name', 'datetime', 'waterlevel_msl', 'waterlevel_m',
+                          'warning_level_m', 'critical_level_m', 'critical_level_msl'])
+    table['status'] = station_status(df, 'combined_water_level')
+    table['margin_m'] = (_numeric(df, 'critical_level_msl') - _numeric(df, 'waterlevel_msl')).fillna(
+        _numeric(df, 'critical_level_m') - _numeric(df, 'waterlevel_m')).round(2)
+    table['change_m'] = (_numeric(df, 'waterlevel_msl') - _numeric(df, 'waterlevel_msl_previous')).round(2)
+    severity = table['status'].map(STATUS_ORDER).fillna(len(STATUS_ORDER))
+    order = pd.DataFrame({'severity': severity, 'margin': table['margin_m']}).sort_values(['severity', 'margin'], kind='stable').index
+    return table.loc[order].reset_index(drop=True)
+
+
+def rainfall_table(df: pd.DataFrame, limit: int = TOP_RAINFALL) -> pd.DataFrame:
+    """
+    The stations with the most rain over the last 24 hours.
+    """
+    table = _columns(df, ['id', 'name', 'province', 'basin_name', 'rain_24h_datetime', 'rain_24h_value',
+                          'rain_3days_value', 'rain_7days_value'])
+    table['status'] = station_status(df, 'combined_rainfall')
+    rain = _numeric(df, 'rain_24h_value')
+    return table.loc[rain.dropna().sort_values(ascending=False, kind='stable').index[:limit]].reset_index(drop=True)
+
+
+def dam_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The latest storage of every dam, fullest first.
+    """
+    latest = latest_dam_readings(df)
+    table = _columns(latest, ['name', 'province', 'basin', 'station_type', 'datetime', 'storage', 'storage_percent',
+                              'max_storage', 'inflow', 'released'])
+    table['status'] = station_status(latest, 'combined_dam')
+    percent = _numeric(latest, 'storage_percent')
+    return table.loc[percent.sort_values(ascending=False, kind='stable', na_position='last').index].reset_index(drop=True)
+
+
+# Dashboard table -> (builder, combined dataset, key column)
+DASHBOARD_TABLES = {
+    'water_level': (water_level_table, 'combined_water_level', 'id'),
+    'rainfall': (rainfall_table, 'combined_rainfall', 'id'),
+    'dam': (dam_table, 'combined_dam', 'name'),
+}
+
+
+def mark_changes(table: pd.DataFrame, previous: Optional[pd.DataFrame], key: str) -> pd.Series:
+    """
+    Flags the rows that are new or whose values differ from the previous snapshot's table.
+
+    :param table: Table of the current snapshot
+    :param previous: Same table of the previous snapshot, or None
+    :param key: Column identifying a station
+    :return: Boolean Series aligned with table
+    """
+    if previous is None or key not in table.columns or key not in previous.columns:
+        return pd.Series(False, index=table.index)
+    columns = [col for col in table.columns if col in previous.columns]
+    current = table[columns].astype(str)
+    before = previous[columns].astype(str).drop_duplicates(key).set_index(key)
+    matched = before.reindex(current[key])
+    same = (matched.values == current.drop(columns=key).reindex(columns=matched.columns).values).all(axis=1)
+    return pd.Series(~same, index=table.index)
+
+
+def build_dashboard_tables(frames: Dict[str, pd.DataFrame], previous: Dict[str, pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Builds every dashboard table of a snapshot, with a 'changed' column.
+
+    :param frames: Combined dataset name -> DataFrame, as loaded by snapshot_frames
+    :param previous: Tables of the previous snapshot, to flag changed rows
+    :return: Dashboard table name -> DataFrame
+    """
+    previous = previous or {}
+    tables = {}
+    for name, (builder, dataset, key) in DASHBOARD_TABLES.items():
+        df = frames.get(dataset)
+        if df is None or df.empty:
+            continue
+        table = builder(df)
+        table['changed'] = mark_changes(table, previous.get(name), key)
+        tables[name] = table
+    return tables
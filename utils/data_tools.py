@@ -0,0 +1,307 @@
+import os
+import json
+import logging
+import argparse
+import pandas as pd
+from collections import defaultdict
+from typing import Dict, List, Optional
+from utils.answer_cache import normalize_prompt
+from utils.station_cards import CARD_SPECS, LOCATION_COLUMNS, station_status
+
+logger = logging.getLogger(__name__)
+
+# Rainfall accumulation windows and their columns
+RAIN_WINDOWS = {
+    '24h': 'rain_24h_value',
+    'today': 'rain_daily_value',
+    'yesterday': 'rain_yesterday_value',
+    '3days': 'rain_3days_value',
+    '7days': 'rain_7days_value',
+    'month': 'rain_monthly_value',
+    'year': 'rain_yearly_value',
+}
+THRESHOLD_LEVELS = {'warning': ('warning', 'critical'), 'critical': ('critical',)}
+MAX_RESULTS = 50
+ALL_AREAS = ''
+
+TOOL_DEFINITIONS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_station_latest",
+            "description": "Latest reading of a water level, water gate, rainfall station or dam, looked up by station name, id or code.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "station": {"type": "string", "description": "Station name (Thai or English), numeric id or station code such as 'Y.16'"},
+                },
+                "required": ["station"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "top_rainfall",
+            "description": "Stations with the most rainfall over a time window, optionally within a province or river basin.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "area": {"type": "string", "description": "Province (English name, e.g. 'Chiang Mai') or basin name (Thai); omit for the whole country"},
+                    "window": {"type": "string", "enum": list(RAIN_WINDOWS), "description": "Accumulation window, default '24h'"},
+                    "limit": {"type": "integer", "description": f"Number of stations to return, at most {MAX_RESULTS}, default 10"},
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "stations_above_threshold",
+            "description": "Water level stations at or above their warning or critical level, optionally within a province.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "province": {"type": "string", "description": "Province (English name); omit for the whole country"},
+                    "level": {"type": "string", "enum": list(THRESHOLD_LEVELS), "description": "Minimum level, default 'warning'"},
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "dam_status",
+            "description": "Latest storage, inflow and release of a dam or reservoir.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "Dam name, e.g. 'ภูมิพล' or 'สิริกิติ์'"},
+                },
+                "required": ["name"],
+            },
+        },
+    },
+]
+
+
+def load_combined(output_dir: str, dataset: str) -> Optional[pd.DataFrame]:
+    """
+    Loads the most complete output of a combined dataset.
+
+    :param output_dir: Output directory of the pipeline
+    :param dataset: Combined dataset name, e.g. 'combined_rainfall'
+    :return: DataFrame, or None if the pipeline has not produced it
+    """
+    for suffix in ('_with_location', '_without_location', ''):
+        path = os.path.join(output_dir, f'{dataset}{suffix}.xlsx')
+        if os.path.exists(path):
+            return pd.read_excel(path)
+    return None
+
+
+def latest_dam_readings(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Keeps one row per dam: its most recent report that has a storage percentage.
+
+    Dams are reported hourly, daily and as medium-sized reservoirs. Hourly
+    reports carry the storage volume but leave storage_percent at 0, so
+    reports with a positive percentage are preferred over newer ones without.
+
+    :param df: Combined dam DataFrame
+    :return: One row per dam name, in the original order
+    """
+    if 'name' not in df.columns:
+        return df
+    percent = pd.to_numeric(df['storage_percent'], errors='coerce') if 'storage_percent' in df.columns else pd.Series(float('nan'), index=df.index)
+    observed = df['datetime'].astype(str) if 'datetime' in df.columns else pd.Series('', index=df.index)
+    order = pd.DataFrame({'has_percent': percent.gt(0), 'observed': observed}).sort_values(['has_percent', 'observed'], kind='stable').index
+    return df.loc[order].drop_duplicates('name', keep='last').sort_index()
+
+
+def _records(df: pd.DataFrame, dataset: str) -> List[Dict]:
+    """
+    Converts rows to JSON-ready dictionaries labelled like the station cards.
+
+    :param df: Combined DataFrame
+    :param dataset: Combined dataset name, a key of CARD_SPECS
+    :return: One dictionary per row, without missing values
+    """
+    spec = CARD_SPECS[dataset]
+    columns = {col: col for col in spec['heading'] + LOCATION_COLUMNS}
+    columns.update({column: label for label, column, _ in spec['fields']})
+    columns = {col: label for col, label in columns.items() if col in df.columns}
+
+    table = df[list(columns)].rename(columns=columns).astype(object)
+    table['status'] = station_status(df, dataset).values
+    table = table.where(table.notna(), None)
+    records = table.to_dict('records')
+    for record in records:
+        record['dataset'] = dataset.replace('combined_', '')
+        for key in [key for key, value in record.items() if value is None or value == '']:
+            del record[key]
+    return records
+
+
+class DataTools:
+    """
+    Answers the assistant's function calls from an in-memory copy of the latest outputs.
+
+    Every lookup is served from a dictionary or a pre-sorted list built once
+    per data snapshot, so a call costs microseconds rather than the model
+    scanning Markdown tables.
+    """
+
+    def __init__(self, datasets: Dict[str, pd.DataFrame]):
+        self._by_key: Dict[str, List[Dict]] = defaultdict(list)
+        self._rain: Dict[tuple, List[Dict]] = {}
+        self._above: Dict[tuple, List[Dict]] = {}
+        self._dams: Dict[str, Dict] = {}
+        self.counts = {}
+
+        for dataset, df in datasets.items():
+            if df is None or df.empty:
+                continue
+            if dataset == 'combined_dam':
+                df = latest_dam_readings(df)
+            records = _records(df, dataset)
+            self.counts[dataset] = len(records)
+            if dataset == 'combined_dam':
+                self._index_dams(records)
+            else:
+                self._index_stations(df, records)
+            if dataset == 'combined_rainfall':
+                self._index_rainfall(df, records)
+            elif dataset == 'combined_water_level':
+                self._index_thresholds(records)
+        self._names = [(key, records) for key, records in self._by_key.items()]
+
+    @classmethod
+    def load(cls, output_dir: str = './output') -> 'DataTools':
+        """
+        Builds the indexes from the pipeline's combined outputs.
+        """
+        tools = cls({dataset: load_combined(output_dir, dataset) for dataset in CARD_SPECS})
+        logger.info("Loaded data tools: %s", tools.counts)
+        return tools
+
+    def _index_stations(self, df: pd.DataFrame, records: List[Dict]) -> None:
+        for column in ('id', 'station_oldcode', 'name'):
+            if column not in df.columns:
+                continue
+            for value, record in zip(df[column], records):
+                if pd.notna(value) and str(value).strip():
+                    key = normalize_prompt(str(value).removesuffix('.0'))
+                    self._by_key[key].append(record)
+
+    def _index_dams(self, records: List[Dict]) -> None:
+        for record in records:
+            key = normalize_prompt(str(record.get('name', '')))
+            self._dams[key] = record
+            self._by_key[key].append(record)
+
+    def _index_rainfall(self, df: pd.DataFrame, records: List[Dict]) -> None:
+        area_columns = [col for col in ('province', 'basin_name') if col in df.columns]
+        for window, column in RAIN_WINDOWS.items():
+            if column not in df.columns:
+                continue
+            ranked = df[area_columns].assign(value=pd.to_numeric(df[column], errors='coerce').values, position=range(len(df)))
+            ranked = ranked.dropna(subset=['value']).sort_values('value', ascending=False, kind='stable')
+            self._rain[(window, ALL_AREAS)] = [records[i] for i in ranked['position'][:MAX_RESULTS]]
+            for area_column in area_columns:
+                areas = ranked[area_column].fillna('').astype(str).map(normalize_prompt)
+                for area, group in ranked.groupby(areas, sort=False):
+                    if area:
+                        self._rain[(window, area)] = [records[i] for i in group['position'][:MAX_RESULTS]]
+
+    def _index_thresholds(self, records: List[Dict]) -> None:
+        for level, statuses in THRESHOLD_LEVELS.items():
+            matching = [r for r in records if r.get('status') in statuses]
+            self._above[(level, ALL_AREAS)] = matching
+            for record in matching:
+                key = (level, normalize_prompt(str(record.get('province', ''))))
+                self._above.setdefault(key, []).append(record)
+
+    def get_station_latest(self, station: str) -> Dict:
+        key = normalize_prompt(str(station))
+        matches = self._by_key.get(key)
+        if not matches:
+            # Fall back to a substring match on names, ids and codes
+            matches = [r for name, records in self._names if key and key in name for r in records]
+        return {'station': station, 'matches': matches[:MAX_RESULTS], 'total': len(matches)}
+
+    def top_rainfall(self, area: str = None, window: str = '24h', limit: int = 10) -> Dict:
+        if window not in RAIN_WINDOWS:
+            return {'error': f"Unknown window '{window}', expected one of {list(RAIN_WINDOWS)}"}
+        stations = self._rain.get((window, normalize_prompt(area or ALL_AREAS)))
+        if stations is None:
+            return {'error': f"No rainfall stations found for area '{area}'"}
+        return {'area': area or 'all', 'window': window, 'stations': stations[:max(1, min(limit, MAX_RESULTS))]}
+
+    def stations_above_threshold(self, province: str = None, level: str = 'warning') -> Dict:
+        if level not in THRESHOLD_LEVELS:
+            return {'error': f"Unknown level '{level}', expected one of {list(THRESHOLD_LEVELS)}"}
+        stations = self._above.get((level, normalize_prompt(province or ALL_AREAS)), [])
+        return {'province': province or 'all', 'level': level, 'stations': stations[:MAX_RESULTS], 'total': len(stations)}
+
+    def dam_status(self, name: str) -> Dict:
+        key = normalize_prompt(str(name))
+        dam = self._dams.get(key)
+        if dam is not None:
+            return {'name': name, 'dams': [dam]}
+        dams = [record for dam_key, record in self._dams.items() if key and key in dam_key]
+        if not dams:
+            return {'error': f"No dam named '{name}'"}
+        return {'name': name, 'dams': dams[:MAX_RESULTS]}
+
+    def call(self, name: str, arguments: str) -> str:
+        """
+        Executes a function call from the assistant.
+
+        :param name: Function name, one of TOOL_DEFINITIONS
+        :param arguments: JSON-encoded arguments as sent by the model
+        :return: JSON-encoded result; errors are returned to the model, not raised
+        """
+        handlers = {
+            'get_station_latest': self.get_station_latest,
+            'top_rainfall': self.top_rainfall,
+            'stations_above_threshold': self.stations_above_threshold,
+            'dam_status': self.dam_status,
+        }
+        try:
+            result = handlers[name](**json.loads(arguments or '{}'))
+        except KeyError:
+            result = {'error': f"Unknown function '{name}'"}
+        except (TypeError, ValueError) as e:
+            result = {'error': f"Invalid arguments for {name}: {e}"}
+        return json.dumps(result, ensure_ascii=False, default=str)
+
+
+def register_tools(client, assistant_id: str) -> None:
+    """
+    Adds the data tools to an assistant, keeping its other tools (e.g. file_search).
+
+    :param client: OpenAI client
+    :param assistant_id: Assistant to update
+    """
+    assistant = client.beta.assistants.retrieve(assistant_id)
+    names = {tool['function']['name'] for tool in TOOL_DEFINITIONS}
+    tools = [tool.model_dump(exclude_none=True) for tool in assistant.tools
+             if not (tool.type == 'function' and tool.function.name in names)]
+    client.beta.assistants.update(assistant_id, tools=tools + TOOL_DEFINITIONS)
+    logger.info("Registered %s data tools on assistant %s", len(TOOL_DEFINITIONS), assistant_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Register the data tools on an assistant or try them locally.")
+    parser.add_argument("--register", metavar="ASSISTANT_ID", help="Add the tool definitions to this assistant")
+    parser.add_argument("--output-dir", default="./output", help="Output directory of the pipeline")
+    parser.add_argument("--call", nargs=2, metavar=("FUNCTION", "ARGUMENTS_JSON"), help="Run one tool call locally and print the result")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
+
+    if args.register:
+        from openai import OpenAI
+        register_tools(OpenAI(api_key=os.getenv('OPENAI_API_KEY')), args.register)
+    if args.call:
+        print(DataTools.load(args.output_dir).call(*args.call))
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import logging
+import argparse
+import datetime
+import threading
+import pandas as pd
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from utils.history_store import DATASET_SCHEMAS, station_key, to_observations
+from utils.output_manager import VOLATILE_COLUMN_PREFIXES, atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_LOG = './output/events.ndjson'
+STATE_SUFFIX = '.state.json'  # fingerprints of the last published rows
+OFFSETS_SUFFIX = '.offsets.json'  # committed offset per consumer
+POLL_INTERVAL = 1.0
+
+
+def _fingerprints(payload: pd.Series) -> pd.Series:
+    """Hashes JSON payloads, as strings so the state serialises to JSON."""
+    return pd.Series(pd.util.hash_array(payload.to_numpy(dtype=object)), index=payload.index).astype(str)
+
+
+def _json_records(data: pd.DataFrame) -> List[str]:
+    columns = [col for col in data.columns if not str(col).startswith(VOLATILE_COLUMN_PREFIXES)]
+    if data.empty:
+        return []
+    return data[columns].to_json(orient='records', lines=True, force_ascii=False, date_format='iso').splitlines()
+
+
+class EventLog:
+    """
+    Append-only NDJSON log of observation and station metadata changes.
+
+    Each line is one event. Its 'offset' is the byte position of the line in
+    the file, so a consumer resumes by seeking straight to the offset after
+    the last event it processed. The log only ever grows; a line without a
+    trailing newline is an interrupted write and is ignored by readers and
+    cut off by the next writer.
+
+    To know what changed, the log keeps a fingerprint of every row it last
+    published in a state file next to it. Events are appended before the
+    state is saved, so a crash in between re-publishes some events: delivery
+    is at least once, and consumers should be idempotent on the event key.
+    """
+
+    def __init__(self, path: str = DEFAULT_EVENT_LOG):
+        self.path = path
+        self.state_path = path + STATE_SUFFIX
+        self.offsets_path = path + OFFSETS_SUFFIX
+        self._lock = threading.Lock()
+        self._state: Optional[Dict[str, Dict[str, str]]] = None
+
+    # Writing
+
+    def _load_state(self) -> Dict[str, Dict[str, str]]:
+        if self._state is None:
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self._state = json.load(f)
+            except (OSError, ValueError):
+                self._state = {}
+        return self._state
+
+    def _save_state(self) -> None:
+        def write_state(tmp_path: str) -> None:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._state, f)
+
+        atomic_write(self.state_path, write_state)
+
+    def _truncate_partial_line(self) -> None:
+        """Cuts off an event whose write was interrupted."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size == 0:
+            return
+        with open(self.path, 'rb+') as f:
+            end = size
+            while end > 0:
+                start = max(end - 65536, 0)
+                f.seek(start)
+                chunk = f.read(end - start)
+                newline = chunk.rfind(b'\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end != size:
+                logger.warning("Dropping %s bytes of an interrupted event in %s", size - end, self.path)
+                f.truncate(end)
+
+    def append(self, events: List[Tuple[Dict, Optional[str]]]) -> int:
+        """
+        Appends events and flushes them to disk.
+
+        :param events: (header, payload) pairs; the payload is a JSON document
+            stored under 'data', or None
+        :return: Offset after the last appended event
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._truncate_partial_line()
+        with open(self.path, 'ab') as f:
+            offset = f.tell()
+            lines = []
+            for header, payload in events:
+                line = json.dumps(dict(offset=offset, **header), ensure_ascii=False)
+                if payload is not None:
+                    line = line[:-1] + ', "data": ' + payload + '}'
+                line = (line + '\n').encode('utf-8')
+                lines.append(line)
+                offset += len(line)
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        return offset
+
+    def _publish(self, scope: str, keys: pd.Series, payload: pd.Series, headers: List[Dict],
+                 delete_header: Optional[Callable[[str], Dict]] = None) -> int:
+        """
+        Appends insert/update events for new or changed rows of one scope.
+
+        :param scope: State namespace, e.g. 'observation:water_level'
+        :param keys: Event key per row
+        :param payload: JSON payload per row
+        :param headers: Event header per row, aligned with keys
+        :param delete_header: Builds the header of a delete event from a key; None
+            publishes no deletes for keys that disappeared
+        :return: Number of events appended
+        """
+        state = self._load_state()
+        previous = state.get(scope, {})
+        fingerprints = _fingerprints(payload)
+        known = keys.map(previous)
+        changed = (known != fingerprints).to_numpy()
+        events = []
+        for position in changed.nonzero()[0]:
+            op = 'update' if isinstance(known.iat[position], str) else 'insert'
+            events.append((dict(headers[position], op=op), payload.iat[position]))
+        if delete_header is not None:
+            current = set(keys)
+            events.extend((dict(delete_header(key), op='delete'), None) for key in previous if key not in current)
+        if events:
+            self.append(events)
+        state[scope] = dict(zip(keys, fingerprints))
+        self._save_state()
+        return len(events)
+
+    def publish_observations(self, dataset: str, data: pd.DataFrame, run_id: str = None) -> int:
+        """
+        Publishes one event per observation that is new or changed since the last run.
+
+        Observations are keyed like the history store, on dataset, station and
+        observation datetime. Only the observations of the latest run are
+        remembered, so the state stays as small as one run.
+
+        :param dataset: Dataset name, a key of DATASET_SCHEMAS
+        :param data: DataFrame returned by the matching process_* function
+        :param run_id: Identifier of the pipeline run, stamped on the events
+        :return: Number of events appended
+        """
+        with self._lock:
+            observations = to_observations(dataset, data).drop_duplicates(['dataset', 'station_id', 'observed_at'], keep='last')
+            keys = observations['dataset'] + '|' + observations['station_id'] + '|' + observations['observed_at']
+            emitted_at = datetime.datetime.now().isoformat(timespec='seconds')
+            headers = [
+                {'type': 'observation', 'key': key, 'dataset': row.dataset, 'station_id': row.station_id,
+                 'observed_at': row.observed_at, 'value': None if pd.isna(row.value) else float(row.value),
+                 'run_id': run_id, 'emitted_at': emitted_at}
+                for key, row in zip(keys, observations.itertuples(index=False))
+            ]
+            count = self._publish(f'observation:{dataset}', keys, observations['data'], headers)
+        logger.info("Published %s %s observation events to %s", count, dataset, self.path)
+        return count
+
+    def publish_stations(self, dataset: str, stations: pd.DataFrame, run_id: str = None) -> int:
+        """
+        Publishes one event per station whose metadata is new, changed or gone.
+
+        An empty frame, or one without the station column, means the fetch
+        failed rather than that every station is gone, so it publishes nothing
+        and the known stations are kept.
+
+        :param dataset: Dataset name, a key of DATASET_SCHEMAS
+        :param stations: Station DataFrame returned by the matching process_* function
+        :param run_id: Identifier of the pipeline run, stamped on the events
+        :return: Number of events appended
+        """
+        station_column = DATASET_SCHEMAS[dataset]['station']
+        if station_column not in stations.columns or stations[station_column].isna().all():
+            logger.warning("No %s stations in this run; skipping station events", dataset)
+            return 0
+        with self._lock:
+            stations = stations[stations[station_column].notna()]
+            stations = stations.drop_duplicates(station_column, keep='last')
+            station_ids = stations[station_column].map(station_key)
+            payload = pd.Series(_json_records(stations), index=station_ids.index, dtype=object)
+            keys = dataset + '|' + station_ids
+            emitted_at = datetime.datetime.now().isoformat(timespec='seconds')
+            headers = [
+                {'type': 'station', 'key': key, 'dataset': dataset, 'station_id': station_id,
+                 'run_id': run_id, 'emitted_at': emitted_at}
+                for key, station_id in zip(keys, station_ids)
+            ]
+            count = self._publish(f'station:{dataset}', keys, payload, headers, lambda key: {
+                'type': 'station', 'key': key, 'dataset': dataset, 'station_id': key.split('|', 1)[1],
+                'run_id': run_id, 'emitted_at': emitted_at})
+        logger.info("Published %s %s station events to %s", count, dataset, self.path)
+        return count
+
+    # Reading
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """
+        Reads the complete events from an offset on.
+
+        :param offset: Offset of the first event to read, 0 for the beginning
+        :param limit: Maximum number of events to return
+        :return: The events and the offset to read from next time
+        """
+        events = []
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return events, offset
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n') or (limit is not None and len(events) >= limit):
+                    break
+                events.append(json.loads(line))
+                offset += len(line)
+        return events, offset
+
+    def tail(self, offset: int = 0, poll_interval: float = POLL_INTERVAL) -> Iterator[Dict]:
+        """
+        Yields events from an offset on, waiting for new ones as they are appended.
+        """
+        while True:
+            events, offset = self.read(offset)
+            yield from events
+            if not events:
+                time.sleep(poll_interval)
+
+    def committed_offset(self, consumer: str) -> int:
+        """
+        Returns the offset a consumer committed last, or 0 if it never did.
+        """
+        try:
+            with open(self.offsets_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get(consumer, 0)
+        except (OSError, ValueError):
+            return 0
+
+    def commit_offset(self, consumer: str, offset: int) -> None:
+        """
+        Records the offset a consumer should resume from.
+        """
+        with self._lock:
+            try:
+                with open(self.offsets_path, 'r', encoding='utf-8') as f:
+                    offsets = json.load(f)
+            except (OSError, ValueError):
+                offsets = {}
+            offsets[consumer] = offset
+
+            def write_offsets(tmp_path: str) -> None:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(offsets, f, indent=2, sort_keys=True)
+
+            atomic_write(self.offsets_path, write_offsets)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print events of the pipeline's event log.")
+    parser.add_argument("--log", default=DEFAULT_EVENT_LOG, help="Event log file")
+    parser.add_argument("--offset", type=int, default=None, help="Offset to read from (default: the consumer's committed offset)")
+    parser.add_argument("--consumer", default=None, help="Resume from this consumer's committed offset, and commit the new one unless following")
+    parser.add_argument("--follow", action="store_true", help="Keep waiting for new events")
+    args = parser.parse_args()
+
+    log = EventLog(args.log)
+    offset = args.offset if args.offset is not None else (log.committed_offset(args.consumer) if args.consumer else 0)
+    if args.follow:
+        for event in log.tail(offset):
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+    else:
+        events, offset = log.read(offset)
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False))
+        if args.consumer:
+            log.commit_offset(args.consumer, offset)
@@ -0,0 +1,234 @@
+import io
+import os
+import sqlite3
+import logging
+import datetime
+import pandas as pd
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_DB = './history/observations.sqlite3'
+
+# How each *_data table maps onto the observation store:
+#   station: column identifying the station
+#   datetime: candidate observation datetime columns, first non-null wins
+#   value: primary reading, stored in its own column for fast range queries
+#   dataset_column: optional column whose value is stored as the dataset
+#     name, for tables that mix several series (dam_hourly/dam_daily/dam_medium)
+DATASET_SCHEMAS = {
+    'water_level': {
+        'station': 'id',
+        'datetime': ['datetime'],
+        'value': 'waterlevel_msl',
+    },
+    'water_gate': {
+        'station': 'id',
+        'datetime': ['watergate_datetime_in', 'watergate_datetime_out'],
+        'value': 'watergate_in',
+    },
+    'rainfall': {
+        'station': 'id',
+        'datetime': ['rain_24h_datetime', 'rain_daily_datetime'],
+        'value': 'rain_24h_value',
+    },
+    'dam': {
+        'station': 'name',
+        'datetime': ['datetime'],
+        'value': 'storage_percent',
+        'dataset_column': 'type',
+    },
+}
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS observations (
+    dataset TEXT NOT NULL,
+    station_id TEXT NOT NULL,
+    observed_at TEXT NOT NULL,
+    value REAL,
+    data TEXT NOT NULL,
+    collected_at TEXT NOT NULL,
+    PRIMARY KEY (dataset, station_id, observed_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_observations_dataset_time
+    ON observations (dataset, observed_at);
+"""
+
+UPSERT_SQL = """
+INSERT INTO observations (dataset, station_id, observed_at, value, data, collected_at)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (dataset, station_id, observed_at) DO UPDATE SET
+    value = excluded.value,
+    data = excluded.data,
+    collected_at = excluded.collected_at
+"""
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _format_timestamp(value) -> str:
+    return pd.Timestamp(value).strftime(TIMESTAMP_FORMAT)
+
+
+def station_key(value) -> str:
+    """
+    Normalises a station id so that 123, 123.0 and '123' are stored alike.
+
+    :param value: Station id (or dam name)
+    :return: Station id as stored in the observations table
+    """
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def observed_datetime(dataset: str, data: pd.DataFrame) -> pd.Series:
+    """
+    Resolves the observation datetime of each row of a *_data table.
+
+    :param dataset: Dataset name, a key of DATASET_SCHEMAS
+    :param data: DataFrame returned by the matching process_* function
+    :return: Datetime Series aligned with data (NaT where unknown)
+    """
+    observed_at = pd.Series(pd.NaT, index=data.index, dtype='datetime64[ns]')
+    for col in DATASET_SCHEMAS[dataset]['datetime']:
+        if col in data.columns:
+            # Series such as the dam tables mix date-only and date-time values
+            observed_at = observed_at.fillna(pd.to_datetime(data[col], errors='coerce', format='mixed'))
+    return observed_at
+
+
+def to_observations(dataset: str, data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reshapes a *_data table into observation rows.
+
+    :param dataset: Dataset name, a key of DATASET_SCHEMAS
+    :param data: DataFrame returned by the matching process_* function
+    :return: DataFrame with the observations table columns
+    """
+    schema = DATASET_SCHEMAS[dataset]
+    if data.empty or schema['station'] not in data.columns:
+        return pd.DataFrame(columns=['dataset', 'station_id', 'observed_at', 'value', 'data', 'collected_at'])
+
+    observed_at = observed_datetime(dataset, data)
+
+    if schema.get('dataset_column') in data.columns:
+        dataset_names = data[schema['dataset_column']].astype(str)
+    else:
+        dataset_names = pd.Series(dataset, index=data.index)
+
+    if schema['value'] in data.columns:
+        values = pd.to_numeric(data[schema['value']], errors='coerce')
+    else:
+        values = pd.Series(float('nan'), index=data.index)
+
+    payload_columns = [col for col in data.columns if col != 'collected_at']
+    payload = data[payload_columns].to_json(
+        orient='records', lines=True, force_ascii=False, date_format='iso'
+    ).splitlines()
+
+    collected_at = data['collected_at'] if 'collected_at' in data.columns else datetime.datetime.now()
+    observations = pd.DataFrame({
+        'dataset': dataset_names,
+        'station_id': data[schema['station']].map(station_key),
+        'observed_at': observed_at,
+        'value': values,
+        'data': payload,
+        'collected_at': collected_at,
+    }, index=data.index)
+    observations = observations[observed_at.notna() & data[schema['station']].notna()].copy()
+    observations['observed_at'] = observations['observed_at'].dt.strftime(TIMESTAMP_FORMAT)
+    observations['collected_at'] = pd.to_datetime(observations['collected_at']).dt.strftime(TIMESTAMP_FORMAT)
+    return observations
+
+
+class HistoryStore:
+    """
+    Embedded SQLite store of every observation the pipeline has collected.
+
+    Observations are keyed on (dataset, station_id, observed_at), so polling
+    the same reading twice updates the row instead of duplicating it. The
+    primary key doubles as the index for per-station time range scans.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA_SQL)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def append(self, dataset: str, data: pd.DataFrame) -> int:
+        """
+        Upserts one run's observations for a dataset.
+
+        :param dataset: Dataset name, a key of DATASET_SCHEMAS
+        :param data: DataFrame returned by the matching process_* function
+        :return: Number of observations written
+        """
+        observations = to_observations(dataset, data)
+        rows = [
+            (r.dataset, r.station_id, r.observed_at, None if pd.isna(r.value) else float(r.value), r.data, r.collected_at)
+            for r in observations.itertuples(index=False)
+        ]
+        with self.conn:
+            self.conn.executemany(UPSERT_SQL, rows)
+        logger.info("Stored %s %s observations in %s", len(rows), dataset, self.path)
+        return len(rows)
+
+    def station_history(
+        self,
+        dataset: str,
+        station_id,
+        since: Optional[datetime.datetime] = None,
+        until: Optional[datetime.datetime] = None,
+        hours: Optional[float] = None
+    ) -> pd.DataFrame:
+        """
+        Returns the observations of one station over a time range.
+
+        :param dataset: Dataset name as stored, e.g. 'water_level' or 'dam_daily'
+        :param station_id: Station id (dam name for dams)
+        :param since: Earliest observation datetime, inclusive
+        :param until: Latest observation datetime, inclusive
+        :param hours: Shortcut for since = now - hours
+        :return: DataFrame ordered by observed_at, with the stored readings expanded
+        """
+        if hours is not None:
+            since = datetime.datetime.now() - datetime.timedelta(hours=hours)
+        query = "SELECT observed_at, value, data FROM observations WHERE dataset = ? AND station_id = ?"
+        params: List = [dataset, station_key(station_id)]
+        if since is not None:
+            query += " AND observed_at >= ?"
+            params.append(_format_timestamp(since))
+        if until is not None:
+            query += " AND observed_at <= ?"
+            params.append(_format_timestamp(until))
+        query += " ORDER BY observed_at"
+
+        history = pd.read_sql_query(query, self.conn, params=params)
+        if history.empty:
+            return history.drop(columns=['data'])
+        readings = pd.read_json(io.StringIO('\n'.join(history['data'])), orient='records', lines=True)
+        history = pd.concat([history.drop(columns=['data']), readings], axis=1)
+        history['observed_at'] = pd.to_datetime(history['observed_at'])
+        return history
+
+    def counts(self) -> Dict[str, int]:
+        """
+        Returns the number of stored observations per dataset.
+        """
+        cursor = self.conn.execute("SELECT dataset, COUNT(*) FROM observations GROUP BY dataset")
+        return {dataset: count for dataset, count in cursor.fetchall()}
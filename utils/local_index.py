@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import numpy as np
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = './index'
+DEFAULT_SOURCE_DIR = './output/cards'
+DEFAULT_CHUNK_CHARS = 1500
+
+EMBEDDINGS_FILENAME = 'embeddings.npy'
+CHUNKS_FILENAME = 'chunks.jsonl'
+META_FILENAME = 'meta.json'
+BUILDS_DIRNAME = 'builds'
+CURRENT_FILENAME = 'CURRENT'  # names the published build
+KEEP_BUILDS = 2  # the published build and the one before, which a running app may still map
+
+# Latin words and numbers, or runs of Thai characters (Thai has no spaces)
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?|[฀-๿]+')
+
+
+class HashingEmbedder:
+    """
+    Deterministic, offline embedder based on the hashing trick.
+
+    Latin words are hashed whole; Thai runs are hashed as character trigrams
+    because Thai is written without spaces between words. Useful for tests
+    and air-gapped environments; quality is lexical rather than semantic.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = f'hashing:{dim}'
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            if '฀' <= token[0] <= '๿' and len(token) > 3:
+                features.extend(token[i:i + 3] for i in range(len(token) - 2))
+            else:
+                features.append(token)
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], 'little') % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        return _normalize(vectors)
+
+
+class OpenAIEmbedder:
+    """
+    Embedder backed by the OpenAI embeddings endpoint.
+    """
+
+    def __init__(self, client, model: str = 'text-embedding-3-small', batch_size: int = 256):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.name = f'openai:{model}'
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            response = self.client.embeddings.create(model=self.model, input=texts[start:start + self.batch_size])
+            vectors.extend(item.embedding for item in response.data)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def make_embedder(name: str, client=None):
+    """
+    Creates an embedder from its name, as stored in the index metadata.
+
+    :param name: 'hashing', 'hashing:<dim>' or 'openai:<model>'
+    :param client: OpenAI client, required for OpenAI embedders
+    :return: Embedder instance
+    """
+    kind, _, arg = name.partition(':')
+    if kind == 'hashing':
+        return HashingEmbedder(int(arg)) if arg else HashingEmbedder()
+    if kind == 'openai':
+        if client is None:
+            raise ValueError("An OpenAI client is required for OpenAI embeddings")
+        return OpenAIEmbedder(client, arg or 'text-embedding-3-small')
+    raise ValueError(f"Unknown embedder: {name}")
+
+
+def chunk_markdown(text: str, source: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> List[Dict]:
+    """
+    Splits a Markdown document into retrieval chunks.
+
+    Station card documents are split on their '### ' card headings so that
+    every card is one chunk; other documents are split on blank lines and
+    packed up to max_chars. Each chunk keeps the document title for context.
+
+    :param text: Document text
+    :param source: Document file name
+    :param max_chars: Maximum chunk size for non-card documents
+    :return: Chunks as dictionaries with 'source', 'title' and 'text'
+    """
+    title_match = re.match(r'#\s+(.+)', text)
+    title = title_match.group(1).strip() if title_match else source
+    body = text[title_match.end():] if title_match else text
+
+    if re.search(r'^### ', body, flags=re.MULTILINE):
+        pieces = [p.strip() for p in re.split(r'^(?=### )', body, flags=re.MULTILINE)]
+        pieces = [p for p in pieces if p.startswith('### ')]
+    else:
+        pieces = []
+        current = ''
+        for paragraph in re.split(r'\n\s*\n', body):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if current and len(current) + len(paragraph) > max_chars:
+                pieces.append(current)
+                current = ''
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+        if current:
+            pieces.append(current)
+    return [{'source': source, 'title': title, 'text': piece} for piece in pieces]
+
+
+def build_index(source_dir: str = DEFAULT_SOURCE_DIR, index_dir: str = DEFAULT_INDEX_DIR, embedder=None) -> int:
+    """
+    Embeds every Markdown document in source_dir and saves the index to disk.
+
+    :param source_dir: Directory of generated documents (e.g. station cards)
+    :param index_dir: Directory to write the index to
+    :param embedder: Embedder to use; HashingEmbedder if omitted
+    :return: Number of chunks indexed
+    """
+    embedder = embedder or HashingEmbedder()
+    chunks = []
+    for filename in sorted(os.listdir(source_dir)):
+        if filename.endswith('.md'):
+            with open(os.path.join(source_dir, filename), 'r', encoding='utf-8') as f:
+                chunks.extend(chunk_markdown(f.read(), filename))
+
+    embeddings = embedder.embed([f"{c['title']}\n{c['text']}" for c in chunks]) if chunks \
+        else np.zeros((0, getattr(embedder, 'dim', 1)), dtype=np.float32)
+
+    # Every build gets a directory of its own and is published by replacing the
+    # CURRENT pointer, so a running app loads either the old or the new build,
+    # never embeddings of one with chunks of the other
+    build_id = str(time.time_ns())
+    builds_dir = os.path.join(index_dir, BUILDS_DIRNAME)
+    build_dir = os.path.join(builds_dir, build_id)
+    os.makedirs(build_dir)
+    np.save(os.path.join(build_dir, EMBEDDINGS_FILENAME), embeddings.astype(np.float32))
+    with open(os.path.join(build_dir, CHUNKS_FILENAME), 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+    with open(os.path.join(build_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump({'embedder': embedder.name, 'count': len(chunks), 'dim': int(embeddings.shape[1])}, f)
+    pointer_tmp = os.path.join(index_dir, f'.{CURRENT_FILENAME}.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(build_id)
+    os.replace(pointer_tmp, os.path.join(index_dir, CURRENT_FILENAME))
+
+    for old_build in sorted(os.listdir(builds_dir), key=int)[:-KEEP_BUILDS]:
+        shutil.rmtree(os.path.join(builds_dir, old_build), ignore_errors=True)
+
+    logger.info("Indexed %s chunks from %s into %s with %s", len(chunks), source_dir, index_dir, embedder.name)
+    return len(chunks)
+
+
+def index_version(index_dir: str = DEFAULT_INDEX_DIR) -> Optional[str]:
+    """
+    Identifies the published build of an index.
+
+    :param index_dir: Directory of the index
+    :return: Build id, or None if no index has been built
+    """
+    try:
+        with open(os.path.join(index_dir, CURRENT_FILENAME), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class LocalIndex:
+    """
+    Brute-force cosine-similarity index over memory-mapped embeddings.
+
+    Loading only maps the embedding matrix; pages are read on first search.
+    At the pipeline's scale (a few thousand station cards) an exact NumPy
+    scan takes about a millisecond, so no approximate index is needed.
+    """
+
+    def __init__(self, index_dir: str = DEFAULT_INDEX_DIR, embedder=None, client=None, build: Optional[str] = None):
+        self.build = build or index_version(index_dir)
+        if self.build is None:
+            raise FileNotFoundError(f"No index has been built in {index_dir}")
+        build_dir = os.path.join(index_dir, BUILDS_DIRNAME, self.build)
+        with open(os.path.join(build_dir, META_FILENAME), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(os.path.join(build_dir, EMBEDDINGS_FILENAME), mmap_mode='r')
+        with open(os.path.join(build_dir, CHUNKS_FILENAME), 'r', encoding='utf-8') as f:
+            self.chunks = [json.loads(line) for line in f]
+        if not len(self.embeddings) == len(self.chunks) == self.meta['count']:
+            raise ValueError(f"Index build {self.build} in {index_dir} is inconsistent: {len(self.embeddings)} embeddings, "
+                             f"{len(self.chunks)} chunks, {self.meta['count']} in {META_FILENAME}")
+        self.embedder = embedder or make_embedder(self.meta['embedder'], client)
+
+    def search(self, query: str, k: int = 5) -> List[Dict]:
+        """
+        Returns the k chunks most similar to the query.
+
+        :param query: Query text
+        :param k: Number of chunks to return
+        :return: Chunks with an added 'score', best first
+        """
+        if not self.chunks:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        scores = self.embeddings @ query_vector
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.chunks[i], score=float(scores[i])) for i in top]
+
+    def context(self, query: str, k: int = 5) -> str:
+        """
+        Formats the top-k chunks as a context block for a prompt.
+        """
+        return '\n\n'.join(f"[{c['title']}]\n{c['text']}" for c in self.search(query, k))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local retrieval index from generated documents.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE_DIR, help="Directory of Markdown documents to index")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR, help="Directory to write the index to")
+    parser.add_argument("--embedder", default="hashing", help="'hashing', 'hashing:<dim>' or 'openai:<model>'")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
+
+    client = None
+    if args.embedder.startswith('openai'):
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    print(f"Indexed {build_index(args.source, args.index_dir, make_embedder(args.embedder, client))} chunks")
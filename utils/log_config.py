@@ -0,0 +1,141 @@
+import queue
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_LOG_FILE = 'data_processing.log'
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s:%(message)s'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+
+# Pass as `extra=` to rate-limit a per-item message, e.g.
+# logger.warning("Skipping item in %s", rain_type, extra=RATE_LIMITED)
+RATE_LIMITED = {'rate_limited': True}
+RATE_LIMIT_BURST = 5  # messages let through per template and interval
+RATE_LIMIT_INTERVAL = 60.0  # seconds
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `burst` records per logger and message template
+    every `interval` seconds, for records logged with `extra=RATE_LIMITED`.
+
+    Records are told apart by their unformatted message, so all records of
+    one `logger.warning("... %s", item)` call site share a budget. The first
+    record let through after a suppression reports how many were dropped;
+    `flush()` reports the rest.
+    """
+
+    def __init__(self, burst: int = RATE_LIMIT_BURST, interval: float = RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[str, str], List] = {}  # (logger, template) -> [window start, passed, suppressed, last suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, 'rate_limited', False):
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0, None]
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                window[3] = record
+                return False
+        if suppressed:
+            record.msg = f"{record.msg} (%d similar messages suppressed)"
+            record.args = (record.args or ()) + (suppressed,)
+        return True
+
+    def flush(self) -> None:
+        """Logs how many records of each template are still suppressed."""
+        with self._lock:
+            pending = [(window[3], window[2]) for window in self._windows.values() if window[2]]
+            self._windows.clear()
+        for record, suppressed in pending:
+            logging.getLogger(record.name).log(record.levelno, "%d similar messages suppressed, the last: %s",
+                                               suppressed, record.getMessage())
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue unformatted.
+
+    QueueHandler formats each record in the logging thread so that it can be
+    pickled. The queue never leaves the process, so formatting is left to the
+    writer thread instead, off the hot path.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_module_level(value: str) -> Tuple[str, str]:
+    """
+    Parses a 'module=LEVEL' option, e.g. 'utils.output_manager=WARNING'.
+
+    :raises ValueError: If the value is malformed or the level unknown
+    """
+    name, sep, level = value.partition('=')
+    level = level.strip().upper()
+    if not sep or not name.strip() or not isinstance(logging.getLevelName(level), int):
+        raise ValueError(f"Expected MODULE=LEVEL with a standard level name, got {value!r}")
+    return name.strip(), level
+
+
+def configure_logging(log_file: str = DEFAULT_LOG_FILE, level: str = 'DEBUG',
+                      module_levels: Optional[Dict[str, str]] = None,
+                      max_bytes: int = DEFAULT_MAX_BYTES, backup_count: int = DEFAULT_BACKUP_COUNT,
+                      rotate_when: Optional[str] = None) -> QueueListener:
+    """
+    Routes all logging through a queue to a rotating log file written by a background thread.
+
+    Logging calls only filter the record and put it on the queue. Formatting
+    and file I/O happen on the listener thread, which is stopped, after
+    reporting suppressed rate-limited messages, when the process exits.
+
+    :param log_file: Path of the log file
+    :param level: Level of the root logger
+    :param module_levels: Levels of individual loggers, e.g. {'utils.event_log': 'WARNING'}
+    :param max_bytes: Rotate the file once it reaches this size; 0 never rotates by size
+    :param backup_count: Number of rotated files to keep
+    :param rotate_when: Rotate by time instead of size, e.g. 'midnight' or 'H'
+        (see TimedRotatingFileHandler)
+    :return: The started queue listener
+    """
+    if rotate_when:
+        file_handler = TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count, encoding='utf-8')
+    else:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    rate_limit = RateLimitFilter()
+    queue_handler.addFilter(rate_limit)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    # atexit runs in reverse order: report suppressed messages, then drain the queue
+    atexit.register(listener.stop)
+    atexit.register(rate_limit.flush)
+    return listener
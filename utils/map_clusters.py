@@ -0,0 +1,138 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Tuple
+from utils.data_tools import latest_dam_readings
+from utils.station_cards import station_status
+
+MIN_ZOOM = 5
+MAX_ZOOM = 12
+POINT_ZOOM = 11  # from this zoom on every station is drawn on its own
+CELLS_PER_TILE = 4  # grid cells across one 256 px map tile
+TILE_PIXELS = 256
+
+# Marker radius in screen pixels: a single station, plus growth with the square
+# root of the cluster's station count so marker area tracks the count
+MIN_RADIUS_PIXELS = 4
+RADIUS_PIXELS_PER_SQRT_STATION = 2.5
+MAX_RADIUS_PIXELS = 40
+
+# Thailand's bounding box, with a margin; coordinates outside are dropped
+LAT_RANGE = (4.0, 22.0)
+LNG_RANGE = (96.0, 107.0)
+
+# Map layer per combined dataset: (label, value column, value label)
+MAP_LAYERS = {
+    'combined_rainfall': ('Rainfall', 'rain_24h_value', 'rain 24h (mm)'),
+    'combined_water_level': ('Water level', 'storage_percent', 'bank-full (%)'),
+    'combined_water_gate': ('Water gate', 'watergate_in', 'upstream level'),
+    'combined_dam': ('Dam', 'storage_percent', 'storage (%)'),
+}
+
+# Lower is more severe; a cluster takes the most severe status of its stations
+SEVERITY = {
+    'critical': 0, 'over capacity': 0, 'very heavy rain': 0,
+    'warning': 1, 'high': 1, 'heavy rain': 1,
+    'moderate rain': 2,
+    'normal': 3, 'light rain': 3, 'low': 3, 'no rain': 3,
+}
+NO_STATUS = 4
+SEVERITY_LABELS = ['critical', 'warning', 'elevated', 'normal', 'no status']
+SEVERITY_COLORS = [[220, 38, 38], [245, 158, 11], [234, 179, 8], [34, 197, 94], [148, 163, 184]]
+
+
+def station_points(frames: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Collects every station with valid coordinates into one table of map points.
+
+    :param frames: Combined dataset name -> DataFrame, as loaded by snapshot_frames
+    :return: DataFrame with dataset, name, lat, lng, value and severity
+    """
+    points = []
+    for dataset, (_, value_column, _) in MAP_LAYERS.items():
+        df = frames.get(dataset)
+        if df is None or df.empty or 'lat' not in df.columns or 'lng' not in df.columns:
+            continue
+        if dataset == 'combined_dam':
+            df = latest_dam_readings(df)
+        lat = pd.to_numeric(df['lat'], errors='coerce')
+        lng = pd.to_numeric(df['lng'], errors='coerce')
+        value = pd.to_numeric(df[value_column], errors='coerce') if value_column in df.columns else np.nan
+        points.append(pd.DataFrame({
+            'dataset': dataset,
+            'name': df['name'].astype(str) if 'name' in df.columns else '',
+            'lat': lat,
+            'lng': lng,
+            'value': value,
+            'severity': station_status(df, dataset).map(SEVERITY).fillna(NO_STATUS).astype(int),
+        })[lat.between(*LAT_RANGE) & lng.between(*LNG_RANGE)])
+    if not points:
+        return pd.DataFrame(columns=['dataset', 'name', 'lat', 'lng', 'value', 'severity'])
+    return pd.concat(points, ignore_index=True)
+
+
+def cell_size(zoom: int) -> float:
+    """Returns the grid cell size in degrees at a zoom level."""
+    return 360 / (2 ** zoom * CELLS_PER_TILE)
+
+
+def cluster_points(points: pd.DataFrame, zoom: int) -> pd.DataFrame:
+    """
+    Aggregates points into grid cells per dataset.
+
+    Each cluster is placed at the centroid of its stations and carries their
+    count, maximum value, most severe status and a marker radius in pixels.
+
+    :param points: Map points from station_points
+    :param zoom: Map zoom level
+    :return: One row per non-empty cell and dataset
+    """
+    if zoom >= POINT_ZOOM:
+        clusters = points.assign(count=1, max_value=points['value'])
+    else:
+        size = cell_size(zoom)
+        cells = [points['dataset'], np.floor(points['lat'] / size).rename('row'), np.floor(points['lng'] / size).rename('col')]
+        clusters = points.groupby(cells, sort=False).agg(
+            lat=('lat', 'mean'),
+            lng=('lng', 'mean'),
+            count=('name', 'size'),
+            max_value=('value', 'max'),
+            severity=('severity', 'min'),
+            name=('name', 'first'),
+        ).reset_index(level='dataset').reset_index(drop=True)
+        clusters['name'] = clusters['name'].where(clusters['count'].eq(1), clusters['count'].astype(str) + ' stations')
+    clusters = clusters[['dataset', 'name', 'lat', 'lng', 'count', 'max_value', 'severity']].copy()
+    clusters['status'] = clusters['severity'].map(dict(enumerate(SEVERITY_LABELS)))
+    clusters['color'] = clusters['severity'].map(dict(enumerate(SEVERITY_COLORS)))
+    clusters['max_value'] = clusters['max_value'].round(2)
+    clusters['radius'] = (MIN_RADIUS_PIXELS + RADIUS_PIXELS_PER_SQRT_STATION * (np.sqrt(clusters['count']) - 1)).clip(upper=MAX_RADIUS_PIXELS).round(1)
+    return clusters
+
+
+def build_cluster_levels(points: pd.DataFrame) -> Dict[int, pd.DataFrame]:
+    """
+    Pre-computes the clusters of every zoom level from MIN_ZOOM to MAX_ZOOM.
+    """
+    return {zoom: cluster_points(points, zoom) for zoom in range(MIN_ZOOM, MAX_ZOOM + 1)}
+
+
+def viewport_bounds(lat: float, lng: float, zoom: int, width: int = 1200, height: int = 700) -> Tuple[float, float, float, float]:
+    """
+    Approximates the area a map of the given pixel size shows around a center.
+
+    :return: (south, west, north, east) in degrees
+    """
+    degrees_per_pixel = 360 / (TILE_PIXELS * 2 ** zoom)
+    half_lng = width / 2 * degrees_per_pixel
+    # Web Mercator stretches latitude by 1/cos(lat); it is near 1 over Thailand
+    half_lat = height / 2 * degrees_per_pixel * np.cos(np.radians(lat))
+    return lat - half_lat, lng - half_lng, lat + half_lat, lng + half_lng
+
+
+def visible_clusters(clusters: pd.DataFrame, bounds: Tuple[float, float, float, float], margin: float = 0.25) -> pd.DataFrame:
+    """
+    Keeps the clusters inside the bounds, widened by a fraction on every side.
+    """
+    south, west, north, east = bounds
+    pad_lat, pad_lng = (north - south) * margin, (east - west) * margin
+    inside = clusters['lat'].between(south - pad_lat, north + pad_lat) & clusters['lng'].between(west - pad_lng, east + pad_lng)
+    return clusters[inside]
@@ -0,0 +1,148 @@
+import os
+import re
+import logging
+import datetime
+import pandas as pd
+from typing import Dict, List, Optional
+from utils.markdown_writer import write_markdown_table
+from utils.output_manager import OutputManager, dataframe_hash
+
+logger = logging.getLogger(__name__)
+
+# Columns that may hold the grouping key for each shard level
+SHARD_KEY_COLUMNS = {
+    'province': ['province'],
+    'basin': ['basin_name', 'basin'],
+}
+
+# Reading columns summarised in each shard header, when present
+SUMMARY_COLUMNS = [
+    'waterlevel_msl',
+    'waterlevel_m',
+    'situation_level',
+    'rain_24h_value',
+    'rain_daily_value',
+    'rain_7days_value',
+    'storage_percent',
+    'storage',
+    'inflow',
+    'floodgate_height',
+]
+
+UNKNOWN_SHARD = 'unknown'
+
+
+def shard_filename(value) -> str:
+    """
+    Builds a filesystem-safe shard name, keeping Thai characters intact.
+
+    :param value: Grouping value (province or basin name)
+    :return: Filename stem for the shard
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return UNKNOWN_SHARD
+    name = re.sub(r'[\\/:*?"<>|\s]+', '_', str(value)).strip('_')
+    return name or UNKNOWN_SHARD
+
+
+def resolve_shard_column(df: pd.DataFrame, level: str) -> Optional[str]:
+    """
+    Finds the column used to group a DataFrame for a shard level.
+
+    :param df: DataFrame to shard
+    :param level: Shard level ('province' or 'basin')
+    :return: Column name, or None if the DataFrame has no such column
+    """
+    for col in SHARD_KEY_COLUMNS.get(level, []):
+        if col in df.columns:
+            return col
+    return None
+
+
+def summarize_shard(df: pd.DataFrame) -> List[str]:
+    """
+    Summarises record counts and reading extremes for a shard header.
+
+    :param df: Rows belonging to one shard
+    :return: Markdown bullet lines
+    """
+    lines = [f"- Records: {len(df)}"]
+    station_col = 'id' if 'id' in df.columns else 'name'
+    if station_col in df.columns:
+        lines.append(f"- Stations: {df[station_col].nunique()}")
+
+    for col in SUMMARY_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors='coerce')
+        if values.notna().sum() == 0:
+            continue
+        max_idx = values.idxmax()
+        min_idx = values.idxmin()
+        max_name = df.at[max_idx, 'name'] if 'name' in df.columns else max_idx
+        min_name = df.at[min_idx, 'name'] if 'name' in df.columns else min_idx
+        lines.append(
+            f"- {col}: max {values[max_idx]:g} ({max_name}), "
+            f"min {values[min_idx]:g} ({min_name}), mean {values.mean():.2f}"
+        )
+    return lines
+
+
+def write_markdown_shards(
+    data: pd.DataFrame,
+    base_filename: str,
+    levels: List[str],
+    output: OutputManager,
+    shard_dir: str = 'shards'
+) -> Dict[str, int]:
+    """
+    Splits a dataset into one Markdown document per province and/or basin.
+
+    Each shard starts with a short summary of counts and extremes so that a
+    retrieval chunk is self-describing. Shards are written through the output
+    manager, so each one is replaced atomically and only when its rows
+    changed. Shards of groups that disappeared are removed.
+
+    :param data: DataFrame to shard (usually a *_with_location table)
+    :param base_filename: Dataset name used for the shard directory
+    :param levels: Shard levels to write, e.g. ['province', 'basin']
+    :param output: Output manager to schedule the writes on
+    :param shard_dir: Shard root, relative to the output directory
+    :return: Number of shards per level
+    """
+    written = {}
+    generated_at = datetime.datetime.now()
+    for level in levels:
+        column = resolve_shard_column(data, level)
+        if column is None:
+            logger.warning("%s has no column for '%s' shards. Skipping.", base_filename, level)
+            continue
+
+        level_dir = os.path.join(shard_dir, base_filename, level)
+        shards = set()
+        for value, group in data.groupby(column, dropna=False, sort=True):
+            shard_name = shard_filename(value)
+            title_value = UNKNOWN_SHARD if shard_name == UNKNOWN_SHARD else value
+            filename = os.path.join(level_dir, f"{shard_name}.md")
+            shards.add(filename)
+
+            def write_shard(path: str, group=group, level=level, title_value=title_value) -> None:
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(f"# {base_filename.replace('_', ' ').title()} - {level.title()}: {title_value}\n\n")
+                    f.write(f"Generated on: {generated_at}\n\n")
+                    f.write('\n'.join(summarize_shard(group)) + '\n\n')
+                    write_markdown_table(group, f, drop_empty_columns=True)
+
+            output.submit(filename, write_shard, dataframe_hash(group))
+
+        # Remove shards of groups that are no longer present
+        existing_dir = os.path.join(output.output_dir, level_dir)
+        if os.path.isdir(existing_dir):
+            for entry in os.listdir(existing_dir):
+                filename = os.path.join(level_dir, entry)
+                if entry.endswith('.md') and filename not in shards:
+                    output.remove(filename)
+
+        written[level] = len(shards)
+        logger.info("Scheduled %s %s shards for %s in %s", len(shards), level, base_filename, existing_dir)
+    return written
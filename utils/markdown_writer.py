@@ -0,0 +1,73 @@
+import pandas as pd
+from typing import IO, List
+
+
+def _format_cell(value) -> str:
+    """
+    Formats a single table cell without any alignment padding.
+
+    :param value: Cell value
+    :return: Markdown-safe string ('' for missing values)
+    """
+    if value is None:
+        return ''
+    try:
+        if pd.isna(value):
+            return ''
+    except (TypeError, ValueError):
+        pass
+    text = str(value)
+    if '|' in text:
+        text = text.replace('|', '\\|')
+    if '\n' in text or '\r' in text:
+        text = text.replace('\r', ' ').replace('\n', ' ')
+    return text
+
+
+def prune_empty_columns(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drops columns in which every value is missing.
+
+    :param data: DataFrame to prune
+    :return: DataFrame without all-NaN columns
+    """
+    return data.dropna(axis=1, how='all')
+
+
+def write_markdown_table(
+    data: pd.DataFrame,
+    f: IO[str],
+    chunk_size: int = 1000,
+    drop_empty_columns: bool = False
+) -> int:
+    """
+    Streams a DataFrame to an open file as a compact Markdown table.
+
+    Unlike DataFrame.to_markdown(), cells are not padded to the column width
+    and the table is written chunk by chunk instead of being built in memory.
+
+    :param data: DataFrame to write
+    :param f: Text file object opened for writing
+    :param chunk_size: Number of rows formatted and written per chunk
+    :param drop_empty_columns: Drop columns that contain only missing values
+    :return: Number of data rows written
+    """
+    if drop_empty_columns:
+        data = prune_empty_columns(data)
+
+    columns = [_format_cell(col) for col in data.columns]
+    f.write('| ' + ' | '.join(columns) + ' |\n')
+    f.write('|' + '|'.join(['---'] * len(columns)) + '|\n')
+
+    rows_written = 0
+    for start in range(0, len(data), chunk_size):
+        chunk = data.iloc[start:start + chunk_size]
+        cells: List[List[str]] = [
+            [_format_cell(value) for value in chunk.iloc[:, i].tolist()]
+            for i in range(chunk.shape[1])
+        ]
+        lines = ['| ' + ' | '.join(row) + ' |\n' for row in zip(*cells)]
+        f.write(''.join(lines))
+        rows_written += len(lines)
+
+    return rows_written
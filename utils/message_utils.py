@@ -2,6 +2,8 @@ import re
 import html
 import streamlit as st
 
+CHAT_PAGE_SIZE = 20  # messages shown at once; "load earlier" adds another page
+
 def format_message(text):
     """
     This function is used to format the messages in the chatbot UI.
@@ -22,45 +24,91 @@ def format_message(text):
 
     return formatted_text
 
-def message_func(text, user_icon_base64, assistant_icon_base64, is_user=False, model="Claude-3 Haiku"):
+def message_html(text, user_icon, assistant_icon, is_user=False):
     """
-    This function is used to display the messages in the chatbot UI.
+    This function is used to build the HTML of a chat message bubble.
 
     Parameters:
     text (str): The text to be displayed.
+    user_icon (str): URL of the user avatar image.
+    assistant_icon (str): URL of the assistant avatar image.
     is_user (bool): Whether the message is from the user or not.
-    user_icon_base64 (str): Base64 encoded user avatar image.
-    assistant_icon_base64 (str): Base64 encoded assistant avatar image.
     """
-    avatar_base64 = user_icon_base64 if is_user else assistant_icon_base64
+    avatar_src = user_icon if is_user else assistant_icon
 
+    # Every line starts at column 0: Markdown renders lines indented by four
+    # or more spaces after a blank line as a code block, not as HTML
     if is_user:
         message_alignment = "flex-end"
         message_bg_color = "#D7E8FA"  # Light blue for user messages
         message_text_color = "#000000"  # Black text for user messages
         avatar_class = "user-avatar"
-        st.write(
-            f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: {message_alignment};">
-                    <div style="background: {message_bg_color}; color: {message_text_color}; border-radius: 20px; padding: 10px; margin-right: 5px; max-width: 75%; font-size: 14px;">
-                        {text} \n </div>
-                    <img src="{avatar_base64}" class="{avatar_class}" alt="avatar" style="width: 40px; height: 40px;" />
-                </div>
-            """,
-            unsafe_allow_html=True,
+        return (
+            f'<div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: {message_alignment};">\n'
+            f'<div style="background: {message_bg_color}; color: {message_text_color}; border-radius: 20px; padding: 10px; margin-right: 5px; max-width: 75%; font-size: 14px;">\n'
+            f'{text}\n'
+            f'</div>\n'
+            f'<img src="{avatar_src}" class="{avatar_class}" alt="avatar" style="width: 40px; height: 40px;" />\n'
+            f'</div>\n'
         )
     else:
         message_alignment = "flex-start"
         message_bg_color = "#FFFFFF"  # White for assistant messages
         message_text_color = "#000000"  # Black text for assistant messages
         avatar_class = "bot-avatar"
-        st.write(
-            f"""
-                <div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: {message_alignment};">
-                    <img src="{avatar_base64}" class="{avatar_class}" alt="avatar" style="width: 40px; height: 40px;" />
-                    <div style="background: {message_bg_color}; color: {message_text_color}; border-radius: 20px; padding: 10px; margin-left: 5px; max-width: 75%; font-size: 14px; border: 1px solid #E5E8E8;">
-                        {text} \n </div>
-                </div>
-            """,
-            unsafe_allow_html=True,
+        return (
+            f'<div style="display: flex; align-items: center; margin-bottom: 10px; justify-content: {message_alignment};">\n'
+            f'<img src="{avatar_src}" class="{avatar_class}" alt="avatar" style="width: 40px; height: 40px;" />\n'
+            f'<div style="background: {message_bg_color}; color: {message_text_color}; border-radius: 20px; padding: 10px; margin-left: 5px; max-width: 75%; font-size: 14px; border: 1px solid #E5E8E8;">\n'
+            f'{text}\n'
+            f'</div>\n'
+            f'</div>\n'
         )
+
+def message_func(text, user_icon, assistant_icon, is_user=False, model="Claude-3 Haiku"):
+    """
+    This function is used to display the messages in the chatbot UI.
+
+    Parameters:
+    text (str): The text to be displayed.
+    is_user (bool): Whether the message is from the user or not.
+    user_icon (str): URL of the user avatar image.
+    assistant_icon (str): URL of the assistant avatar image.
+    """
+    st.write(
+        message_html(text, user_icon, assistant_icon, is_user=is_user),
+        unsafe_allow_html=True,
+    )
+
+def cached_message_html(message, user_icon, assistant_icon):
+    """
+    This function is used to build a chat message's bubble HTML only once.
+
+    The HTML is stored on the message under 'html', so later reruns reuse it.
+
+    Parameters:
+    message (dict): Chat message with 'role' and 'content'.
+    user_icon (str): URL of the user avatar image.
+    assistant_icon (str): URL of the assistant avatar image.
+    """
+    if "html" not in message:
+        message["html"] = message_html(message["content"], user_icon, assistant_icon, is_user=message["role"] == "user")
+    return message["html"]
+
+def render_chat_history(messages, user_icon, assistant_icon, visible=CHAT_PAGE_SIZE):
+    """
+    This function is used to display the most recent chat messages.
+
+    The bubbles are sent as a single element, so a rerun costs the same
+    however long the conversation is.
+
+    Parameters:
+    messages (list): Chat messages with 'role' and 'content'.
+    user_icon (str): URL of the user avatar image.
+    assistant_icon (str): URL of the assistant avatar image.
+    visible (int): Number of most recent messages to show.
+    """
+    st.markdown(
+        "".join(cached_message_html(message, user_icon, assistant_icon) for message in messages[-visible:]),
+        unsafe_allow_html=True,
+    )
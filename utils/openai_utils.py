@@ -1,18 +1,230 @@
 import openai
 import time
+import uuid
+import threading
 import streamlit as st
 
 from openai import OpenAI
+from utils.rate_limiter import FairRateLimiter, RateLimitedClient, RateLimitTimeout
+from utils.role_description_prompts import FLOOD_ASSISTANT_CONTEXT_PROMPT, THREAD_SUMMARY_PROMPT
+from utils.station_cards import BYTES_PER_TOKEN
 
 api_key = st.secrets["OPENAI_API_KEY"]
-client = OpenAI(api_key=api_key)
+
+RUN_TIMEOUT = 120  # seconds
+RATE_LIMIT_TIMEOUT = 30  # seconds a request may queue for the rate limiter
+ERROR_RESPONSE = "Error generating response. Please try again."
+BUSY_RESPONSE = "The assistant is busy right now. Please try again in a moment."
+
+# Thread context budget: every run reads at most RUN_CONTEXT_MESSAGES messages,
+# and once a thread exceeds MAX_THREAD_MESSAGES or MAX_THREAD_TOKENS its older
+# turns are summarised into a fresh thread that keeps the last few turns verbatim
+RUN_CONTEXT_MESSAGES = st.secrets.get("RUN_CONTEXT_MESSAGES", 12)
+MAX_THREAD_MESSAGES = st.secrets.get("MAX_THREAD_MESSAGES", 24)
+MAX_THREAD_TOKENS = st.secrets.get("MAX_THREAD_TOKENS", 6000)
+KEEP_RECENT_MESSAGES = 4
+SUMMARY_MODEL = "gpt-4o-mini"
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+
+# Shared by every session of the process: modules are imported once, so all
+# sessions draw from the same token bucket
+rate_limiter = FairRateLimiter(
+    rate=st.secrets.get("OPENAI_REQUESTS_PER_MINUTE", 60) / 60,
+    burst=st.secrets.get("OPENAI_REQUEST_BURST", 10))
+
+# Session on whose behalf the current worker thread calls the API
+_caller = threading.local()
+
+# function: identify the browser session for fair scheduling
+def session_key():
+    return st.session_state.setdefault('session_id', uuid.uuid4().hex)
+
+# function: wait for the shared rate limiter, returning False if the wait timed out
+def acquire_rate_limit(session_id=None):
+    session_id = session_id or getattr(_caller, 'session_id', None)
+    started_at = time.perf_counter()
+    acquired = rate_limiter.acquire(session_id, timeout=RATE_LIMIT_TIMEOUT)
+    waited = time.perf_counter() - started_at
+    if waited > 0.1:
+        print(f"Waited {waited:.2f}s for the rate limiter (queue depth {rate_limiter.queue_depth()})")
+    return acquired
+
+# Every API call, from thread creation to each polling check, takes a token
+client = RateLimitedClient(OpenAI(api_key=api_key), acquire_rate_limit)
+
+# function: estimate the token count of a message
+def estimate_tokens(text):
+    return len(text.encode('utf-8')) // BYTES_PER_TOKEN + 1
+
+# function: describe a thread by its id, message count and estimated tokens
+def new_thread_state(thread_id, messages=0, tokens=0, rotations=0):
+    return {'id': thread_id, 'messages': messages, 'tokens': tokens, 'rotations': rotations}
+
+# function: pick the earlier turns of a session that a new thread should start with
+def thread_seed(messages):
+    """
+    Turns answered from the answer cache or by another session's job never
+    reach a thread of the session, so its first thread is seeded with them.
+    Failed answers are left out together with their question, and only the
+    last RUN_CONTEXT_MESSAGES messages are kept: runs read no more than that.
+    """
+    seed = []
+    for message in messages:
+        if message['role'] == 'assistant' and message['content'] in (ERROR_RESPONSE, BUSY_RESPONSE):
+            if seed and seed[-1]['role'] == 'user':
+                seed.pop()
+            continue
+        seed.append({'role': message['role'], 'content': message['content']})
+    return seed[-RUN_CONTEXT_MESSAGES:]
+
+# function: check whether a thread has outgrown its context budget
+def thread_over_budget(thread):
+    return thread['messages'] >= MAX_THREAD_MESSAGES or thread['tokens'] >= MAX_THREAD_TOKENS
+
+# function: summarise conversation turns into a compact memory note
+def summarize_turns(turns):
+    transcript = "\n\n".join(f"{role}: {text}" for role, text in turns)
+    completion = client.chat.completions.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": THREAD_SUMMARY_PROMPT},
+            {"role": "user", "content": transcript},
+        ])
+    return completion.choices[0].message.content
+
+def rotate_thread(thread):
+    """
+    Replace a thread that exceeded its budget with a fresh, compact one.
+
+    The older turns, including any summary that seeded the thread, are
+    summarised into a memory message. The new thread starts with that message
+    followed by the last KEEP_RECENT_MESSAGES messages verbatim, so the
+    summary rolls forward from thread to thread.
+    """
+    messages = client.beta.threads.messages.list(thread_id=thread['id'], order='asc', limit=100)
+    turns = [(m.role, m.content[0].text.value) for m in messages.data if m.content and m.content[0].type == 'text']
+    older, recent = turns[:-KEEP_RECENT_MESSAGES], turns[-KEEP_RECENT_MESSAGES:]
+    seed = [{'role': role, 'content': text} for role, text in recent]
+    if older:
+        seed.insert(0, {'role': 'assistant', 'content': SUMMARY_PREFIX + summarize_turns(older)})
+    new_thread = client.beta.threads.create(messages=seed)
+    print(f"Thread {thread['id']} exceeded its budget ({thread['messages']} messages, ~{thread['tokens']} tokens); "
+          f"continuing in {new_thread.id}")
+    return new_thread_state(new_thread.id, len(seed), sum(estimate_tokens(m['content']) for m in seed), thread['rotations'] + 1)
 
 # function: wait on the run to complete
-def wait_on_run(run, thread_id):
+def wait_on_run(run, thread_id, timeout=RUN_TIMEOUT, initial_delay=0.5, max_delay=4.0):
+    """
+    Poll a run until it leaves the queued/in_progress states.
+
+    The polling interval starts at initial_delay and grows by half after every
+    check up to max_delay. Raises TimeoutError if the run takes longer than timeout.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
     while run.status == 'queued' or run.status == 'in_progress':
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Run {run.id} did not complete within {timeout}s")
+        time.sleep(delay)
+        delay = min(delay * 1.5, max_delay)
         run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-        # time.sleep(4)
-        # print(run.status)
+    return run
+
+# function: answer the function calls of a run that requires action
+def tool_outputs(run, tools, metrics=None):
+    outputs = []
+    for tool_call in run.required_action.submit_tool_outputs.tool_calls:
+        if tools is None:
+            output = '{"error": "Data tools are not available"}'
+        else:
+            output = tools.call(tool_call.function.name, tool_call.function.arguments)
+        print(f"Tool call {tool_call.function.name}({tool_call.function.arguments})")
+        outputs.append({'tool_call_id': tool_call.id, 'output': output})
+    if metrics is not None:
+        metrics['tool_calls'] = metrics.get('tool_calls', 0) + len(outputs)
+    return outputs
+
+# function: stream a run, passing the accumulated text to on_text after every delta
+def stream_run(thread_id, assistant_id, on_text=None, metrics=None, tools=None):
+    text = ""
+    stream_manager = client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        truncation_strategy={'type': 'last_messages', 'last_messages': RUN_CONTEXT_MESSAGES})
+    while True:
+        with stream_manager as stream:
+            try:
+                for delta in stream.text_deltas:
+                    if not text and metrics is not None:
+                        metrics['time_to_first_token'] = time.perf_counter() - metrics['started_at']
+                    text += delta
+                    if on_text is not None:
+                        on_text(text)
+            finally:
+                # Remember the run, so a fallback can continue it if the stream breaks
+                if metrics is not None and stream.current_run is not None:
+                    metrics['run_id'] = stream.current_run.id
+            run = stream.get_final_run()
+        if run.status != 'requires_action':
+            break
+        # The run paused for function calls; answer them and stream the continuation
+        stream_manager = client.beta.threads.runs.submit_tool_outputs_stream(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs(run, tools, metrics))
+    if run.status != 'completed':
+        raise RuntimeError(f"Run {run.id} ended with status {run.status}")
+    if run.usage is not None and metrics is not None:
+        metrics['prompt_tokens'] = run.usage.prompt_tokens
+    return text
+
+# function: find the run that answers a message, if one was already created
+def existing_run(thread_id, message, run_id=None):
+    if run_id is not None:
+        return client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+    # The stream may have created a run before failing without telling us its id
+    runs = client.beta.threads.runs.list(thread_id=thread_id, order='desc', limit=1).data
+    if runs and runs[0].created_at >= message.created_at:
+        return runs[0]
+    return None
+
+# function: poll a run until it completes (fallback when streaming fails)
+def poll_run(thread_id, assistant_id, message, tools=None, run_id=None):
+    # A thread allows one active run at a time, so continue the run the stream
+    # already created; only start a new one if there is none or it has ended unsuccessfully
+    run = existing_run(thread_id, message, run_id)
+    if run is None or run.status not in ('queued', 'in_progress', 'requires_action', 'completed'):
+        run = client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=assistant_id,
+            truncation_strategy={'type': 'last_messages', 'last_messages': RUN_CONTEXT_MESSAGES})
+    run = wait_on_run(run, thread_id)
+    while run.status == 'requires_action':
+        run = client.beta.threads.runs.submit_tool_outputs(
+            thread_id=thread_id,
+            run_id=run.id,
+            tool_outputs=tool_outputs(run, tools))
+        run = wait_on_run(run, thread_id)
+    messages = client.beta.threads.messages.list(
+        thread_id=thread_id,
+        order='asc',
+        after=message.id)
+    return display_thread_messages(messages)
+
+# function: start timing a response on the current thread
+def start_metrics(mode):
+    return {'started_at': time.perf_counter(), 'cpu_started_at': time.thread_time(), 'mode': mode}
+
+# function: finish timing a response; must run on the thread that started it
+def finish_metrics(metrics):
+    metrics['total_time'] = time.perf_counter() - metrics.pop('started_at')
+    metrics['cpu_time'] = time.thread_time() - metrics.pop('cpu_started_at')
+    return metrics
+
+# function: record the latency and CPU cost of a response in the session
+def record_metrics(metrics):
+    st.session_state.setdefault('response_metrics', []).append(metrics)
+    print(f"Response metrics: {metrics}")
 
 # function: display the response
 def display_thread_messages(messages):
@@ -23,37 +235,91 @@ def display_thread_messages(messages):
     # Join the list into a single string separated by newlines
     return "\n\n".join(message_texts)
 
-def generate_response(user_message, assistant_id):
-    if 'thread_id' not in st.session_state:
-        # initiate a new thread if one does not exist in session state
-        thread = client.beta.threads.create()
-        st.session_state['thread_id'] = thread.id
-        print(f"New thread created: {thread.id}")
-    else:
-        print(f"Using existing thread: {st.session_state['thread_id']}")
-    thread_id = st.session_state['thread_id']
+def generate_response(user_message, assistant_id, thread, session_id, on_text=None, tools=None, history=None):
+    """
+    Generate the assistant's answer to user_message on the session's thread.
+
+    Runs on a background worker, so it takes the session's values explicitly
+    and never calls Streamlit. thread is the session's thread state from
+    new_thread_state; a new thread is created when it is None, starting with
+    the earlier turns in history (see thread_seed), and a thread over its
+    context budget is replaced by a summarised one. The run is
+    streamed; on_text, if given, receives the accumulated answer after every
+    token. If streaming fails before any text arrived, the run the stream
+    created is polled instead, or a new one if there is none. Function calls of the run are answered by tools, a
+    DataTools instance.
 
+    Every API call waits for the shared rate limiter on behalf of session_id;
+    if one waits too long, the answer is the busy response.
+
+    Returns a dict with 'response', the updated 'thread', and 'metrics' or 'error'.
+    """
+    _caller.session_id = session_id
     try:
+        if thread is None:
+            seed = history or []
+            created = client.beta.threads.create(messages=seed) if seed else client.beta.threads.create()
+            thread = new_thread_state(created.id, len(seed), sum(estimate_tokens(m['content']) for m in seed))
+            print(f"New thread created: {thread['id']} ({len(seed)} earlier messages)")
+        elif thread_over_budget(thread):
+            try:
+                thread = rotate_thread(thread)
+            except Exception as e:
+                # Runs are truncated anyway, so carrying on in the old thread is safe
+                print(f"Summarising thread {thread['id']} failed ({e}), keeping it")
+        else:
+            print(f"Using existing thread: {thread['id']}")
+        thread = dict(thread)
+        thread_id = thread['id']
+
         # add user_message to the thread
         message = client.beta.threads.messages.create(
             thread_id=thread_id,
             role='user',
             content=user_message)
 
-        # run a thread using required assistant
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id)
-
-        with st.spinner("Generating answer..."):
-            wait_on_run(run, thread_id)
+        metrics = start_metrics('stream')
+        metrics['thread_messages'] = thread['messages'] + 1
+        metrics['thread_tokens'] = thread['tokens'] + estimate_tokens(user_message)
+        try:
+            response = stream_run(thread_id, assistant_id, on_text, metrics, tools)
+        except Exception as e:
+            if 'time_to_first_token' in metrics or isinstance(e, RateLimitTimeout):
+                raise
+            print(f"Streaming failed ({e}), falling back to polling")
+            metrics['mode'] = 'poll'
+            response = poll_run(thread_id, assistant_id, message, tools, metrics.pop('run_id', None))
+            metrics['time_to_first_token'] = time.perf_counter() - metrics['started_at']
+        thread['messages'] += 2
+        thread['tokens'] = metrics['thread_tokens'] + estimate_tokens(response)
+        return {'response': response, 'thread': thread, 'metrics': finish_metrics(metrics)}
+    except RateLimitTimeout:
+        return {'response': BUSY_RESPONSE, 'thread': thread}
+    except Exception as e:
+        return {'response': ERROR_RESPONSE, 'thread': thread, 'error': str(e)}
 
-        messages = client.beta.threads.messages.list(
-            thread_id=thread_id,
-            order='asc',
-            after=message.id)
+def generate_local_response(user_message, index, session_id, model="gpt-4o", top_k=5):
+    """
+    Answer using context retrieved from a local index instead of Assistants file_search.
 
-        return display_thread_messages(messages)
+    The top_k most similar chunks are injected into the system prompt and the
+    answer is produced with a single chat completion. Like generate_response,
+    it runs on a background worker and returns a result dict. The query
+    embedding, if the index uses OpenAI embeddings, and the completion each
+    take a rate-limiter token.
+    """
+    _caller.session_id = session_id
+    try:
+        metrics = start_metrics('local')
+        context = index.context(user_message, top_k)
+        completion = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": FLOOD_ASSISTANT_CONTEXT_PROMPT.format(context=context)},
+                {"role": "user", "content": user_message},
+            ])
+        return {'response': completion.choices[0].message.content, 'metrics': finish_metrics(metrics)}
+    except RateLimitTimeout:
+        return {'response': BUSY_RESPONSE}
     except Exception as e:
-        st.error(f"An error occurred: {str(e)}")
-        return "Error generating response. Please try again."
\ No newline at end of file
+        return {'response': ERROR_RESPONSE, 'error': str(e)}
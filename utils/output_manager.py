@@ -0,0 +1,249 @@
+import os
+import json
+import datetime
+import hashlib
+import logging
+import tempfile
+import threading
+import pandas as pd
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional
+from utils.pipeline_metrics import PipelineMetrics, dataset_of
+
+logger = logging.getLogger(__name__)
+
+# Columns stamped with the run time; they change on every run and are
+# ignored when deciding whether a file's content has changed.
+VOLATILE_COLUMN_PREFIXES = ('collected_at',)
+
+MANIFEST_FILENAME = '.output_manifest.json'
+SNAPSHOT_FILENAME = 'snapshot.json'
+
+
+def dataframe_hash(data: pd.DataFrame, ignore_prefixes=VOLATILE_COLUMN_PREFIXES) -> str:
+    """
+    Computes a content hash of a DataFrame, ignoring run-timestamp columns.
+
+    :param data: DataFrame to hash
+    :param ignore_prefixes: Column name prefixes excluded from the hash
+    :return: Hex digest
+    """
+    columns = [col for col in data.columns if not str(col).startswith(ignore_prefixes)]
+    digest = hashlib.sha256()
+    digest.update(repr(columns).encode('utf-8'))
+    if columns:
+        digest.update(pd.util.hash_pandas_object(data[columns], index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def atomic_write(path: str, write_fn: Callable[[str], None]) -> None:
+    """
+    Writes a file via a temporary file in the same directory, then renames it.
+
+    Readers never observe a half-written file: they see either the previous
+    version or the complete new one.
+
+    :param path: Final file path
+    :param write_fn: Callable that writes the content to the path it is given
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    stem, ext = os.path.splitext(os.path.basename(path))
+    # Keep the real extension so writers such as to_excel pick the right engine
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{stem}.', suffix=f'.tmp{ext}', dir=directory)
+    os.close(fd)
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_snapshot(output_dir: str = './output') -> Dict[str, str]:
+    """
+    Reads the snapshot descriptor written at the end of the last pipeline run.
+
+    :param output_dir: Output directory of the pipeline
+    :return: Snapshot descriptor, or an empty dict if no run has completed yet
+    """
+    try:
+        with open(os.path.join(output_dir, SNAPSHOT_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class OutputManager:
+    """
+    Writes output files concurrently, atomically and only when changed.
+
+    Each submitted file carries a content hash. If the hash matches the one
+    recorded in the manifest from a previous run and the file still exists,
+    the write is skipped.
+    """
+
+    def __init__(self, output_dir: str = './output', max_workers: int = 4, metrics: Optional[PipelineMetrics] = None):
+        self.output_dir = output_dir
+        self.metrics = metrics
+        self.manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='output')
+        self._lock = threading.Lock()
+        self._futures: List[Future] = []
+        self._manifest = self._load_manifest()
+        self.stats = {'written': 0, 'skipped': 0, 'failed': 0}
+
+    def _load_manifest(self) -> Dict[str, str]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self) -> None:
+        with self._lock:
+            manifest = dict(self._manifest)
+
+        def write_manifest(tmp_path: str) -> None:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, sort_keys=True)
+
+        atomic_write(self.manifest_path, write_manifest)
+
+    def is_unchanged(self, filename: str, content_hash: str) -> bool:
+        """
+        Checks whether a file already holds content with the given hash.
+
+        :param filename: File name relative to the output directory
+        :param content_hash: Hash of the content about to be written
+        :return: True if the write can be skipped
+        """
+        path = os.path.join(self.output_dir, filename)
+        with self._lock:
+            recorded = self._manifest.get(filename)
+        return recorded == content_hash and os.path.exists(path)
+
+    def _write(self, filename: str, write_fn: Callable[[str], None], content_hash: Optional[str]) -> bool:
+        path = os.path.join(self.output_dir, filename)
+        timing = self.metrics.stage('write', dataset_of(filename)) if self.metrics is not None else nullcontext()
+        try:
+            with timing:
+                atomic_write(path, write_fn)
+        except Exception as e:
+            logger.error("Error writing %s: %s", path, e)
+            with self._lock:
+                self.stats['failed'] += 1
+            self._count(filename, 'write_failures')
+            return False
+        self._count(filename, 'files_written')
+        with self._lock:
+            if content_hash is not None:
+                self._manifest[filename] = content_hash
+            self.stats['written'] += 1
+        logger.info("Data saved to %s", path)
+        return True
+
+    def _count(self, filename: str, counter: str) -> None:
+        if self.metrics is not None:
+            self.metrics.count(counter, dataset=dataset_of(filename))
+
+    def submit(self, filename: str, write_fn: Callable[[str], None], content_hash: Optional[str] = None) -> Optional[Future]:
+        """
+        Schedules an atomic write on the thread pool unless content is unchanged.
+
+        :param filename: File name relative to the output directory
+        :param write_fn: Callable that writes the content to the path it is given
+        :param content_hash: Hash of the content; None always writes
+        :return: Future of the write, or None if it was skipped
+        """
+        if content_hash is not None and self.is_unchanged(filename, content_hash):
+            logger.info("Skipping %s: content unchanged", filename)
+            with self._lock:
+                self.stats['skipped'] += 1
+            self._count(filename, 'cache_hits')
+            return None
+        future = self._executor.submit(self._write, filename, write_fn, content_hash)
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def remove(self, filename: str) -> None:
+        """
+        Deletes an output file that is no longer produced, and forgets its hash.
+
+        :param filename: File name relative to the output directory
+        """
+        path = os.path.join(self.output_dir, filename)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error("Error removing %s: %s", path, e)
+            return
+        with self._lock:
+            self._manifest.pop(filename, None)
+        logger.info("Removed %s", path)
+
+    def wait(self) -> Dict[str, int]:
+        """
+        Blocks until all submitted writes have finished and saves the manifest.
+
+        :return: Counts of written, skipped and failed files
+        """
+        while True:
+            with self._lock:
+                pending = self._futures
+                self._futures = []
+            if not pending:
+                break
+            for future in pending:
+                future.result()
+        self._save_manifest()
+        logger.info("Output writes finished: %s", self.stats)
+        return dict(self.stats)
+
+    def snapshot_id(self) -> str:
+        """
+        Identifies the current data snapshot by the content hashes of all outputs.
+
+        The id only changes when some output's content changed, so consumers
+        keyed on it (e.g. answer caches) survive runs that brought no new data.
+
+        :return: Hex digest
+        """
+        with self._lock:
+            manifest = json.dumps(self._manifest, sort_keys=True)
+        return hashlib.sha256(manifest.encode('utf-8')).hexdigest()[:16]
+
+    def write_snapshot(self) -> Dict[str, str]:
+        """
+        Waits for pending writes and publishes the snapshot descriptor.
+
+        :return: Snapshot descriptor
+        """
+        self.wait()
+        snapshot = {
+            'snapshot_id': self.snapshot_id(),
+            'completed_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+
+        def write_descriptor(tmp_path: str) -> None:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, indent=2)
+
+        atomic_write(os.path.join(self.output_dir, SNAPSHOT_FILENAME), write_descriptor)
+        logger.info("Published data snapshot %s", snapshot['snapshot_id'])
+        return snapshot
+
+    def close(self) -> Dict[str, int]:
+        """
+        Waits for pending writes and shuts down the thread pool.
+
+        :return: Counts of written, skipped and failed files
+        """
+        stats = self.wait()
+        self._executor.shutdown(wait=True)
+        return stats
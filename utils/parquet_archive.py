@@ -0,0 +1,183 @@
+import os
+import uuid
+import logging
+import argparse
+import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import Dict, List, Optional
+from utils.history_store import DATASET_SCHEMAS, observed_datetime, station_key
+from utils.output_manager import atomic_write
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = './archive'
+
+COMPACTED_FILENAME = 'data.parquet'
+ROW_GROUP_SIZE = 50000
+
+# Partition columns are encoded in the directory names, never in the files
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+
+
+def _normalize(data: pd.DataFrame, dataset: str) -> pd.DataFrame:
+    """
+    Casts a *_data table to a schema that is stable from one run to the next.
+
+    API fields flip between int, float, str and None across polls, which would
+    give each run's file a different Parquet schema. The key columns are typed
+    like the history store (station_id, observed_at, value) and every raw
+    field is kept as a string.
+
+    :param data: DataFrame returned by the matching process_* function
+    :param dataset: Dataset name, a key of DATASET_SCHEMAS
+    :return: Normalised frame, without rows lacking a station or datetime
+    """
+    schema = DATASET_SCHEMAS[dataset]
+    station = data[schema['station']]
+    observed_at = observed_datetime(dataset, data)
+
+    normalized = pd.DataFrame({
+        'station_id': station.map(station_key).astype('string'),
+        'observed_at': observed_at,
+        'value': pd.to_numeric(data[schema['value']], errors='coerce') if schema['value'] in data.columns else float('nan'),
+    }, index=data.index)
+    for col in data.columns:
+        if col == 'collected_at':
+            normalized[col] = pd.to_datetime(data[col])
+        else:
+            normalized[col] = data[col].astype('string')
+    return normalized[station.notna() & observed_at.notna()]
+
+
+def _partition_dir(root: str, dataset: str, date: str) -> str:
+    return os.path.join(root, f'dataset={dataset}', f'date={date}')
+
+
+def write_run(data: pd.DataFrame, dataset: str, root: str = DEFAULT_ARCHIVE_DIR, run_id: Optional[str] = None) -> int:
+    """
+    Archives one run's observations as Parquet files partitioned by dataset and date.
+
+    Each run adds a small part-<run_id>.parquet file per observation date;
+    compact() later merges them into one file per day.
+
+    :param data: DataFrame returned by the matching process_* function
+    :param dataset: Dataset name, a key of DATASET_SCHEMAS
+    :param root: Archive root directory
+    :param run_id: Identifier used in the part file names; random if omitted
+    :return: Number of rows archived
+    """
+    run_id = run_id or f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    if data.empty or DATASET_SCHEMAS[dataset]['station'] not in data.columns:
+        return 0
+    frame = _normalize(data, dataset)
+
+    rows = 0
+    for date, part in frame.groupby(frame['observed_at'].dt.strftime('%Y-%m-%d')):
+        table = pa.Table.from_pandas(part, preserve_index=False)
+        path = os.path.join(_partition_dir(root, dataset, date), f'part-{run_id}.parquet')
+        atomic_write(path, lambda tmp_path: pq.write_table(table, tmp_path, compression='zstd'))
+        rows += len(part)
+    logger.info("Archived %s %s rows to %s", rows, dataset, root)
+    return rows
+
+
+def compact(root: str = DEFAULT_ARCHIVE_DIR, datasets: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Merges the per-run part files of each date partition into one sorted daily file.
+
+    Duplicate polls of the same reading are dropped, keeping the latest one.
+    Rows are sorted by station id and observation time, so the row group
+    statistics let readers skip data for stations they do not ask for.
+
+    :param root: Archive root directory
+    :param datasets: Datasets to compact; all of them if omitted
+    :return: Number of partitions compacted per dataset
+    """
+    compacted = {}
+    for dataset in datasets or list(DATASET_SCHEMAS):
+        dataset_dir = os.path.join(root, f'dataset={dataset}')
+        if not os.path.isdir(dataset_dir):
+            continue
+        count = 0
+        for partition in sorted(os.listdir(dataset_dir)):
+            partition_dir = os.path.join(dataset_dir, partition)
+            parts = sorted(f for f in os.listdir(partition_dir) if f.startswith('part-') and f.endswith('.parquet'))
+            if not parts:
+                continue
+            sources = parts + ([COMPACTED_FILENAME] if os.path.exists(os.path.join(partition_dir, COMPACTED_FILENAME)) else [])
+            tables = [pq.read_table(os.path.join(partition_dir, f)) for f in sources]
+            merged = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+
+            key = [col for col in ['station_id', 'observed_at', 'type'] if col in merged.columns]
+            if 'collected_at' in merged.columns:
+                merged = merged.sort_values('collected_at')
+            merged = merged.drop_duplicates(subset=key, keep='last')
+            merged = merged.sort_values(['station_id', 'observed_at'], kind='stable')
+
+            table = pa.Table.from_pandas(merged, preserve_index=False)
+            atomic_write(
+                os.path.join(partition_dir, COMPACTED_FILENAME),
+                lambda tmp_path: pq.write_table(table, tmp_path, compression='zstd', row_group_size=ROW_GROUP_SIZE)
+            )
+            for f in parts:
+                os.remove(os.path.join(partition_dir, f))
+            count += 1
+        compacted[dataset] = count
+        logger.info("Compacted %s %s partitions in %s", count, dataset, root)
+    return compacted
+
+
+def read_archive(
+    dataset: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    station_ids: Optional[List] = None,
+    columns: Optional[List[str]] = None,
+    root: str = DEFAULT_ARCHIVE_DIR
+) -> pd.DataFrame:
+    """
+    Reads archived observations, pruning date partitions and pushing filters down.
+
+    :param dataset: Dataset name, a key of DATASET_SCHEMAS
+    :param start_date: First date to read, 'YYYY-MM-DD', inclusive
+    :param end_date: Last date to read, 'YYYY-MM-DD', inclusive
+    :param station_ids: Only read these stations (dam names for dams)
+    :param columns: Only read these columns
+    :param root: Archive root directory
+    :return: Matching observations
+    """
+    dataset_dir = os.path.join(root, f'dataset={dataset}')
+    if not os.path.isdir(dataset_dir):
+        return pd.DataFrame()
+    archive = ds.dataset(dataset_dir, format='parquet', partitioning=PARTITIONING)
+    # Columns differ between days (e.g. dam series), so read with the union of all file schemas
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in archive.get_fragments()] + [PARTITIONING.schema],
+        promote_options='permissive'
+    )
+    archive = ds.dataset(dataset_dir, schema=schema, format='parquet', partitioning=PARTITIONING)
+
+    expression = None
+    conditions = []
+    if start_date:
+        conditions.append(ds.field('date') >= start_date)
+    if end_date:
+        conditions.append(ds.field('date') <= end_date)
+    if station_ids is not None:
+        conditions.append(ds.field('station_id').isin([station_key(s) for s in station_ids]))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return archive.to_table(columns=columns, filter=expression).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the Parquet observation archive into daily files.")
+    parser.add_argument("--root", default=DEFAULT_ARCHIVE_DIR, help="Archive root directory")
+    parser.add_argument("--dataset", nargs="+", choices=list(DATASET_SCHEMAS), help="Datasets to compact (default: all)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
+    print(compact(args.root, args.dataset))
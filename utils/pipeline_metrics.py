@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import datetime
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+DEFAULT_METRICS_DIR = './metrics'
+PROMETHEUS_FILENAME = 'thaiwater_pipeline.prom'
+METRIC_PREFIX = 'thaiwater_pipeline'
+
+DATASETS = ('water_level', 'water_gate', 'rainfall', 'dam')
+STAGES = ('fetch', 'decode', 'parse', 'dtype', 'merge', 'enrich', 'snapshot', 'write')
+
+# Counters recorded per dataset, with their Prometheus help text
+COUNTERS = {
+    'requests': 'API requests made',
+    'retries': 'API request retries, by the HTTP adapter or the retry loop',
+    'payload_bytes': 'Bytes of API response bodies',
+    'station_rows': 'Rows of the station table',
+    'data_rows': 'Rows of the data table',
+    'combined_rows': 'Rows of the combined table',
+    'unmatched_rows': 'Combined rows without a matching administrative area',
+    'files_written': 'Output files written',
+    'cache_hits': 'Output files skipped because their content was unchanged',
+    'write_failures': 'Output files that failed to write',
+}
+
+
+def dataset_of(name: str) -> str:
+    """
+    Maps a file or table name to the dataset it belongs to, e.g.
+    'combined_water_level_with_location.md' -> 'water_level'.
+    """
+    for dataset in DATASETS:
+        if dataset in name:
+            return dataset
+    return 'other'
+
+
+class PipelineMetrics:
+    """
+    Collects per-dataset stage timings and counters of one pipeline run.
+
+    Stages are timed with `stage(...)`, which adds up repeated entries (e.g.
+    one fetch per rainfall endpoint). Code that runs on behalf of a dataset
+    without naming it, such as the API client, uses the dataset set by the
+    enclosing `dataset(...)` block of the same thread. Output writes on the
+    thread pool pass the dataset explicitly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # StageProfiler (see utils.stage_profiler) that also profiles every stage, if any
+        self.profiler = None
+        self.reset()
+
+    def reset(self, run_id: str = None) -> None:
+        """Clears the metrics for a new run."""
+        with self._lock:
+            self.run_id = run_id
+            self.started_at = time.time()
+            self.finished_at = None
+            self.success = None
+            self.seconds = defaultdict(float)  # (dataset, stage) -> seconds
+            self.counters = defaultdict(int)  # (dataset, counter) -> value
+
+    @property
+    def current_dataset(self) -> str:
+        return getattr(self._local, 'dataset', None) or 'other'
+
+    @contextmanager
+    def dataset(self, name: str):
+        """Attributes the stages and counters of the block to a dataset."""
+        previous = getattr(self._local, 'dataset', None)
+        self._local.dataset = name
+        try:
+            yield
+        finally:
+            self._local.dataset = previous
+
+    @contextmanager
+    def stage(self, stage: str, dataset: str = None):
+        """Times a block as part of a stage; time spent in failed blocks counts too."""
+        dataset = dataset or self.current_dataset
+        profiling = self.profiler.profile(dataset, stage) if self.profiler is not None else nullcontext()
+        started_at = time.perf_counter()
+        try:
+            with profiling:
+                yield
+        finally:
+            self.observe(stage, time.perf_counter() - started_at, dataset)
+
+    def observe(self, stage: str, seconds: float, dataset: str = None) -> None:
+        """Adds time measured elsewhere to a stage."""
+        with self._lock:
+            self.seconds[dataset or self.current_dataset, stage] += seconds
+
+    def count(self, counter: str, value: int = 1, dataset: str = None) -> None:
+        """Adds to a counter."""
+        with self._lock:
+            self.counters[dataset or self.current_dataset, counter] += value
+
+    def finish(self, success: bool) -> None:
+        """Marks the run as finished."""
+        with self._lock:
+            self.finished_at = time.time()
+            self.success = success
+
+    def summary(self) -> Dict:
+        """
+        Returns the run's metrics as a JSON-serialisable dict.
+
+        :return: Dict with the run id, duration, success and, per dataset,
+            'stages' (seconds) and 'counters'
+        """
+        with self._lock:
+            finished_at = self.finished_at or time.time()
+            datasets = defaultdict(lambda: {'stages': {}, 'counters': {}})
+            for (dataset, stage), seconds in sorted(self.seconds.items()):
+                datasets[dataset]['stages'][stage] = round(seconds, 4)
+            for (dataset, counter), value in sorted(self.counters.items()):
+                datasets[dataset]['counters'][counter] = value
+            return {
+                'run_id': self.run_id,
+                'started_at': datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                'duration_seconds': round(finished_at - self.started_at, 3),
+                'success': self.success,
+                'stage_seconds': {
+                    stage: round(sum(s for (_, name), s in self.seconds.items() if name == stage), 4)
+                    for stage in STAGES
+                },
+                'datasets': dict(datasets),
+            }
+
+    def prometheus(self) -> str:
+        """
+        Formats the run's metrics in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        lines = [
+            f'# HELP {METRIC_PREFIX}_stage_seconds Seconds spent per dataset and stage in the last run',
+            f'# TYPE {METRIC_PREFIX}_stage_seconds gauge',
+        ]
+        for dataset, values in summary['datasets'].items():
+            for stage, seconds in values['stages'].items():
+                lines.append(f'{METRIC_PREFIX}_stage_seconds{{dataset="{dataset}",stage="{stage}"}} {seconds}')
+        for counter, help_text in COUNTERS.items():
+            samples = [(dataset, values['counters'][counter]) for dataset, values in summary['datasets'].items()
+                       if counter in values['counters']]
+            if not samples:
+                continue
+            lines.append(f'# HELP {METRIC_PREFIX}_{counter} {help_text} in the last run')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{counter} gauge')
+            lines.extend(f'{METRIC_PREFIX}_{counter}{{dataset="{dataset}"}} {value}' for dataset, value in samples)
+        lines += [
+            f'# HELP {METRIC_PREFIX}_duration_seconds Duration of the last run',
+            f'# TYPE {METRIC_PREFIX}_duration_seconds gauge',
+            f'{METRIC_PREFIX}_duration_seconds {summary["duration_seconds"]}',
+            f'# HELP {METRIC_PREFIX}_success Whether the last run completed',
+            f'# TYPE {METRIC_PREFIX}_success gauge',
+            f'{METRIC_PREFIX}_success {int(bool(summary["success"]))}',
+            f'# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Unix time the last run finished',
+            f'# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge',
+            f'{METRIC_PREFIX}_last_run_timestamp_seconds {round(self.finished_at or time.time(), 3)}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, metrics_dir: str = DEFAULT_METRICS_DIR) -> Dict[str, str]:
+        """
+        Writes the JSON summary of the run and the Prometheus textfile.
+
+        The summary goes to pipeline_<run_id>.json, so runs can be compared
+        over time. The textfile is replaced on every run, for the node
+        exporter's textfile collector.
+
+        :param metrics_dir: Directory of the metrics files
+        :return: Paths of the written files, by kind
+        """
+        os.makedirs(metrics_dir, exist_ok=True)
+        summary_path = os.path.join(metrics_dir, f'pipeline_{self.run_id or "run"}.json')
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+        # The collector reads every *.prom file, so the temporary file must not end in .prom
+        prometheus_path = os.path.join(metrics_dir, PROMETHEUS_FILENAME)
+        tmp_path = prometheus_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, prometheus_path)
+        return {'summary': summary_path, 'prometheus': prometheus_path}
+
+
+# Metrics of the current pipeline run, shared by the pipeline and its helpers
+metrics = PipelineMetrics()
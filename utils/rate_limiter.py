@@ -0,0 +1,104 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Hashable, Optional
+
+
+class FairRateLimiter:
+    """
+    Token bucket shared by every session of the process, with fair queueing.
+
+    Tokens refill continuously at `rate` per second up to `burst`. Waiting
+    requests are queued per session and served round-robin across sessions,
+    so one busy session cannot starve the others.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._queues: 'OrderedDict[Hashable, deque]' = OrderedDict()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _is_next(self, session_id: Hashable, ticket: object) -> bool:
+        first_session = next(iter(self._queues))
+        return first_session == session_id and self._queues[session_id][0] is ticket
+
+    def _remove(self, session_id: Hashable, ticket: object) -> None:
+        queue = self._queues[session_id]
+        queue.remove(ticket)
+        if queue:
+            # Serve the other sessions before this one's next request
+            self._queues.move_to_end(session_id)
+        else:
+            del self._queues[session_id]
+
+    def acquire(self, session_id: Hashable, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for a token on behalf of a session.
+
+        :param session_id: Identifies the requesting session
+        :param timeout: Maximum seconds to wait; None waits indefinitely
+        :return: True if a token was acquired, False on timeout
+        """
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            while True:
+                self._refill()
+                if self._is_next(session_id, ticket) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._remove(session_id, ticket)
+                    self._cond.notify_all()
+                    return True
+
+                wait = (1 - self._tokens) / self.rate if self._tokens < 1 else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(session_id, ticket)
+                        self._cond.notify_all()
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._cond.wait(wait)
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+
+class RateLimitTimeout(Exception):
+    """Raised when an API call waited too long for a rate-limiter token."""
+
+
+class RateLimitedClient:
+    """
+    Proxy of an API client that waits for a token before every call.
+
+    Attribute access is proxied down to the endpoint methods, so
+    `client.beta.threads.runs.retrieve(...)` takes one token, however many
+    calls a response makes. `acquire` returns False when the wait timed out,
+    which raises RateLimitTimeout instead of making the call.
+    """
+
+    def __init__(self, target, acquire: Callable[[], bool]):
+        self._target = target
+        self._acquire = acquire
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return RateLimitedClient(attr, self._acquire)
+
+        def call(*args, **kwargs):
+            if not self._acquire():
+                raise RateLimitTimeout(f"Timed out waiting for the rate limiter before {name}")
+            return attr(*args, **kwargs)
+        return call
@@ -0,0 +1,52 @@
+import time
+import streamlit as st
+from contextlib import contextmanager
+
+HISTORY_SIZE = 20  # reruns kept per session for the averages
+
+
+class RerunTimer:
+    """
+    Measures where a Streamlit rerun spends its time, section by section.
+
+    Create one at the top of the script, wrap its parts in `section(...)`
+    and call `render()` at the end. Timings of the last HISTORY_SIZE reruns
+    are kept in session state so the panel can show averages.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = time.perf_counter()
+        self.sections = {}
+
+    @contextmanager
+    def section(self, name: str):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + time.perf_counter() - started_at
+
+    def render(self) -> None:
+        """
+        Shows this rerun's breakdown and the averages of recent reruns in the sidebar.
+        """
+        if not self.enabled:
+            return
+        total = time.perf_counter() - self.started_at
+        timings = dict(self.sections, other=max(total - sum(self.sections.values()), 0.0), total=total)
+        history = st.session_state.setdefault('rerun_timings', [])
+        history.append(timings)
+        del history[:-HISTORY_SIZE]
+
+        rows = []
+        for name in timings:
+            values = [run[name] for run in history if name in run]
+            rows.append({
+                'section': name,
+                'this rerun (ms)': round(timings[name] * 1000, 2),
+                f'mean of last {len(values)} (ms)': round(sum(values) / len(values) * 1000, 2),
+                'max (ms)': round(max(values) * 1000, 2),
+            })
+        with st.sidebar.expander("Rerun timings", expanded=True):
+            st.dataframe(rows, hide_index=True)
@@ -0,0 +1,126 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_QUEUE = 64
+LATENCY_WINDOW = 200  # most recent jobs kept for latency percentiles
+
+
+class ResponseJob:
+    """
+    A response being generated on a background worker.
+
+    Holds the future of the result and the partial text streamed so far,
+    which the UI reads on every poll. Worker code must not call Streamlit
+    APIs: there is no script context on worker threads.
+    """
+
+    def __init__(self, key: Hashable, owner: Hashable = None):
+        self.key = key
+        self.owner = owner
+        self.text = ''
+        self.future: Optional[Future] = None
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def on_text(self, text: str) -> None:
+        self.text = text
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self) -> Any:
+        return self.future.result()
+
+
+class ResponseWorker:
+    """
+    Bounded pool of background threads that generate assistant responses.
+
+    Script threads submit a job and return immediately; the UI polls the job
+    until it is done. Jobs with the same key that are queued or running at
+    the same time are coalesced, so identical prompts from different sessions
+    share one run without tying up extra threads.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='response')
+        self._lock = threading.Lock()
+        self._jobs: Dict[Hashable, ResponseJob] = {}
+        self._queued = 0
+        self._running = 0
+        self._waits = deque(maxlen=LATENCY_WINDOW)
+        self._run_times = deque(maxlen=LATENCY_WINDOW)
+        self.counts = {'submitted': 0, 'coalesced': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+
+    def submit(self, key: Hashable, fn: Callable[[ResponseJob], Any], owner: Hashable = None) -> Optional[ResponseJob]:
+        """
+        Schedules fn(job) on the pool, or joins the in-flight job with the same key.
+
+        :param key: Identifies equivalent requests
+        :param fn: Function producing the result; receives the job to report partial text
+        :param owner: Identifies the submitting session; joiners can tell the job is not theirs
+        :return: The job, or None if the queue is full
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self.counts['coalesced'] += 1
+                return job
+            if self._queued >= self.max_queue:
+                self.counts['rejected'] += 1
+                logger.warning("Response queue full (%s waiting), rejecting request", self._queued)
+                return None
+            job = self._jobs[key] = ResponseJob(key, owner)
+            self._queued += 1
+            self.counts['submitted'] += 1
+            # Set the future before releasing the lock so joiners never see it unset
+            job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: ResponseJob, fn: Callable[[ResponseJob], Any]) -> Any:
+        job.started_at = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._waits.append(job.started_at - job.submitted_at)
+        failed = True
+        try:
+            result = fn(job)
+            failed = False
+            return result
+        finally:
+            job.finished_at = time.perf_counter()
+            with self._lock:
+                self._running -= 1
+                self._run_times.append(job.finished_at - job.started_at)
+                self.counts['failed' if failed else 'completed'] += 1
+                del self._jobs[job.key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns queue depth, concurrency and latency percentiles of recent jobs.
+        """
+        with self._lock:
+            waits = np.array(self._waits)
+            run_times = np.array(self._run_times)
+            stats = dict(self.counts, queued=self._queued, running=self._running, max_workers=self.max_workers)
+        for name, values in (('queue_wait', waits), ('run_time', run_times)):
+            if len(values):
+                stats[f'{name}_p50'] = round(float(np.percentile(values, 50)), 3)
+                stats[f'{name}_p95'] = round(float(np.percentile(values, 95)), 3)
+        return stats
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
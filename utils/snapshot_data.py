@@ -0,0 +1,38 @@
+import os
+import streamlit as st
+from typing import Dict
+from utils.data_tools import load_combined
+from utils.output_manager import SNAPSHOT_FILENAME, read_snapshot
+from utils.station_cards import CARD_SPECS
+
+DEFAULT_OUTPUT_DIR = './output'
+
+
+def current_snapshot_id(output_dir: str = DEFAULT_OUTPUT_DIR) -> str:
+    """
+    Returns the id of the latest published data snapshot.
+
+    Falls back to the modification time of the descriptor, or '' when the
+    pipeline has not published a snapshot yet.
+    """
+    snapshot = read_snapshot(output_dir)
+    if snapshot.get('snapshot_id'):
+        return snapshot['snapshot_id']
+    try:
+        return str(os.stat(os.path.join(output_dir, SNAPSHOT_FILENAME)).st_mtime_ns)
+    except OSError:
+        return ''
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading the latest data snapshot...")
+def snapshot_frames(snapshot_id: str, output_dir: str = DEFAULT_OUTPUT_DIR) -> Dict:
+    """
+    Loads the combined outputs once per snapshot, shared by all pages and sessions.
+
+    Callers must treat the DataFrames as read-only.
+
+    :param snapshot_id: Snapshot the frames belong to; a new id reloads them
+    :param output_dir: Output directory of the pipeline
+    :return: Combined dataset name -> DataFrame, or None where missing
+    """
+    return {dataset: load_combined(output_dir, dataset) for dataset in CARD_SPECS}
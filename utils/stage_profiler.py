@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+DEFAULT_PROFILE_DIR = './profiles'
+SAMPLE_INTERVAL = 0.005  # seconds between stack samples for the flame graphs
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 15
+TOP_FUNCTIONS = 25
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StageProfiler:
+    """
+    Profiles pipeline stages with cProfile, tracemalloc and a stack sampler.
+
+    PipelineMetrics.stage() enters `profile(dataset, stage)` when a profiler
+    is attached, so every timed stage is profiled without further changes.
+    Per stage, `write()` produces:
+
+    - <dataset>.<stage>.prof: cProfile statistics, for pstats or snakeviz
+    - <dataset>.<stage>.folded: sampled stacks in the collapsed format read
+      by flamegraph.pl, speedscope and inferno
+    - summary.json: CPU time, peak traced memory, the top allocation sites
+      and the hottest functions of every stage
+
+    Only top-level stages on the main thread are run under cProfile and get
+    memory snapshots: snapshots are expensive, and tracemalloc's peak is
+    process-wide, so concurrent stages would reset each other's. Stages on
+    other threads, such as the output writes, are only sampled for the flame
+    graphs. Memory is still traced process-wide, so a main-thread stage's peak
+    and allocations include whatever other threads allocated while it ran.
+    """
+
+    def __init__(self, profile_dir: str, sample_interval: float = SAMPLE_INTERVAL):
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles: Dict[Tuple[str, str], list] = defaultdict(list)
+        self._peaks: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._allocations: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        self._samples: Dict[Tuple[str, str], Counter] = defaultdict(Counter)
+        self._active: Dict[int, Tuple[str, str]] = {}  # thread id -> stage being profiled
+        self._stopped = threading.Event()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._sampler = threading.Thread(target=self._sample, name='stage-sampler', daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def profile(self, dataset: str, stage: str):
+        """Profiles a block as part of a stage; nested stages count towards the outer one."""
+        if getattr(self._local, 'active', False):
+            yield
+            return
+        key = (dataset, stage)
+        self._local.active = True
+        with self._lock:
+            self._active[threading.get_ident()] = key
+        if threading.current_thread() is not threading.main_thread():
+            try:
+                yield
+            finally:
+                with self._lock:
+                    self._active.pop(threading.get_ident(), None)
+                self._local.active = False
+            return
+
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._active.pop(threading.get_ident(), None)
+            self._local.active = False
+            peak = tracemalloc.get_traced_memory()[1]
+            growth = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+            with self._lock:
+                self._profiles[key].append(profile)
+                self._peaks[key] = max(self._peaks[key], peak)
+                for stat in growth:
+                    if stat.size_diff > 0:
+                        self._allocations[key][str(stat.traceback[0])] += stat.size_diff
+
+    def _sample(self) -> None:
+        """Records the stack of every thread that is inside a profiled stage."""
+        while not self._stopped.wait(self.sample_interval):
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, key in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    with self._lock:
+                        self._samples[key][';'.join(reversed(stack))] += 1
+
+    def close(self) -> None:
+        """Stops the sampler and memory tracing."""
+        self._stopped.set()
+        self._sampler.join()
+        tracemalloc.stop()
+
+    def write(self) -> str:
+        """
+        Writes the per-stage profiles and the summary.
+
+        :return: Path of summary.json
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        summary = {}
+        with self._lock:
+            for key in sorted(set(self._profiles) | set(self._samples)):
+                name = '.'.join(key)
+                stats = pstats.Stats(*self._profiles[key]) if self._profiles[key] else None
+                if stats is not None:
+                    stats.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+                with open(os.path.join(self.profile_dir, f'{name}.folded'), 'w', encoding='utf-8') as f:
+                    for stack, count in sorted(self._samples[key].items()):
+                        f.write(f'{stack} {count}\n')
+
+                functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS] if stats else []
+                summary[name] = {
+                    'cpu_profiled_entries': len(self._profiles[key]),
+                    'cpu_seconds': round(stats.total_tt, 4) if stats else None,
+                    'peak_traced_bytes': self._peaks.get(key),
+                    'samples': sum(self._samples[key].values()),
+                    'top_allocations': [
+                        {'site': site, 'bytes': size} for site, size in self._allocations[key].most_common(TOP_ALLOCATIONS)
+                    ],
+                    'top_functions': [
+                        {'function': f'{func} ({os.path.basename(filename)}:{line})', 'calls': calls,
+                         'own_seconds': round(own, 4), 'cumulative_seconds': round(cumulative, 4)}
+                        for (filename, line, func), (_, calls, own, cumulative, _) in functions
+                    ],
+                }
+        path = os.path.join(self.profile_dir, 'summary.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+        return path
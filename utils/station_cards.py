@@ -0,0 +1,242 @@
+import math
+import logging
+import numpy as np
+import pandas as pd
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough token estimate: GPT tokenizers average about 4 UTF-8 bytes per token
+# for English and Thai alike (Thai characters are 3 bytes each).
+BYTES_PER_TOKEN = 4
+DEFAULT_TARGET_TOKENS = 2000
+
+# Card layout per combined dataset: heading columns, then (label, column, kind)
+# fields where kind is 'text' or 'number'. Missing columns and empty values
+# are dropped from the card.
+CARD_SPECS = {
+    'combined_water_level': {
+        'title': 'Water level stations',
+        'heading': ['name', 'id'],
+        'fields': [
+            ('Basin', 'basin_name', 'text'),
+            ('Agency', 'agency_name', 'text'),
+            ('Observed', 'datetime', 'text'),
+            ('Water level (m)', 'waterlevel_m', 'number'),
+            ('Water level (m MSL)', 'waterlevel_msl', 'number'),
+            ('Previous (m MSL)', 'waterlevel_msl_previous', 'number'),
+            ('Warning level (m)', 'warning_level_m', 'number'),
+            ('Critical level (m)', 'critical_level_m', 'number'),
+            ('Critical level (m MSL)', 'critical_level_msl', 'number'),
+            ('Discharge', 'discharge', 'number'),
+            ('Storage (%)', 'storage_percent', 'number'),
+            ('Situation level', 'situation_level', 'number'),
+        ],
+    },
+    'combined_water_gate': {
+        'title': 'Water gate stations',
+        'heading': ['name', 'id'],
+        'fields': [
+            ('Basin', 'basin_name', 'text'),
+            ('Agency', 'agency_name', 'text'),
+            ('Upstream level', 'watergate_in', 'number'),
+            ('Upstream observed', 'watergate_datetime_in', 'text'),
+            ('Downstream level', 'watergate_out', 'number'),
+            ('Downstream observed', 'watergate_datetime_out', 'text'),
+            ('Pumps on', 'pump_on', 'number'),
+            ('Pumps', 'pump', 'number'),
+            ('Floodgates open', 'floodgate_open', 'number'),
+            ('Floodgates', 'floodgate', 'number'),
+            ('Floodgate height', 'floodgate_height', 'number'),
+            ('Warning level (m)', 'warning_level_m', 'number'),
+            ('Critical level (m)', 'critical_level_m', 'number'),
+        ],
+    },
+    'combined_rainfall': {
+        'title': 'Rainfall stations',
+        'heading': ['name', 'id'],
+        'fields': [
+            ('Basin', 'basin_name', 'text'),
+            ('Agency', 'agency_name', 'text'),
+            ('Rain 24h (mm)', 'rain_24h_value', 'number'),
+            ('Rain 24h observed', 'rain_24h_datetime', 'text'),
+            ('Rain today (mm)', 'rain_daily_value', 'number'),
+            ('Rain yesterday (mm)', 'rain_yesterday_value', 'number'),
+            ('Rain 3 days (mm)', 'rain_3days_value', 'number'),
+            ('Rain 7 days (mm)', 'rain_7days_value', 'number'),
+            ('Rain this month (mm)', 'rain_monthly_value', 'number'),
+            ('Rain this year (mm)', 'rain_yearly_value', 'number'),
+        ],
+    },
+    'combined_dam': {
+        'title': 'Dams',
+        'heading': ['name', 'type'],
+        'fields': [
+            ('Type', 'station_type', 'text'),
+            ('Basin', 'basin', 'text'),
+            ('Agency', 'agency', 'text'),
+            ('Observed', 'datetime', 'text'),
+            ('Storage (mcm)', 'storage', 'number'),
+            ('Storage (%)', 'storage_percent', 'number'),
+            ('Max storage (mcm)', 'max_storage', 'number'),
+            ('Normal storage (mcm)', 'normal_storage', 'number'),
+            ('Min storage (mcm)', 'min_storage', 'number'),
+            ('Inflow', 'inflow', 'number'),
+            ('Released', 'released', 'number'),
+            ('Usable water', 'uses_water', 'number'),
+            ('Level', 'level', 'number'),
+        ],
+    },
+}
+
+LOCATION_COLUMNS = ['tambon', 'amphur', 'province']
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Converts a column to strings, with NaN for missing or blank values."""
+    text = series.astype(str).str.strip()
+    return text.where(series.notna() & text.ne('') & text.ne('None') & text.ne('nan'))
+
+
+def _number(series: pd.Series) -> pd.Series:
+    """Formats a numeric column compactly, with NaN for missing values."""
+    values = pd.to_numeric(series, errors='coerce')
+    text = values.round(2).astype(str).str.replace(r'\.0$', '', regex=True)
+    return text.where(values.notna())
+
+
+def _join(parts: List[pd.Series], sep: str, index: pd.Index) -> pd.Series:
+    """
+    Joins string Series element-wise, skipping missing parts.
+
+    :param parts: Series of strings, NaN where a part is missing
+    :param sep: Separator placed between present parts
+    :param index: Index of the result
+    :return: Joined strings ('' where every part is missing)
+    """
+    out = pd.Series('', index=index, dtype=object)
+    for part in parts:
+        present = part.notna()
+        glue = np.where(out.ne('') & present, sep, '')
+        out = out + glue + part.fillna('')
+    return out
+
+
+def station_status(df: pd.DataFrame, dataset: str) -> pd.Series:
+    """
+    Classifies the latest reading of every row against its thresholds.
+
+    :param df: Combined DataFrame
+    :param dataset: Combined dataset name, a key of CARD_SPECS
+    :return: Status labels, NaN where no classification applies
+    """
+    def col(name):
+        return pd.to_numeric(df[name], errors='coerce') if name in df.columns else pd.Series(np.nan, index=df.index)
+
+    if dataset == 'combined_water_level':
+        msl, level = col('waterlevel_msl'), col('waterlevel_m')
+        conditions = [
+            msl >= col('critical_level_msl'),
+            level >= col('critical_level_m'),
+            level >= col('warning_level_m'),
+            msl.notna() | level.notna(),
+        ]
+        choices = ['critical', 'critical', 'warning', 'normal']
+    elif dataset == 'combined_dam':
+        percent = col('storage_percent')
+        conditions = [percent >= 100, percent >= 80, percent <= 30, percent.notna()]
+        choices = ['over capacity', 'high', 'low', 'normal']
+    elif dataset == 'combined_rainfall':
+        # Thai Meteorological Department 24-hour rainfall intensity scale
+        rain = col('rain_24h_value')
+        conditions = [rain > 90, rain > 35, rain > 10, rain > 0, rain == 0]
+        choices = ['very heavy rain', 'heavy rain', 'moderate rain', 'light rain', 'no rain']
+    else:
+        return pd.Series(np.nan, index=df.index, dtype=object)
+
+    status = np.select(conditions, choices, default='')
+    return pd.Series(status, index=df.index).replace('', np.nan)
+
+
+def build_station_cards(df: pd.DataFrame, dataset: str) -> pd.Series:
+    """
+    Builds one compact text card per row, vectorized across the DataFrame.
+
+    :param df: Combined DataFrame, usually with location columns added
+    :param dataset: Combined dataset name, a key of CARD_SPECS
+    :return: Card text per row
+    """
+    spec = CARD_SPECS[dataset]
+    index = df.index
+
+    name_col, key_col = spec['heading']
+    heading = '### ' + (_text(df[name_col]).fillna('(unnamed)') if name_col in df.columns else '(unnamed)')
+    if key_col in df.columns:
+        key = _text(df[key_col])
+        heading = heading + np.where(key.notna(), ' (' + key.fillna('') + ')', '')
+
+    location = _join([_text(df[col]) for col in LOCATION_COLUMNS if col in df.columns], ', ', index)
+    fields = [('Location: ' + location).where(location.ne(''))]
+    for label, column, kind in spec['fields']:
+        if column not in df.columns:
+            continue
+        values = _number(df[column]) if kind == 'number' else _text(df[column])
+        fields.append(label + ': ' + values)
+    fields.append('Status: ' + station_status(df, dataset))
+
+    return heading + '\n' + _join(fields, '; ', index) + '\n'
+
+
+def estimate_tokens(text: pd.Series) -> pd.Series:
+    """Estimates the token count of each string."""
+    return np.ceil(text.str.encode('utf-8').str.len() / BYTES_PER_TOKEN).astype(int)
+
+
+def pack_cards(df: pd.DataFrame, dataset: str, target_tokens: int = DEFAULT_TARGET_TOKENS) -> List[str]:
+    """
+    Packs station cards into documents of roughly target_tokens each.
+
+    Cards are ordered by province and station name so each document covers a
+    coherent area. A card is never split; a document may exceed the target by
+    at most one card.
+
+    :param df: Combined DataFrame
+    :param dataset: Combined dataset name, a key of CARD_SPECS
+    :param target_tokens: Target size of each document
+    :return: Document texts
+    """
+    if df.empty:
+        return []
+    sort_columns = [col for col in ['province', 'name'] if col in df.columns]
+    ordered = df.sort_values(sort_columns, kind='stable') if sort_columns else df
+    cards = build_station_cards(ordered, dataset).reset_index(drop=True)
+
+    tokens = estimate_tokens(cards)
+    doc_index = (tokens.cumsum() - tokens) // target_tokens
+    documents = cards.groupby(doc_index, sort=True).agg('\n'.join).tolist()
+
+    # No generation timestamp: unchanged readings give byte-identical
+    # documents, which the output manager then skips rewriting
+    title = CARD_SPECS[dataset]['title']
+    total = len(documents)
+    return [f"# {title} (part {i} of {total})\n\n{body}" for i, body in enumerate(documents, start=1)]
+
+
+def card_filenames(dataset: str, count: int) -> List[str]:
+    """Returns the file names of a dataset's card documents."""
+    width = max(3, int(math.log10(max(count, 1))) + 1)
+    return [f"cards/{dataset}_cards_{i:0{width}d}.md" for i in range(1, count + 1)]
+
+
+def station_card_documents(df: pd.DataFrame, dataset: str, target_tokens: int = DEFAULT_TARGET_TOKENS) -> List[Tuple[str, str]]:
+    """
+    Builds the card documents of a dataset with their output file names.
+
+    :param df: Combined DataFrame
+    :param dataset: Combined dataset name, a key of CARD_SPECS
+    :param target_tokens: Target size of each document
+    :return: (file name relative to the output directory, document text) pairs
+    """
+    documents = pack_cards(df, dataset, target_tokens)
+    logger.info("Built %s station cards for %s in %s documents", len(df), dataset, len(documents))
+    return list(zip(card_filenames(dataset, len(documents)), documents))
@@ -1,5 +1,12 @@
 import os
+import json
+import time
+import random
+import hashlib
+import argparse
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -12,20 +19,64 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 VECTOR_STORE_ID = "vs_I09vB9pr80qOUB7W5LIRBeIo"  # Replace with your actual vector store ID
 UPLOAD_URL = "https://api.openai.com/v1/files"
 BATCH_URL = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/file_batches"
+VECTOR_STORE_FILES_URL = f"https://api.openai.com/v1/vector_stores/{VECTOR_STORE_ID}/files"
+MANIFEST_FILENAME = ".vector_store_manifest.json"
 HEADERS = {
     "Authorization": f"Bearer {openai_api_key}",
     "Content-Type": "application/json",
     "OpenAI-Beta": "assistants=v2"
 }
+MAX_PARALLEL_REQUESTS = int(os.getenv('VECTOR_STORE_MAX_PARALLEL', '4'))
+MAX_RETRIES = 5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+BATCH_POLL_TIMEOUT = 900  # seconds
+
+# Shared connection pool for all (possibly concurrent) API calls
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+def request_with_retries(method, url, max_retries=MAX_RETRIES, **kwargs):
+    """
+    Send an API request, retrying rate-limited (429) and server errors with backoff.
+
+    Honours the Retry-After header when present, otherwise backs off exponentially
+    with jitter. Returns the last response; connection errors are re-raised once
+    the retries are exhausted.
+    """
+    for attempt in range(1, max_retries + 1):
+        try:
+            response = session.request(method, url, timeout=60, **kwargs)
+        except requests.ConnectionError:
+            if attempt == max_retries:
+                raise
+            time.sleep(2 ** (attempt - 1) + random.uniform(0, 1))
+            continue
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+            return response
+        retry_after = response.headers.get("Retry-After")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = 2 ** (attempt - 1) + random.uniform(0, 1)
+        print(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt}/{max_retries})")
+        time.sleep(delay)
+    return response
+
+def run_concurrently(fn, items, max_workers=MAX_PARALLEL_REQUESTS):
+    """Apply fn to every item on a bounded thread pool, returning results in input order."""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        return list(executor.map(fn, items))
 
 def list_files(purpose=None):
-    """List files in the OpenAI API."""
+    """List files in the OpenAI API, or return None if they could not be listed."""
     try:
         url = "https://api.openai.com/v1/files"
         if purpose:
             url += f"?purpose={purpose}"
         
-        response = requests.get(url, headers=HEADERS)
+        response = request_with_retries("GET", url, headers=HEADERS)
         response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
 
         files = response.json()["data"]
@@ -33,55 +84,86 @@ def list_files(purpose=None):
 
     except Exception as e:
         print(f"An error occurred while listing the files: {str(e)}")
-        return []
+        return None
 
 def delete_file(file_id):
     """Delete a file from the OpenAI API."""
     try:
         url = f"https://api.openai.com/v1/files/{file_id}"
-        response = requests.delete(url, headers=HEADERS)
+        response = request_with_retries("DELETE", url, headers=HEADERS)
         response.raise_for_status()
 
         # Check if the deletion was successful
         if response.json().get("deleted", False):
             print(f"File with ID {file_id} was successfully deleted.")
-        else:
-            print(f"Failed to delete the file with ID {file_id}.")
+            return True
+        print(f"Failed to delete the file with ID {file_id}.")
+        return False
 
     except Exception as e:
         print(f"An error occurred while trying to delete the file: {str(e)}")
+        return False
+
+def delete_files(file_ids, max_workers=MAX_PARALLEL_REQUESTS):
+    """Delete files concurrently, at most max_workers at a time."""
+    return run_concurrently(delete_file, list(file_ids), max_workers)
+
+def detach_file_from_vector_store(file_id):
+    """Remove a file from the vector store without deleting the file itself."""
+    try:
+        response = request_with_retries("DELETE", f"{VECTOR_STORE_FILES_URL}/{file_id}", headers=HEADERS)
+        if response.status_code == 404:
+            # Already detached (or never attached); nothing to do
+            return True
+        response.raise_for_status()
+        return response.json().get("deleted", False)
+    except Exception as e:
+        print(f"An error occurred while detaching file {file_id} from the vector store: {str(e)}")
+        return False
+
+def get_docs_dir():
+    """Get the path of the 'docs' directory."""
+    return os.path.join(os.getcwd(), 'docs')
 
 def get_markdown_files_from_docs():
     """Get all markdown files from the 'docs' directory."""
-    docs_dir = os.path.join(os.getcwd(), 'docs')
+    docs_dir = get_docs_dir()
     file_paths = [os.path.join(docs_dir, f) for f in os.listdir(docs_dir) if f.endswith('.md')]
     return file_paths
 
-def upload_files_to_openai(file_paths):
-    """Upload markdown files to OpenAI API."""
-    file_ids = []
-    for file_path in file_paths:
-        filename = os.path.basename(file_path)  # Extract just the filename
-        with open(file_path, 'rb') as f:
-            response = requests.post(
-                UPLOAD_URL,
-                headers={
-                    "Authorization": f"Bearer {openai_api_key}",
-                },
-                files={
-                    'file': (filename, f, 'text/markdown')
-                },
-                data={
-                    'purpose': 'user_data'  # Change this if another purpose fits better
-                }
-            )
-            if response.status_code == 200:
-                file_id = response.json()['id']
-                file_ids.append(file_id)
-                print(f"Uploaded {filename} successfully, file_id: {file_id}")
-            else:
-                print(f"Failed to upload {filename}: {response.text}")
-    return file_ids
+def upload_file(file_path):
+    """Upload a single markdown file to OpenAI API and return its file id, or None on failure."""
+    filename = os.path.basename(file_path)  # Extract just the filename
+    # Read the content up front so that a retried request can resend it
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    try:
+        response = request_with_retries(
+            "POST",
+            UPLOAD_URL,
+            headers={
+                "Authorization": f"Bearer {openai_api_key}",
+            },
+            files={
+                'file': (filename, content, 'text/markdown')
+            },
+            data={
+                'purpose': 'user_data'  # Change this if another purpose fits better
+            }
+        )
+    except Exception as e:
+        print(f"Failed to upload {filename}: {str(e)}")
+        return None
+    if response.status_code == 200:
+        file_id = response.json()['id']
+        print(f"Uploaded {filename} successfully, file_id: {file_id}")
+        return file_id
+    print(f"Failed to upload {filename}: {response.text}")
+    return None
+
+def upload_files_to_openai(file_paths, max_workers=MAX_PARALLEL_REQUESTS):
+    """Upload markdown files to OpenAI API concurrently, at most max_workers at a time."""
+    return [file_id for file_id in run_concurrently(upload_file, list(file_paths), max_workers) if file_id]
 
 def create_vector_store_file_batch(file_ids):
     """Create a vector store file batch with the uploaded files."""
@@ -89,36 +171,211 @@ def create_vector_store_file_batch(file_ids):
         "file_ids": file_ids,
         # Optional: "chunking_strategy": {"type": "auto"}
     }
-    response = requests.post(
-        BATCH_URL,
-        headers=HEADERS,
-        json=data
-    )
+    try:
+        response = request_with_retries(
+            "POST",
+            BATCH_URL,
+            headers=HEADERS,
+            json=data
+        )
+    except Exception as e:
+        print(f"Failed to create vector store file batch: {str(e)}")
+        return None
     if response.status_code == 200:
         batch_id = response.json()['id']
         print(f"Vector store file batch created successfully, batch_id: {batch_id}")
-    else:
-        print(f"Failed to create vector store file batch: {response.text}")
+        return batch_id
+    print(f"Failed to create vector store file batch: {response.text}")
+    return None
 
-def main():
+def wait_for_file_batch(batch_id, timeout=BATCH_POLL_TIMEOUT, initial_delay=1.0, max_delay=15.0):
+    """
+    Poll a vector store file batch until indexing has finished.
+
+    The polling interval grows by half after every check, from initial_delay up to
+    max_delay. Returns the final batch object, or None on timeout or error.
+    """
+    deadline = time.time() + timeout
+    delay = initial_delay
+    while True:
+        try:
+            response = request_with_retries("GET", f"{BATCH_URL}/{batch_id}", headers=HEADERS)
+            response.raise_for_status()
+            batch = response.json()
+        except Exception as e:
+            print(f"An error occurred while polling file batch {batch_id}: {str(e)}")
+            return None
+        status = batch.get("status")
+        if status != "in_progress":
+            print(f"File batch {batch_id} {status}: {batch.get('file_counts')}")
+            return batch
+        if time.time() + delay > deadline:
+            print(f"Timed out after {timeout}s waiting for file batch {batch_id}: {batch.get('file_counts')}")
+            return None
+        time.sleep(delay)
+        delay = min(delay * 1.5, max_delay)
+
+def report_latency(batch, file_paths, started_at):
+    """Print how long the uploaded data took to become searchable."""
+    if not batch or batch.get("status") != "completed":
+        return
+    searchable_at = time.time()
+    print(f"Upload-to-searchable latency: {searchable_at - started_at:.1f}s")
+    if file_paths:
+        data_written_at = max(os.path.getmtime(path) for path in file_paths)
+        print(f"Data-to-searchable latency: {searchable_at - data_written_at:.1f}s")
+
+def attach_files(file_ids, file_paths, started_at, max_workers=MAX_PARALLEL_REQUESTS):
+    """
+    Attach uploaded files to the vector store in one batch and wait until they are indexed.
+
+    Returns True only if the batch completed without failed files. Otherwise the
+    uploaded files are detached and deleted again, so a later sync can retry them
+    without leaving duplicates behind.
+    """
+    batch_id = create_vector_store_file_batch(file_ids)
+    batch = wait_for_file_batch(batch_id) if batch_id else None
+    if batch and batch.get("status") == "completed" and not batch.get("file_counts", {}).get("failed"):
+        report_latency(batch, file_paths, started_at)
+        return True
+    print(f"Vector store file batch did not complete; removing the {len(file_ids)} uploaded files.")
+    run_concurrently(detach_file_from_vector_store, file_ids, max_workers)
+    delete_files(file_ids, max_workers)
+    return False
+
+def file_sha256(file_path):
+    """Compute the SHA-256 hash of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """Load the local manifest of filename -> {sha256, file_id}."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest_path, manifest):
+    """Save the manifest atomically so an interrupted sync never corrupts it."""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+def plan_sync(manifest, file_paths, remote_file_ids):
+    """
+    Compare local documents with the manifest.
+
+    Returns (to_upload, to_remove): (path, sha256) pairs for documents that are new
+    or changed (or whose remote file disappeared), and the manifest filenames that
+    no longer exist locally.
+    """
+    local = {os.path.basename(path): path for path in file_paths}
+    to_upload = []
+    for filename, path in sorted(local.items()):
+        sha256 = file_sha256(path)
+        entry = manifest.get(filename)
+        if (entry is None
+                or entry.get('sha256') != sha256
+                or entry.get('file_id') not in remote_file_ids):
+            to_upload.append((path, sha256))
+    to_remove = sorted(filename for filename in manifest if filename not in local)
+    return to_upload, to_remove
+
+def sync(max_workers=MAX_PARALLEL_REQUESTS):
+    """Upload only new or changed documents and remove only deleted ones."""
+    started_at = time.time()
+    docs_dir = get_docs_dir()
+    manifest_path = os.path.join(docs_dir, MANIFEST_FILENAME)
+    manifest = load_manifest(manifest_path)
+    remote_files = list_files(purpose='user_data')
+    if remote_files is None:
+        # Without the remote listing every document would look missing and be uploaded again
+        print("Sync aborted: could not list the remote files.")
+        return
+    remote_file_ids = {file['id'] for file in remote_files}
+
+    to_upload, to_remove = plan_sync(manifest, get_markdown_files_from_docs(), remote_file_ids)
+    unchanged = len(manifest) - len(to_remove) - sum(os.path.basename(path) in manifest for path, _ in to_upload)
+    print(f"Sync plan: {len(to_upload)} to upload, {len(to_remove)} to remove, {unchanged} unchanged.")
+
+    # Upload and attach new versions first so the assistant never sees an empty store
+    new_entries = {}
+    file_ids = run_concurrently(upload_file, [path for path, _ in to_upload], max_workers)
+    for (path, sha256), file_id in zip(to_upload, file_ids):
+        if file_id:
+            new_entries[os.path.basename(path)] = {'sha256': sha256, 'file_id': file_id}
+    new_file_ids = [entry['file_id'] for entry in new_entries.values()]
+    if new_file_ids and not attach_files(new_file_ids, [path for path, _ in to_upload], started_at, max_workers):
+        # Keep the old versions and the manifest, so the next sync retries the changes
+        print("Sync aborted: the new documents could not be attached to the vector store.")
+        return
+
+    # Retire replaced and removed files
+    stale_file_ids = [manifest[filename]['file_id'] for filename in new_entries if filename in manifest]
+    stale_file_ids += [manifest[filename]['file_id'] for filename in to_remove]
+    stale_file_ids = [file_id for file_id in stale_file_ids if file_id in remote_file_ids]
+    run_concurrently(detach_file_from_vector_store, stale_file_ids, max_workers)
+    delete_files(stale_file_ids, max_workers)
+
+    for filename in to_remove:
+        del manifest[filename]
+    manifest.update(new_entries)
+    save_manifest(manifest_path, manifest)
+
+def full_refresh(max_workers=MAX_PARALLEL_REQUESTS):
+    started_at = time.time()
     # Step 1: List and delete existing files in the vector store
     print("Listing and deleting existing files...")
     files = list_files(purpose='user_data')  # Adjust purpose if necessary
+    if files is None:
+        # Re-uploading without deleting the old files would duplicate every document
+        print("Full refresh aborted: could not list the existing files.")
+        return
 
     for file in files:
         print(f"Deleting file: {file['filename']} (ID: {file['id']})")
-        delete_file(file['id'])
+    delete_files([file['id'] for file in files], max_workers)
 
     # Step 2: Get markdown files from the 'docs' directory
     print("Uploading new files to the vector store...")
     file_paths = get_markdown_files_from_docs()
 
-    # Step 3: Upload new files to OpenAI
-    file_ids = upload_files_to_openai(file_paths)
+    # Step 3: Upload new files to OpenAI, recording them in a fresh manifest
+    manifest = {}
+    for file_path, file_id in zip(file_paths, run_concurrently(upload_file, file_paths, max_workers)):
+        if file_id:
+            manifest[os.path.basename(file_path)] = {'sha256': file_sha256(file_path), 'file_id': file_id}
+    file_ids = [entry['file_id'] for entry in manifest.values()]
 
-    # Step 4: Create a vector store file batch
-    if file_ids:
-        create_vector_store_file_batch(file_ids)
+    # Step 4: Create a vector store file batch and wait until it is searchable;
+    # an empty manifest makes the next sync upload everything again
+    if file_ids and not attach_files(file_ids, file_paths, started_at, max_workers):
+        manifest = {}
+    save_manifest(os.path.join(get_docs_dir(), MANIFEST_FILENAME), manifest)
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload the Markdown files in 'docs' to the vector store.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Delete every user_data file and re-upload all documents instead of syncing changes"
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=MAX_PARALLEL_REQUESTS,
+        help="Maximum number of concurrent upload/delete requests"
+    )
+    args = parser.parse_args()
+    if args.full:
+        full_refresh(args.parallel)
+    else:
+        sync(args.parallel)
 
 if __name__ == "__main__":
     main()